@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+
+class AssetRegistry:
+    """Process-wide symbol <-> id <-> asset map backed by ``db.assets``.
+
+    The registry is loaded once at startup and kept current through a
+    version stamp: every asset write bumps ``db.counters["assets"]`` and tags
+    the written documents with the new ``registry_version``. A writer lists
+    itself in the counter's ``pending`` until its documents land, and the
+    last one out raises ``settled`` to the version; a refresh only fetches
+    documents newer than the settled version already held. Writes made
+    through this process are applied to memory immediately. Writes upsert by
+    symbol, so even without the unique index (which legacy duplicate rows can
+    block) no new duplicates are created; of legacy duplicates the oldest row
+    wins, however it was read.
+    """
+
+    def __init__(self, db, refresh_interval: float = 5.0, write_timeout: float = 60.0):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        # A write still pending after this long is taken to have died with its worker
+        self.write_timeout = write_timeout
+        self.version = 0
+        self._by_symbol: Dict[str, dict] = {}
+        self._by_id: Dict[str, dict] = {}
+        self._aliases: Dict[str, List[str]] = {}
+        # (created_at, _id) of the row each symbol resolves to
+        self._winners: Dict[str, Tuple[datetime, str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._lock:
+            # Read first: every version up to settled has landed before the scan below
+            stamp = await self.db.counters.find_one({"_id": "assets"})
+            self._by_symbol.clear()
+            self._by_id.clear()
+            self._aliases.clear()
+            self._winners.clear()
+            async for asset in self.db.assets.find().sort("created_at", ASCENDING):
+                self._index(asset)
+            self.version = _settled(stamp)
+        logger.info("Asset registry loaded %d assets at version %d", len(self._by_symbol), self.version)
+
+    async def refresh(self):
+        """Apply assets written by other workers since the version we hold."""
+        stamp = await self.db.counters.find_one({"_id": "assets"})
+        cutoff = datetime.utcnow() - timedelta(seconds=self.write_timeout)
+        if stamp and any(write["at"] < cutoff for write in stamp.get("pending", [])):
+            logger.warning("Dropping asset registry writes pending since before %s", cutoff)
+            await self._settle({"at": {"$lt": cutoff}})
+            stamp = await self.db.counters.find_one({"_id": "assets"})
+        settled = _settled(stamp)
+        if settled <= self.version:
+            return
+        async with self._lock:
+            async for asset in self.db.assets.find({"registry_version": {"$gt": self.version}}):
+                self._index(asset)
+            self.version = max(self.version, settled)
+
+    async def _settle(self, writes: dict):
+        """Drop ``writes`` from the pending list; with none left, every reserved version has landed."""
+        stamp = await self.db.counters.find_one_and_update(
+            {"_id": "assets"},
+            {"$pull": {"pending": writes}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if stamp and not stamp.get("pending"):
+            # Skipped if another writer reserved meanwhile; it settles when it lands
+            await self.db.counters.update_one(
+                {"_id": "assets", "pending": {"$size": 0}},
+                {"$max": {"settled": stamp["version"]}},
+            )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Asset registry refresh failed")
+
+    def by_symbol(self, symbol: str) -> Optional[dict]:
+        return self._by_symbol.get(symbol)
+
+    def by_id(self, asset_id: str) -> Optional[dict]:
+        """Look up by ``Asset.id`` or by the stringified Mongo ``_id`` older rows reference."""
+        return self._by_id.get(asset_id)
+
+    def ids_for(self, symbol: str) -> List[str]:
+        """Every id that rows referencing ``symbol`` may hold, for ``asset_id`` filters."""
+        return list(self._aliases.get(symbol, []))
+
+    def by_symbols(self, symbols: Iterable[str]) -> Dict[str, dict]:
+        return {symbol: self._by_symbol[symbol] for symbol in symbols if symbol in self._by_symbol}
+
+    def missing(self, symbols: Iterable[str]) -> List[str]:
+        return [symbol for symbol in dict.fromkeys(symbols) if symbol not in self._by_symbol]
+
+    def list(self, asset_type: Optional[str] = None) -> List[dict]:
+        assets = list(self._by_symbol.values())
+        if asset_type:
+            assets = [asset for asset in assets if asset.get("asset_type") == asset_type]
+        return assets
+
+    def __len__(self):
+        return len(self._by_symbol)
+
+    async def add(self, documents: List[dict]) -> Dict[str, dict]:
+        """Insert assets whose symbol is not registered yet; returns assets by symbol.
+
+        Inserts are upserts keyed on ``symbol`` so concurrent workers seeding
+        the same asset converge on one row.
+        """
+        new = [doc for doc in documents if doc["symbol"] not in self._by_symbol]
+        if new:
+            token = str(uuid.uuid4())
+            stamp = await self.db.counters.find_one_and_update(
+                {"_id": "assets"},
+                {"$inc": {"version": 1}, "$push": {"pending": {"token": token, "at": datetime.utcnow()}}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            version = stamp["version"]
+            try:
+                await self.db.assets.bulk_write(
+                    [
+                        UpdateOne(
+                            {"symbol": doc["symbol"]},
+                            {"$setOnInsert": {**doc, "registry_version": version}},
+                            upsert=True,
+                        )
+                        for doc in new
+                    ],
+                    ordered=False,
+                )
+            finally:
+                await self._settle({"token": token})
+            # Read back so memory holds whichever row actually won
+            async for asset in self.db.assets.find({"symbol": {"$in": [doc["symbol"] for doc in new]}}):
+                self._index(asset)
+        return self.by_symbols(doc["symbol"] for doc in documents)
+
+    def stats(self) -> Dict[str, int]:
+        return {"assets": len(self._by_symbol), "version": self.version}
+
+    def _index(self, asset: dict):
+        """Index one row; of rows sharing a symbol the oldest (then lowest ``_id``) wins and the rest alias it."""
+        symbol = asset["symbol"]
+        mongo_id = str(asset.pop("_id"))
+        asset.pop("registry_version", None)
+        key = (asset.get("created_at") or datetime.min, mongo_id)
+        aliases = self._aliases.setdefault(symbol, [])
+        for asset_id in (asset.get("id"), mongo_id):
+            if asset_id and asset_id not in aliases:
+                aliases.append(asset_id)
+        winner = self._winners.get(symbol)
+        if winner is None or winner[1] == mongo_id or key < winner:
+            self._winners[symbol] = key
+            self._by_symbol[symbol] = asset
+        for asset_id in aliases:
+            self._by_id[asset_id] = self._by_symbol[symbol]
+
+
+def _settled(stamp: Optional[dict]) -> int:
+    """The version up to which every write has landed, per the ``counters`` document."""
+    if not stamp:
+        return 0
+    # Counters written before writers tracked themselves have no pending writes to wait for
+    return stamp.get("settled", 0 if stamp.get("pending") else stamp.get("version", 0))
@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+
+class IdentityCache:
+    """In-process LRU cache of verified bearer tokens -> user objects.
+
+    Callers store the public ``User``, never the stored record with its
+    password hash.
+
+    An entry lives until the earlier of the cache TTL and the token's own
+    ``exp`` claim. Entries are indexed by username as well so that any write
+    to ``db.users`` can drop every token that resolves to that user.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, float, str]]" = OrderedDict()
+        self._tokens_by_user: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Bumped by invalidate_user; a load that started before its user's
+        # last invalidation does not cache what it read
+        self._generation = 0
+        self._invalidated: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, token: str):
+        entry = self._entries.get(token)
+        if entry is None:
+            self.misses += 1
+            return None
+        user, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return user
+
+    def put(self, token: str, username: str, user: Any, token_exp: Optional[float] = None):
+        expires_at = time.monotonic() + self.ttl
+        if token_exp is not None:
+            # Convert the absolute JWT expiry into the monotonic clock
+            remaining = token_exp - time.time()
+            expires_at = min(expires_at, time.monotonic() + remaining)
+        if token in self._entries:
+            self._remove(token)
+        self._entries[token] = (user, expires_at, username)
+        self._tokens_by_user.setdefault(username, set()).add(token)
+        while len(self._entries) > self.maxsize:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    async def get_or_load(
+        self,
+        token: str,
+        loader: Callable[[], Awaitable[Tuple[Optional[str], Any, Optional[float]]]],
+    ):
+        """Return the cached user for ``token`` or resolve it once via ``loader``.
+
+        Concurrent misses for the same token share a single ``loader`` call, so a
+        dashboard fanning out N requests on first load costs one user lookup.
+        ``loader`` returns ``(username, user, token_exp)``; a ``None`` user is not
+        cached. The load runs in a task of its own, so a caller that is
+        cancelled (a client disconnecting) does not cancel the others.
+        """
+        user = self.get(token)
+        if user is not None:
+            return user
+
+        task = self._inflight.get(token)
+        if task is None:
+            task = asyncio.create_task(self._load(token, loader))
+            # Retrieve a failure even if every caller was cancelled first
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._inflight[token] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, token: str, loader):
+        started = self._generation
+        try:
+            username, user, token_exp = await loader()
+            if user is not None and self._invalidated.get(username, 0) <= started:
+                self.put(token, username, user, token_exp)
+            return user
+        finally:
+            self._inflight.pop(token, None)
+            if not self._inflight:
+                self._invalidated.clear()
+
+    def invalidate_user(self, username: str):
+        if self._inflight:
+            self._generation += 1
+            self._invalidated[username] = self._generation
+        for token in list(self._tokens_by_user.get(username, ())):
+            self._remove(token)
+            self.invalidations += 1
+
+    def invalidate_token(self, token: str):
+        if token in self._entries:
+            self._remove(token)
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._tokens_by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        username = entry[2]
+        tokens = self._tokens_by_user.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[username]
@@ -0,0 +1,576 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import indicators
+from market_data import generate_bars, interval_delta
+
+logger = logging.getLogger(__name__)
+
+# Backtests replay bars for many symbols as (symbols x bars) matrices. A
+# strategy scores every bar in [-1, 1], the same score the live signal path
+# computes on the latest bar, and positions are simulated with the user's
+# RiskSettings over whole runs of bars at once. Stops, which depend on the
+# path since entry, use running maxima per trade segment instead of a loop
+# over bars.
+
+# AIModel.model_type values a backtest can replay. Sentiment has no per-bar
+# history to replay, so it scores 0 when it is part of a hybrid.
+STRATEGIES = ("trend_detection", "price_prediction", "hybrid")
+
+# Score needed to take a position when the config does not set one: the
+# live trend detector's entry threshold, and the price model's 5% band
+DEFAULT_THRESHOLDS = {"trend_detection": 0.2, "price_prediction": 0.1, "hybrid": 0.2}
+
+# Config fields a parameter sweep may vary
+SWEEP_FIELDS = ("entry_threshold", "stop_loss_pct", "trailing_stop_pct", "position_size_pct", "max_loss_pct", "cost_bps")
+
+# Cells (symbols x bars) simulated per task; bounds worker memory on long histories
+CHUNK_CELLS = 1_000_000
+
+# Favorable-excursion ratios are capped below this so segments can be offset apart
+_RATIO_CAP = 1e4
+
+EXIT_REASONS = np.array(["signal", "stop_loss", "trailing_stop", "open"])
+
+
+class BacktestConfig(NamedTuple):
+    """One backtest run: the strategy and the risk rules it trades under.
+
+    Sizes are percentages of ``initial_capital``, as in ``RiskSettings``.
+    ``weights`` maps component model types to their weight for a hybrid.
+    """
+    strategy: str
+    initial_capital: float = 10000.0
+    position_size_pct: float = 5.0
+    max_loss_pct: Optional[float] = 1.0
+    stop_loss_pct: Optional[float] = 2.0
+    trailing_stop_pct: Optional[float] = None
+    entry_threshold: Optional[float] = None
+    allow_short: bool = False
+    cost_bps: float = 0.0
+    weights: Tuple[Tuple[str, float], ...] = ()
+    model_path: Optional[str] = None
+
+    @property
+    def threshold(self) -> float:
+        return DEFAULT_THRESHOLDS[self.strategy] if self.entry_threshold is None else self.entry_threshold
+
+
+def config_from_risk(strategy: str, risk: Dict[str, Any], **overrides) -> BacktestConfig:
+    """A config trading under a ``RiskSettings`` document; ``overrides`` win over it."""
+    values = {
+        "position_size_pct": risk["max_position_size"],
+        "max_loss_pct": risk.get("max_loss_per_trade"),
+        "stop_loss_pct": risk.get("default_stop_loss"),
+        "trailing_stop_pct": risk.get("trailing_stop_pct") if risk.get("trailing_stop_loss") else None,
+    }
+    values.update({key: value for key, value in overrides.items() if value is not None})
+    return BacktestConfig(strategy, **values)
+
+
+def sweep_configs(base: BacktestConfig, grid: Dict[str, Sequence[float]]) -> List[BacktestConfig]:
+    """Every combination of the ``grid`` values applied to ``base``."""
+    unknown = set(grid) - set(SWEEP_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot sweep {', '.join(sorted(unknown))}; choose from {', '.join(SWEEP_FIELDS)}")
+    names = list(grid)
+    configs = [base._replace(**dict(zip(names, values))) for values in itertools.product(*(grid[name] for name in names))]
+    return list(dict.fromkeys(configs))
+
+
+def trend_scores(bars: Dict[str, np.ndarray], config: BacktestConfig) -> np.ndarray:
+    values = indicators.compute_indicators(bars["high"], bars["low"], bars["close"])
+    composite, _, _ = indicators.composite_score(values)
+    history = np.cumsum(~np.isnan(bars["close"]), axis=1)
+    return np.where(history >= indicators.MIN_BARS, composite, np.nan)
+
+
+# Price models loaded in this process, by path
+_price_models: Dict[Optional[str], Any] = {}
+
+
+def price_scores(bars: Dict[str, np.ndarray], config: BacktestConfig) -> np.ndarray:
+    import price_model
+
+    if config.model_path not in _price_models:
+        _price_models[config.model_path] = price_model.load(config.model_path or price_model.DEFAULT_PATH)
+    features = price_model.feature_matrix(bars["high"], bars["low"], bars["close"])
+    rows = features.reshape(-1, features.shape[-1])
+    usable = ~np.isnan(rows).any(axis=1)
+    scores = np.full(len(rows), np.nan)
+    if usable.any():
+        scores[usable] = 2 * _price_models[config.model_path].predict_proba(rows[usable])[:, 1] - 1
+    return scores.reshape(features.shape[:2])
+
+
+def hybrid_scores(bars: Dict[str, np.ndarray], config: BacktestConfig) -> np.ndarray:
+    total = np.zeros_like(bars["close"])
+    for model_type, weight in config.weights:
+        if model_type in COMPONENT_SCORES and weight:
+            total += weight * np.nan_to_num(COMPONENT_SCORES[model_type](bars, config))
+    history = np.cumsum(~np.isnan(bars["close"]), axis=1)
+    return np.where(history >= indicators.MIN_BARS, total, np.nan)
+
+
+COMPONENT_SCORES = {"trend_detection": trend_scores, "price_prediction": price_scores}
+SCORES = {**COMPONENT_SCORES, "hybrid": hybrid_scores}
+
+
+def strategy_scores(bars: Dict[str, np.ndarray], config: BacktestConfig) -> np.ndarray:
+    """Each (symbol, bar)'s score in [-1, 1] as of that bar's close; NaN before there is enough history."""
+    return SCORES[config.strategy](bars, config)
+
+
+def _segment_max(values: np.ndarray, segment: np.ndarray) -> np.ndarray:
+    # Running maximum that restarts at each segment: offsetting segment k by
+    # k * cap keeps every earlier segment below it
+    offset = segment * _RATIO_CAP
+    return np.maximum.accumulate(values + offset) - offset
+
+
+def simulate(bars: Dict[str, np.ndarray], scores: np.ndarray, config: BacktestConfig) -> Dict[str, Any]:
+    """Trade one chunk of symbols on ``scores``; returns per-bar P&L and the trades.
+
+    A score past the threshold at a bar's close is acted on at the next
+    bar's open, so no bar trades on its own close. Each run of bars with
+    the same target direction is one trade segment. The position is sized
+    from the initial capital and the stop distance, stopped out at the
+    first bar whose range crosses the (possibly trailing) stop, and
+    otherwise closed at the open of the bar where the direction changes.
+    """
+    open_, high, low, close = (bars[field] for field in ("open", "high", "low", "close"))
+    rows, length = close.shape
+    threshold = config.threshold
+    with np.errstate(invalid="ignore"):
+        target = np.where(scores > threshold, 1, np.where((scores < -threshold) & config.allow_short, -1, 0)).astype(np.int8)
+    held = np.zeros_like(target)
+    held[:, 1:] = target[:, :-1]
+
+    direction = held.ravel()
+    o, h, lo, c = (values.ravel() for values in (open_, high, low, close))
+    starts = np.empty(direction.size, dtype=bool)
+    starts[0] = True
+    starts[1:] = direction[1:] != direction[:-1]
+    starts[::length] = True
+    segment = np.cumsum(starts) - 1
+    first = np.flatnonzero(starts)
+    entry = o[first][segment]
+    in_trade = direction != 0
+
+    # Best price since entry, as a ratio to the entry price, known before each bar
+    with np.errstate(divide="ignore", invalid="ignore"):
+        favorable = np.where(direction > 0, h / entry, entry / lo)
+    favorable = np.clip(np.nan_to_num(favorable, nan=1.0, posinf=1.0), 0.0, _RATIO_CAP - 1)
+    best = _segment_max(favorable, segment)
+    best_before = np.ones_like(best)
+    best_before[1:] = best[:-1]
+    best_before[starts] = 1.0
+    best_before = np.maximum(best_before, 1.0)
+
+    stop_pct = (config.stop_loss_pct or 0.0) / 100
+    trail_pct = (config.trailing_stop_pct or 0.0) / 100
+    long_fixed = entry * (1 - stop_pct) if stop_pct else np.full_like(entry, -np.inf)
+    short_fixed = entry * (1 + stop_pct) if stop_pct else np.full_like(entry, np.inf)
+    long_trail = entry * best_before * (1 - trail_pct) if trail_pct else np.full_like(entry, -np.inf)
+    short_trail = entry / best_before * (1 + trail_pct) if trail_pct else np.full_like(entry, np.inf)
+    stop = np.where(direction > 0, np.maximum(long_fixed, long_trail), np.minimum(short_fixed, short_trail))
+    trailing = np.where(direction > 0, long_trail > long_fixed, short_trail < short_fixed)
+    with np.errstate(invalid="ignore"):
+        hit = in_trade & np.where(direction > 0, lo <= stop, h >= stop)
+
+    # Only the first stop in a segment counts; the segment is flat after it
+    hits = np.cumsum(hit)
+    before_segment = (hits[first] - hit[first])[segment]
+    active = in_trade & (hits - hit - before_segment == 0)
+    stopped = active & hit
+    # Gapping through the stop fills at the open
+    stop_fill = np.where(direction > 0, np.minimum(o, stop), np.maximum(o, stop))
+
+    capital = config.initial_capital
+    notional = capital * config.position_size_pct / 100
+    risk_pct = stop_pct or trail_pct
+    if config.max_loss_pct and risk_pct:
+        notional = min(notional, capital * config.max_loss_pct / 100 / risk_pct)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        quantity = np.where(in_trade, notional / entry, 0.0)
+    cost = config.cost_bps / 10000
+
+    prev_close = np.empty_like(c)
+    prev_close[1:] = c[:-1]
+    prev_close[::length] = np.nan
+    start_price = np.where(starts, o, prev_close)
+    end_price = np.where(stopped, stop_fill, c)
+    with np.errstate(invalid="ignore"):
+        pnl = np.where(active, quantity * direction * (end_price - start_price), 0.0)
+        # Entry cost on the first bar, exit cost where a stop fills
+        pnl -= np.where(active & starts, quantity * o * cost, 0.0)
+        pnl -= np.where(stopped, quantity * stop_fill * cost, 0.0)
+
+    # A segment still open when the next one starts is closed at that bar's
+    # open: it carries the gap from the previous close, and pays its exit cost
+    handover = np.flatnonzero(starts[1:] & (np.arange(1, direction.size) % length != 0)) + 1
+    closing = handover[active[handover - 1] & ~stopped[handover - 1]]
+    carry_quantity = quantity[closing - 1] * direction[closing - 1]
+    pnl[closing] += carry_quantity * (o[closing] - c[closing - 1]) - np.abs(carry_quantity) * o[closing] * cost
+
+    trades = _trades(
+        first, segment, direction, entry, quantity, stopped, stop_fill, trailing, o, c, length, cost
+    )
+    return {
+        "pnl": np.nan_to_num(pnl).reshape(rows, length).sum(axis=0),
+        "positions": active.reshape(rows, length).sum(axis=0),
+        "trades": trades,
+    }
+
+
+def _trades(first, segment, direction, entry, quantity, stopped, stop_fill, trailing, o, c, length, cost) -> Dict[str, np.ndarray]:
+    traded = direction[first] != 0
+    segments = np.flatnonzero(traded)
+    starts = first[segments]
+    last = np.r_[first[1:], direction.size][segments] - 1
+
+    # Stopped segments exit on their stop bar
+    exit_index = last.copy()
+    reason = np.full(len(segments), 3)
+    stop_bars = np.flatnonzero(stopped)
+    stop_segment = np.searchsorted(segments, segment[stop_bars])
+    exit_index[stop_segment] = stop_bars
+    reason[stop_segment] = np.where(trailing[stop_bars], 2, 1)
+    exit_price = c[exit_index].copy()
+    exit_price[stop_segment] = stop_fill[stop_bars]
+
+    # The others close at the next segment's open when it is on the same row
+    unstopped = np.ones(len(segments), dtype=bool)
+    unstopped[stop_segment] = False
+    handed_over = unstopped & ((last + 1) % length != 0)
+    exit_index[handed_over] = last[handed_over] + 1
+    exit_price[handed_over] = o[last[handed_over] + 1]
+    reason[handed_over] = 0
+
+    size = quantity[starts]
+    side = direction[starts]
+    costs = size * entry[starts] * cost + np.where(reason != 3, size * exit_price * cost, 0.0)
+    return {
+        "row": starts // length,
+        "direction": side,
+        "entry_bar": starts % length,
+        "exit_bar": exit_index % length,
+        "entry_price": entry[starts],
+        "exit_price": exit_price,
+        "quantity": size,
+        "pnl": size * side * (exit_price - entry[starts]) - costs,
+        "reason": reason,
+    }
+
+
+class Task(NamedTuple):
+    """A chunk of symbols and the configs to run on it, as sent to a worker.
+
+    Bars are either given, or generated in the worker from ``generate``
+    (interval, limit, end, asset types by symbol) so long synthetic
+    histories are never pickled.
+    """
+    symbols: List[str]
+    configs: List[BacktestConfig]
+    bars: Optional[Dict[str, np.ndarray]] = None
+    generate: Optional[Tuple[str, int, datetime, Dict[str, str]]] = None
+
+
+def generated_bars(symbols: Sequence[str], interval: str, limit: int, end: datetime,
+                   asset_types: Optional[Dict[str, str]] = None) -> Dict[str, np.ndarray]:
+    """Synthetic bars priced like the bar store's, by asset type (stock if unknown)."""
+    asset_types = asset_types or {}
+    series = [
+        generate_bars(symbol, interval, limit, 150.0 if asset_types.get(symbol, "stock") == "stock" else 30000.0, end)
+        for symbol in symbols
+    ]
+    return {**indicators.bars_matrix(series, ("open", "high", "low", "close")), "timestamp": series[0]["timestamp"]}
+
+
+def generated_timestamps(interval: str, limit: int, end: datetime) -> np.ndarray:
+    """The bar times ``generated_bars`` produces for the same arguments."""
+    return generate_bars("SYM0", interval, limit, 150.0, end)["timestamp"]
+
+
+def run_task(task: Task) -> List[Dict[str, Any]]:
+    """Simulate every config of ``task`` on its symbols; scores are computed once per strategy."""
+    bars = task.bars if task.bars is not None else generated_bars(task.symbols, *task.generate)
+    scores: Dict[Tuple, np.ndarray] = {}
+    results = []
+    for config in task.configs:
+        key = (config.strategy, config.weights, config.model_path)
+        if key not in scores:
+            scores[key] = strategy_scores(bars, config)
+        results.append(simulate(bars, scores[key], config))
+    return results
+
+
+def plan_tasks(symbols: List[str], configs: List[BacktestConfig], length: int, workers: int,
+               bars: Optional[Dict[str, np.ndarray]] = None, generate: Optional[Tuple] = None) -> List[Task]:
+    """Split symbols into chunks of at most ``CHUNK_CELLS`` cells, then configs to keep ``workers`` busy."""
+    per_chunk = max(1, CHUNK_CELLS // max(length, 1))
+    chunks = [symbols[start:start + per_chunk] for start in range(0, len(symbols), per_chunk)]
+    groups = max(1, min(len(configs), -(-workers // len(chunks))))
+    config_groups = [configs[index::groups] for index in range(groups)]
+    tasks = []
+    start = 0
+    for chunk in chunks:
+        chunk_bars = None
+        if bars is not None:
+            chunk_bars = {field: values[start:start + len(chunk)] for field, values in bars.items() if field != "timestamp"}
+        start += len(chunk)
+        tasks.extend(Task(chunk, group, chunk_bars, generate) for group in config_groups)
+    return tasks
+
+
+def merge(tasks: List[Task], outputs: List[List[Dict[str, Any]]], configs: List[BacktestConfig]) -> List[Dict[str, Any]]:
+    """Add up each config's per-chunk results: P&L and positions per bar, trades with global symbol rows."""
+    offsets = {}
+    offset = 0
+    for task in tasks:
+        if id(task.symbols) not in offsets:
+            offsets[id(task.symbols)] = offset
+            offset += len(task.symbols)
+    index = {config: position for position, config in enumerate(configs)}
+    merged: List[Optional[Dict[str, Any]]] = [None] * len(configs)
+    for task, results in zip(tasks, outputs):
+        for config, result in zip(task.configs, results):
+            trades = {**result["trades"], "row": result["trades"]["row"] + offsets[id(task.symbols)]}
+            slot = index[config]
+            if merged[slot] is None:
+                merged[slot] = {"pnl": result["pnl"], "positions": result["positions"], "trades": [trades]}
+            else:
+                merged[slot]["pnl"] = merged[slot]["pnl"] + result["pnl"]
+                merged[slot]["positions"] = merged[slot]["positions"] + result["positions"]
+                merged[slot]["trades"].append(trades)
+    for result in merged:
+        result["trades"] = {key: np.concatenate([part[key] for part in result["trades"]]) for key in result["trades"][0]}
+    return merged
+
+
+def summarize(result: Dict[str, Any], config: BacktestConfig, symbols: Sequence[str], timestamps: np.ndarray,
+              interval: str, points: int = 500, max_trades: int = 500) -> Dict[str, Any]:
+    """Equity curve, drawdown, headline metrics and the most recent trades of one merged result."""
+    equity = config.initial_capital + np.cumsum(result["pnl"])
+    peak = np.maximum.accumulate(np.r_[config.initial_capital, equity])[1:]
+    drawdown = equity / peak - 1
+    returns = np.diff(np.r_[config.initial_capital, equity]) / np.r_[config.initial_capital, equity[:-1]]
+    periods_per_year = 365 * 86400 / interval_delta(interval).total_seconds()
+    volatility = returns.std()
+
+    trades = result["trades"]
+    closed = trades["reason"] != 3
+    wins = trades["pnl"][closed] > 0
+    gains = trades["pnl"][closed][wins].sum()
+    losses = -trades["pnl"][closed][~wins].sum()
+
+    sample = np.unique(np.linspace(0, len(equity) - 1, min(points, len(equity))).astype(int)) if len(equity) else np.array([], dtype=int)
+    stamps = np.datetime_as_string(timestamps[sample], unit="s").tolist()
+    order = np.argsort(trades["exit_bar"], kind="stable")[::-1][:max_trades]
+    return {
+        "config": {key: value for key, value in config._asdict().items() if key not in ("weights", "model_path")},
+        "metrics": {
+            "final_equity": round(float(equity[-1]), 2) if len(equity) else config.initial_capital,
+            "total_return_pct": round(float(equity[-1] / config.initial_capital - 1) * 100, 4) if len(equity) else 0.0,
+            "max_drawdown_pct": round(float(drawdown.min()) * 100, 4) if len(equity) else 0.0,
+            "sharpe": round(float(returns.mean() / volatility * np.sqrt(periods_per_year)), 4) if volatility > 0 else 0.0,
+            "trades": int(closed.sum()),
+            "open_positions": int((~closed).sum()),
+            "win_rate": round(float(wins.mean()), 4) if closed.any() else 0.0,
+            "profit_factor": round(float(gains / losses), 4) if losses > 0 else None,
+            "stops_hit": int(np.isin(trades["reason"], (1, 2)).sum()),
+            "max_positions": int(result["positions"].max()) if len(equity) else 0,
+        },
+        "equity_curve": {
+            "timestamp": stamps,
+            "equity": np.round(equity[sample], 2).tolist(),
+            "drawdown_pct": np.round(drawdown[sample] * 100, 4).tolist(),
+        },
+        "trades": [
+            {
+                "symbol": symbols[trades["row"][i]],
+                "side": "long" if trades["direction"][i] > 0 else "short",
+                "entry_time": str(timestamps[trades["entry_bar"][i]]),
+                "exit_time": str(timestamps[trades["exit_bar"][i]]),
+                "entry_price": round(float(trades["entry_price"][i]), 6),
+                "exit_price": round(float(trades["exit_price"][i]), 6),
+                "quantity": round(float(trades["quantity"][i]), 8),
+                "pnl": round(float(trades["pnl"][i]), 2),
+                "exit_reason": str(EXIT_REASONS[trades["reason"][i]]),
+            }
+            for i in order
+        ],
+    }
+
+
+class Backtester:
+    """Runs backtests on a process pool so the event loop never simulates.
+
+    A run is split into symbol chunks and, for a parameter sweep, groups of
+    configs; each task computes its strategy scores once and simulates
+    every config of its group on them.
+    """
+
+    def __init__(self, workers: int = 2):
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.runs = 0
+        self.configs_run = 0
+        self.cells_simulated = 0
+        self.last_duration_ms = 0.0
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, symbols: List[str], bars: Optional[Dict[str, np.ndarray]], configs: List[BacktestConfig],
+                  generate: Optional[Tuple[str, int, datetime, Dict[str, str]]] = None) -> List[Dict[str, Any]]:
+        """Merged results, one per config, for ``bars`` as stacked by ``indicators.bars_matrix``.
+
+        With ``bars`` None, each worker generates its chunk's bars from
+        ``generate`` (interval, limit, end, asset types) instead.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        started = time.perf_counter()
+        length = bars["close"].shape[1] if bars is not None else generate[1]
+        tasks = plan_tasks(symbols, configs, length, self.workers, bars=bars, generate=generate)
+        loop = asyncio.get_running_loop()
+        outputs = await asyncio.gather(*[loop.run_in_executor(self._executor, run_task, task) for task in tasks])
+        self.runs += 1
+        self.configs_run += len(configs)
+        self.cells_simulated += len(symbols) * length * len(configs)
+        self.last_duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        return merge(tasks, outputs, configs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self._executor is not None,
+            "runs": self.runs,
+            "configs_run": self.configs_run,
+            "cells_simulated": self.cells_simulated,
+            "last_duration_ms": self.last_duration_ms,
+        }
+
+
+def _sweep_grid(values: List[str]) -> Dict[str, List[float]]:
+    grid = {}
+    for value in values:
+        name, _, options = value.partition("=")
+        grid[name] = [float(option) for option in options.split(",") if option]
+    return grid
+
+
+async def _load_stored(args) -> Tuple[List[str], Dict[str, np.ndarray]]:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    from bar_store import BarStore
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "ai_investment_agent")]
+    store = BarStore(db)
+    assets = {asset["symbol"]: asset async for asset in db.assets.find({"symbol": {"$in": args.symbols}})}
+    series = await asyncio.gather(*[
+        store.get_bars(
+            symbol, args.interval, args.bars,
+            150.0 if assets.get(symbol, {}).get("asset_type", "stock") == "stock" else 30000.0
+        )
+        for symbol in args.symbols
+    ])
+    client.close()
+    longest = max(series, key=lambda bars: len(bars["timestamp"]))
+    return args.symbols, {**indicators.bars_matrix(series, ("open", "high", "low", "close")), "timestamp": longest["timestamp"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest a signal strategy over historical bars")
+    parser.add_argument("symbols", nargs="*", help="symbols to load from the market_data collection")
+    parser.add_argument("--generate", type=int, default=0, help="backtest this many synthetic symbols instead, without a database")
+    parser.add_argument("--strategy", default="trend_detection", choices=STRATEGIES)
+    parser.add_argument("--interval", default="1h")
+    parser.add_argument("--bars", type=int, default=5000)
+    parser.add_argument("--capital", type=float, default=10000.0)
+    parser.add_argument("--position-size", type=float, default=5.0, help="% of capital per position")
+    parser.add_argument("--max-loss", type=float, default=1.0, help="% of capital risked per trade")
+    parser.add_argument("--stop-loss", type=float, default=2.0, help="% from entry")
+    parser.add_argument("--trailing-stop", type=float, default=None, help="% from the best price since entry")
+    parser.add_argument("--threshold", type=float, default=None, help="score needed to enter")
+    parser.add_argument("--allow-short", action="store_true")
+    parser.add_argument("--cost-bps", type=float, default=0.0)
+    parser.add_argument("--weights", default="sentiment=0.3,price_prediction=0.4,trend_detection=0.3", help="hybrid component weights")
+    parser.add_argument("--model-path", default=os.environ.get("PRICE_MODEL_PATH"))
+    parser.add_argument("--sweep", action="append", default=[], metavar="FIELD=V1,V2", help=f"vary one of {', '.join(SWEEP_FIELDS)}")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--trades", type=int, default=10, help="recent trades to print")
+    parser.add_argument("--json", action="store_true", help="print the full results as JSON")
+    args = parser.parse_args(argv)
+    if not args.symbols and not args.generate:
+        parser.error("give symbols or --generate N")
+
+    weights = tuple((name, float(weight)) for name, _, weight in (item.partition("=") for item in args.weights.split(",")))
+    base = BacktestConfig(
+        args.strategy,
+        initial_capital=args.capital,
+        position_size_pct=args.position_size,
+        max_loss_pct=args.max_loss,
+        stop_loss_pct=args.stop_loss,
+        trailing_stop_pct=args.trailing_stop,
+        entry_threshold=args.threshold,
+        allow_short=args.allow_short,
+        cost_bps=args.cost_bps,
+        weights=weights,
+        model_path=args.model_path,
+    )
+    configs = sweep_configs(base, _sweep_grid(args.sweep)) if args.sweep else [base]
+
+    started = time.perf_counter()
+    if args.generate:
+        symbols = [f"SYM{i}" for i in range(args.generate)]
+        end = datetime.utcnow()
+        timestamps = generated_timestamps(args.interval, args.bars, end)
+        tasks = plan_tasks(symbols, configs, args.bars, args.workers, generate=(args.interval, args.bars, end, {}))
+    else:
+        symbols, bars = asyncio.run(_load_stored(args))
+        timestamps = bars["timestamp"]
+        tasks = plan_tasks(symbols, configs, len(timestamps), args.workers, bars=bars)
+    loaded = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        outputs = list(executor.map(run_task, tasks))
+    results = merge(tasks, outputs, configs)
+    elapsed = time.perf_counter() - started
+    summaries = [summarize(result, config, symbols, timestamps, args.interval, max_trades=args.trades) for result, config in zip(results, configs)]
+
+    if args.json:
+        print(json.dumps(summaries, indent=2, default=str))
+        return
+    cells = len(symbols) * len(timestamps)
+    print(
+        f"{len(symbols)} symbols x {len(timestamps):,} {args.interval} bars x {len(configs)} config(s) "
+        f"in {elapsed:.2f}s ({loaded - started:.2f}s loading, {len(tasks)} tasks on {args.workers} workers, "
+        f"{cells * len(configs) / elapsed / 1e6:,.1f}M bar-symbols/s)"
+    )
+    for summary in sorted(summaries, key=lambda item: -item["metrics"]["total_return_pct"]):
+        varied = {name: summary["config"][name] for name in _sweep_grid(args.sweep)}
+        print(f"  {varied or ''} {json.dumps(summary['metrics'])}")
+    if len(summaries) == 1:
+        for trade in summaries[0]["trades"]:
+            print(f"    {trade['symbol']:>8} {trade['side']:5} {trade['entry_time']} -> {trade['exit_time']} "
+                  f"{trade['entry_price']:.2f} -> {trade['exit_price']:.2f} {trade['pnl']:+.2f} ({trade['exit_reason']})")
+
+
+if __name__ == "__main__":
+    main()
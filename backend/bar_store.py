@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from indexes import ensure_indexes
+from market_data import (
+    BAR_FIELDS,
+    BASE_INTERVAL,
+    INTERVALS,
+    align_end,
+    generate_bars,
+    interval_delta,
+    resample_bars,
+)
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Projection used for range reads; rows go straight into arrays, no models
+BAR_PROJECTION = {"_id": 0, "timestamp": 1, **{field: 1 for field in BAR_FIELDS}}
+
+
+def empty_bars() -> Dict[str, np.ndarray]:
+    import numpy as np
+
+    bars = {field: np.empty(0) for field in BAR_FIELDS}
+    bars["timestamp"] = np.empty(0, dtype="datetime64[s]")
+    bars["volume"] = np.empty(0, dtype=np.int64)
+    return bars
+
+
+def rows_to_bars(rows: List[dict]) -> Dict[str, np.ndarray]:
+    import numpy as np
+
+    if not rows:
+        return empty_bars()
+    bars = {field: np.fromiter((row[field] for row in rows), dtype=float, count=len(rows)) for field in BAR_FIELDS}
+    bars["volume"] = bars["volume"].astype(np.int64)
+    bars["timestamp"] = np.array([row["timestamp"] for row in rows], dtype="datetime64[s]")
+    return bars
+
+
+def concat_bars(parts: Iterable[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    import numpy as np
+
+    parts = [part for part in parts if len(part["timestamp"])]
+    if not parts:
+        return empty_bars()
+    merged = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    order = np.argsort(merged["timestamp"], kind="stable")
+    return {key: values[order] for key, values in merged.items()}
+
+
+def bucket_starts(timestamps: np.ndarray, interval: str) -> np.ndarray:
+    """The distinct ``interval`` bucket starts ``timestamps`` fall in, aligned like ``resample_bars``."""
+    import numpy as np
+
+    step = int(interval_delta(interval).total_seconds())
+    seconds = timestamps.astype("datetime64[s]").astype(np.int64)
+    return np.unique(seconds - seconds % step).astype("datetime64[s]")
+
+
+class BarStore:
+    """OHLCV bars persisted in ``db.market_data`` as ``MarketData`` documents.
+
+    Bars are keyed by the unique ``(symbol, interval, timestamp)`` index
+    declared in ``indexes``, so range reads are index scans and re-ingesting a
+    bar overwrites it in place.
+
+    Coarser intervals are cached resamples of the ``BASE_INTERVAL`` series.
+    Base bars are only built for the last ``base_retention`` of a read;
+    older coarse buckets are resampled where base bars are stored and
+    generated at their own interval elsewhere. Writing base bars drops the
+    cached buckets that contain them, so they are rebuilt from the new bars.
+    """
+
+    def __init__(self, db, collection: str = "market_data", base_retention: timedelta = timedelta(days=2)):
+        self.collection = db[collection]
+        self.base_retention = base_retention
+
+    async def upsert_bars(self, symbol: str, interval: str, bars: Dict[str, np.ndarray], source: str = "mock") -> int:
+        """Bulk-upsert columnar bars; returns the number of bars written."""
+        count = len(bars["timestamp"])
+        if not count:
+            return 0
+        timestamps = bars["timestamp"].astype("datetime64[ms]").astype(datetime).tolist()
+        columns = {field: bars[field].tolist() for field in BAR_FIELDS}
+        operations = []
+        for i, ts in enumerate(timestamps):
+            key = {"symbol": symbol, "interval": interval, "timestamp": ts}
+            values = {field: columns[field][i] for field in BAR_FIELDS}
+            values["source"] = source
+            operations.append(UpdateOne(key, {"$set": values, "$setOnInsert": {"id": str(uuid.uuid4())}}, upsert=True))
+        await self.collection.bulk_write(operations, ordered=False)
+        if interval == BASE_INTERVAL:
+            await self._invalidate_buckets(symbol, bars["timestamp"])
+        return count
+
+    async def ingest(self, symbol: str, records: List[dict], source: str) -> int:
+        """Upsert broker bars, as returned by ``BrokerAdapter.bars``, into the ``BASE_INTERVAL`` series.
+
+        Ingested bars replace mock bars backfilled for the same minutes.
+        """
+        import numpy as np
+
+        rows = sorted(
+            ({**record, "timestamp": np.datetime64(str(record["timestamp"]).rstrip("Z"), "s")} for record in records),
+            key=lambda row: row["timestamp"],
+        )
+        return await self.upsert_bars(symbol, BASE_INTERVAL, rows_to_bars(rows), source=source)
+
+    async def insert_bars(self, symbol: str, interval: str, bars: Dict[str, np.ndarray], source: str = "mock") -> int:
+        """Bulk-insert bars known to be missing; returns the number inserted.
+
+        Cheaper than upserts for backfill. A concurrent backfill of the same
+        gap only produces duplicate-key errors, which are ignored.
+        """
+        count = len(bars["timestamp"])
+        if not count:
+            return 0
+        timestamps = bars["timestamp"].astype("datetime64[ms]").astype(datetime).tolist()
+        columns = [bars[field].tolist() for field in BAR_FIELDS]
+        documents = [
+            {
+                "id": str(uuid.uuid4()),
+                "symbol": symbol,
+                "interval": interval,
+                "timestamp": ts,
+                **dict(zip(BAR_FIELDS, values)),
+                "source": source,
+            }
+            for ts, *values in zip(timestamps, *columns)
+        ]
+        try:
+            result = await self.collection.insert_many(documents, ordered=False)
+            inserted = len(result.inserted_ids)
+        except BulkWriteError as exc:
+            if any(error["code"] != 11000 for error in exc.details.get("writeErrors", [])):
+                raise
+            inserted = exc.details.get("nInserted", 0)
+        if interval == BASE_INTERVAL and inserted:
+            await self._invalidate_buckets(symbol, bars["timestamp"])
+        return inserted
+
+    async def _invalidate_buckets(self, symbol: str, timestamps: np.ndarray):
+        """Drop the cached coarse buckets containing ``timestamps``, base bars that were just written."""
+        await self.collection.delete_many({
+            "symbol": symbol,
+            "$or": [
+                {"interval": interval, "timestamp": {"$in": bucket_starts(timestamps, interval).astype(datetime).tolist()}}
+                for interval in INTERVALS
+                if interval != BASE_INTERVAL
+            ],
+        })
+
+    async def get_range(self, symbol: str, interval: str, start: datetime, end: datetime) -> Dict[str, np.ndarray]:
+        """Return bars with ``start <= timestamp <= end`` in ascending order."""
+        cursor = self.collection.find(
+            {"symbol": symbol, "interval": interval, "timestamp": {"$gte": start, "$lte": end}},
+            BAR_PROJECTION,
+        ).sort("timestamp", ASCENDING)
+        return rows_to_bars(await cursor.to_list(length=None))
+
+    async def backfill(
+        self,
+        symbol: str,
+        interval: str,
+        start: datetime,
+        end: datetime,
+        base_price: float,
+        existing: Optional[Dict[str, np.ndarray]] = None,
+    ) -> Tuple[Dict[str, np.ndarray], int]:
+        """Fill every missing bar between ``start`` and ``end``.
+
+        Returns the complete range and the number of bars written. Gaps are
+        filled with mock bars that continue from the neighbouring stored bars,
+        so the series stays continuous across old and new data.
+        """
+        import numpy as np
+
+        delta = interval_delta(interval)
+        start = align_end(start, interval)
+        end = align_end(end, interval)
+        if existing is None:
+            existing = await self.get_range(symbol, interval, start, end)
+
+        step = np.timedelta64(int(delta.total_seconds()), "s")
+        grid = np.arange(np.datetime64(start, "s"), np.datetime64(end, "s") + step, step)
+        missing = ~np.isin(grid, existing["timestamp"])
+        if not missing.any():
+            return existing, 0
+
+        # Split the missing grid points into contiguous runs
+        missing_idx = np.flatnonzero(missing)
+        breaks = np.flatnonzero(np.diff(missing_idx) > 1) + 1
+        # A leading gap continues from the last stored bar before the range, if any
+        prior_close = None
+        if missing[0]:
+            prior = await self.collection.find_one(
+                {"symbol": symbol, "interval": interval, "timestamp": {"$lt": start}},
+                {"_id": 0, "close": 1},
+                sort=[("timestamp", -1)],
+            )
+            prior_close = prior["close"] if prior else None
+
+        filled = [existing]
+        for run in np.split(missing_idx, breaks):
+            gap_end = grid[run[-1]].astype(datetime)
+            before = existing["timestamp"] < grid[run[0]]
+            after = existing["timestamp"] > grid[run[-1]]
+            if before.any():
+                seed_price = float(existing["close"][before][-1])
+            else:
+                seed_price = prior_close if prior_close is not None else base_price
+            gap = generate_bars(symbol, interval, len(run), seed_price, end=gap_end)
+            if after.any():
+                # Bend the gap so it meets the next stored bar: a leading gap is
+                # rescaled outright, an interior one ramps from its seed price
+                factor = float(existing["open"][after][0]) / float(gap["close"][-1])
+                if before.any() or prior_close is not None:
+                    factor = factor ** (np.arange(1, len(run) + 1) / len(run))
+                for field in ("open", "high", "low", "close"):
+                    gap[field] = np.round(gap[field] * factor, 2)
+            filled.append(gap)
+
+        gap_bars = concat_bars(filled[1:])
+        written = await self.insert_bars(symbol, interval, gap_bars)
+        return concat_bars(filled), written
+
+    async def get_or_backfill(self, symbol: str, interval: str, limit: int, base_price: float, end: Optional[datetime] = None):
+        """Return the latest ``limit`` bars, generating and storing any that are missing."""
+        end = align_end(end or datetime.utcnow(), interval)
+        start = end - interval_delta(interval) * (limit - 1)
+        return await self._complete_range(symbol, interval, start, end, base_price)
+
+    async def get_bars(self, symbol: str, interval: str, limit: int, base_price: float, end: Optional[datetime] = None):
+        """Return the latest ``limit`` bars for any supported interval.
+
+        Only ``BASE_INTERVAL`` bars are generated. Coarser bars are resampled
+        from them: completed buckets are stored under their own interval the
+        first time they are built and read back afterwards, so only the
+        still-open bucket is aggregated on every call. Buckets older than
+        ``base_retention`` without stored base bars are generated directly at
+        ``interval``, so a long window never builds its whole 1m base.
+        """
+        if interval not in INTERVALS:
+            interval = "1d"
+        if interval == BASE_INTERVAL:
+            return await self.get_or_backfill(symbol, interval, limit, base_price, end)
+
+        now = end or datetime.utcnow()
+        delta = interval_delta(interval)
+        open_start = align_end(now, interval)
+        parts = []
+        if limit > 1:
+            first = open_start - delta * (limit - 1)
+            last_completed = open_start - delta
+            completed = await self.get_range(symbol, interval, first, last_completed)
+            if len(completed["timestamp"]) < limit - 1:
+                completed = await self._resample_missing(
+                    symbol, interval, first, last_completed, base_price, completed
+                )
+            parts.append(completed)
+
+        current = await self._complete_range(
+            symbol, BASE_INTERVAL, open_start, align_end(now, BASE_INTERVAL), base_price
+        )
+        parts.append(resample_bars(current, interval))
+        return concat_bars(parts)
+
+    async def _complete_range(self, symbol: str, interval: str, start: datetime, end: datetime, base_price: float):
+        bars = await self.get_range(symbol, interval, start, end)
+        expected = (end - start) // interval_delta(interval) + 1
+        if len(bars["timestamp"]) < expected:
+            bars, _ = await self.backfill(symbol, interval, start, end, base_price, existing=bars)
+        return bars
+
+    async def _resample_missing(self, symbol: str, interval: str, first: datetime, last: datetime, base_price: float, cached):
+        """Build and store the completed ``interval`` buckets missing from ``cached``.
+
+        Buckets within ``base_retention`` of ``last``, and older ones with
+        any stored base bars, are resampled from the completed base; the
+        rest are generated at ``interval``, continuing into the resampled ones.
+        """
+        import numpy as np
+
+        delta = interval_delta(interval)
+        step = np.timedelta64(int(delta.total_seconds()), "s")
+        grid = np.arange(np.datetime64(first, "s"), np.datetime64(last, "s") + step, step)
+        missing = grid[~np.isin(grid, cached["timestamp"])]
+        horizon = np.datetime64(align_end(last + delta - self.base_retention, interval) + delta, "s")
+        resample = missing[missing >= horizon]
+        old = missing[missing < horizon]
+        if len(old):
+            # Ingested or previously read base bars keep old buckets consistent with them
+            rows = await self.collection.find(
+                {
+                    "symbol": symbol,
+                    "interval": BASE_INTERVAL,
+                    "timestamp": {"$gte": old[0].astype(datetime), "$lt": (old[-1] + step).astype(datetime)},
+                },
+                {"_id": 0, "timestamp": 1},
+            ).to_list(length=None)
+            if rows:
+                based = bucket_starts(np.array([row["timestamp"] for row in rows], dtype="datetime64[s]"), interval)
+                resample = np.concatenate([old[np.isin(old, based)], resample])
+
+        if len(resample):
+            # One base range per run of adjacent buckets
+            runs = np.split(resample, np.flatnonzero(np.diff(resample) != step) + 1)
+            for run in runs:
+                base_start = run[0].astype(datetime)
+                base_end = (run[-1] + step).astype(datetime) - interval_delta(BASE_INTERVAL)
+                base = await self._complete_range(symbol, BASE_INTERVAL, base_start, base_end, base_price)
+                buckets = resample_bars(base, interval)
+                keep = np.isin(buckets["timestamp"], run)
+                buckets = {key: values[keep] for key, values in buckets.items()}
+                await self.insert_bars(symbol, interval, buckets, source="resampled")
+                cached = concat_bars([cached, buckets])
+        if len(resample) < len(missing):
+            cached, _ = await self.backfill(symbol, interval, first, last, base_price, existing=cached)
+        return cached
+
+
+async def _run_backfill(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+    db = client[os.environ.get("DB_NAME", "ai_investment_agent")]
+    await ensure_indexes(db, ["market_data"])
+    store = BarStore(db)
+
+    for symbol in args.symbols:
+        asset = await db.assets.find_one({"symbol": symbol})
+        asset_type = asset["asset_type"] if asset else "stock"
+        base_price = 150.0 if asset_type == "stock" else 30000.0
+        # Fills base bars and caches the resampled buckets for args.interval
+        bars = await store.get_bars(symbol, args.interval, args.bars, base_price)
+        print(f"{symbol} {args.interval}: {len(bars['timestamp'])} bars stored")
+    client.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill missing OHLCV bars into the market_data collection")
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--interval", default="1d", choices=list(INTERVALS))
+    parser.add_argument("--bars", type=int, default=365, help="number of bars ending at the current bar")
+    asyncio.run(_run_backfill(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,614 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+
+from rate_limits import RateLimited, RateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Base URLs per provider and environment; "data" serves bars
+DEFAULT_URLS = {
+    "alpaca": {
+        "paper": {"trading": "https://paper-api.alpaca.markets", "data": "https://data.alpaca.markets"},
+        "live": {"trading": "https://api.alpaca.markets", "data": "https://data.alpaca.markets"},
+    },
+    "binance": {
+        "paper": {"trading": "https://testnet.binance.vision", "data": "https://testnet.binance.vision"},
+        "live": {"trading": "https://api.binance.com", "data": "https://api.binance.com"},
+    },
+}
+
+# Bars intervals as each provider names them
+ALPACA_TIMEFRAMES = {"1m": "1Min", "5m": "5Min", "15m": "15Min", "1h": "1Hour", "4h": "4Hour", "1d": "1Day"}
+BINANCE_QUOTE = "USDT"
+
+
+def broker_urls(override: Optional[str] = None) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """``DEFAULT_URLS``, or every provider and environment pointed at one server (the fake broker)."""
+    if not override:
+        return DEFAULT_URLS
+    return {
+        provider: {environment: {base: override for base in bases} for environment, bases in environments.items()}
+        for provider, environments in DEFAULT_URLS.items()
+    }
+
+
+class BrokerError(Exception):
+    def __init__(self, provider: str, detail: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {detail}")
+        self.provider = provider
+        self.detail = detail
+        self.status_code = status_code
+
+
+class BrokerRejected(BrokerError):
+    """The broker refused the request (bad order, bad credentials); retrying will not help."""
+
+
+class BrokerUnavailable(BrokerError):
+    """The broker could not be reached: its circuit is open or retries ran out."""
+
+    def __init__(self, provider: str, detail: str, retry_after: float = 1.0, status_code: Optional[int] = None):
+        super().__init__(provider, detail, status_code)
+        self.retry_after = retry_after
+
+
+class BrokerNotConfigured(KeyError):
+    """The user has no ``TradingAPIConfig`` for the provider."""
+
+
+class CircuitBreaker:
+    """Stops calling an endpoint after ``failure_threshold`` consecutive failures.
+
+    While open, calls fail fast for ``reset_timeout`` seconds. Then one
+    call is let through (half-open): success closes the circuit again,
+    failure re-opens it. A probe that ends without either, cancelled or
+    failing before it reached the broker, must be handed back with
+    ``release`` so the next call can probe instead.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self.trips = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    @property
+    def probing(self) -> bool:
+        return self._probing
+
+    def before_call(self) -> Optional[float]:
+        """None if the call may go ahead, else seconds until the circuit half-opens."""
+        state = self.state
+        if state == "closed":
+            return None
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return None
+        self.short_circuited += 1
+        return max(0.1, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def release(self):
+        """Give back the half-open probe without a verdict."""
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._probing:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "short_circuited": self.short_circuited}
+
+
+class BrokerAdapter:
+    """One user's connection to one provider: account, positions, orders and bars.
+
+    Every method returns the same normalized shapes whatever the provider.
+    Requests share one keep-alive ``httpx.AsyncClient``, queue in their
+    lane for the API key's budget in the ``RateLimiter`` (orders first,
+    then account reads, then position and bar refreshes), go through the
+    endpoint's ``CircuitBreaker``,
+    and are retried with jittered exponential backoff on timeouts,
+    connection errors, 429 and 5xx. Orders carry a client order id, so a
+    retried submission cannot fill twice; if the broker rejects the retry
+    as a duplicate, the order the first attempt placed is looked up and
+    returned.
+    """
+
+    provider = ""
+
+    def __init__(
+        self,
+        config: dict,
+        urls: Dict[str, str],
+        limiter: RateLimiter,
+        breaker: CircuitBreaker,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        timeout: float = 10.0,
+        max_attempts: int = 3,
+        max_wait: float = 30.0,
+    ):
+        self.api_key = config["api_key"]
+        self.api_secret = config["api_secret"]
+        self.urls = urls
+        self.limiter = limiter
+        self.breaker = breaker
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.http = httpx.AsyncClient(
+            transport=transport,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4, keepalive_expiry=30.0),
+        )
+        self.last_used = time.monotonic()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    async def account(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def positions(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def orders(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def submit_order(self, symbol: str, side: str, quantity: float, order_type: str = "market",
+                           limit_price: Optional[float] = None, client_order_id: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def bars(self, symbol: str, interval: str, limit: int) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _sign(self, method: str, params: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
+        """Add credentials to a request; returns the query parameters to send."""
+        return params
+
+    async def _observe(self, response: httpx.Response):
+        """Read the broker's rate-limit headers into the limiter."""
+
+    async def request(self, method: str, path: str, params: Optional[Dict[str, Any]] = None, body: Optional[dict] = None,
+                      base: str = "trading", weight: int = 1, signed: bool = True, lane: str = "refresh") -> Any:
+        self.last_used = time.monotonic()
+        url = self.urls[base] + path
+        delay = 0.25
+        for attempt in range(1, self.max_attempts + 1):
+            # Budget first: a call that waits or is rejected here never holds the breaker's probe
+            try:
+                await self.limiter.acquire(self.provider, self.api_key, weight, lane, timeout=self.max_wait)
+            except RateLimited as exc:
+                raise BrokerUnavailable(self.provider, "request budget exhausted", retry_after=exc.retry_after, status_code=429)
+            wait = self.breaker.before_call()
+            if wait is not None:
+                raise BrokerUnavailable(self.provider, "circuit open after repeated failures", retry_after=wait)
+            probe = self.breaker.probing
+            recorded = False
+            try:
+                headers: Dict[str, str] = {}
+                query = self._sign(method, dict(params or {}), headers) if signed else dict(params or {})
+                self.requests += 1
+                try:
+                    response = await self.http.request(method, url, params=query, json=body, headers=headers)
+                except httpx.TransportError as exc:
+                    self.breaker.record_failure()
+                    recorded = True
+                    error = BrokerUnavailable(self.provider, f"{type(exc).__name__} calling {path}")
+                else:
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        # A 429 is the broker's limit, not a failure of the broker itself
+                        self.breaker.record_success()
+                    recorded = True
+                    await self._observe(response)
+                    if response.status_code == 429:
+                        retry_after = float(response.headers.get("Retry-After", 1))
+                        await self.limiter.pause(self.provider, self.api_key, retry_after)
+                        error = BrokerUnavailable(self.provider, "rate limited", retry_after=retry_after, status_code=429)
+                    elif response.status_code >= 500:
+                        error = BrokerUnavailable(self.provider, f"{path} returned {response.status_code}", status_code=response.status_code)
+                    elif response.status_code >= 400:
+                        raise BrokerRejected(self.provider, _error_detail(response), status_code=response.status_code)
+                    else:
+                        return response.json()
+            finally:
+                if probe and not recorded:
+                    self.breaker.release()
+            if attempt == self.max_attempts:
+                break
+            self.retries += 1
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            delay *= 2
+        self.failures += 1
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+def _error_detail(response: httpx.Response) -> str:
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text or f"HTTP {response.status_code}"
+    if isinstance(body, dict):
+        return str(body.get("message") or body.get("msg") or body.get("detail") or body)
+    return str(body)
+
+
+def _iso(millis: Optional[int]) -> Optional[str]:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(millis / 1000)) if millis else None
+
+
+def _float(value) -> Optional[float]:
+    return float(value) if value not in (None, "") else None
+
+
+class AlpacaAdapter(BrokerAdapter):
+    provider = "alpaca"
+
+    def _sign(self, method, params, headers):
+        headers["APCA-API-KEY-ID"] = self.api_key
+        headers["APCA-API-SECRET-KEY"] = self.api_secret
+        return params
+
+    async def _observe(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is not None:
+            await self.limiter.observe(
+                self.provider, self.api_key, remaining=int(remaining),
+                reset_in=max(0.0, float(reset) - time.time()) if reset else None,
+            )
+
+    async def account(self):
+        account = await self.request("GET", "/v2/account", lane="account")
+        return {
+            "provider": self.provider,
+            "cash": float(account["cash"]),
+            "equity": float(account["equity"]),
+            "buying_power": float(account["buying_power"]),
+            "currency": account.get("currency", "USD"),
+        }
+
+    async def positions(self):
+        return [
+            {
+                "provider": self.provider,
+                "symbol": position["symbol"],
+                "quantity": float(position["qty"]) * (-1 if position.get("side") == "short" and float(position["qty"]) > 0 else 1),
+                "avg_entry_price": float(position["avg_entry_price"]),
+                "current_price": _float(position.get("current_price")),
+                "market_value": _float(position.get("market_value")),
+                "unrealized_pl": _float(position.get("unrealized_pl")),
+            }
+            for position in await self.request("GET", "/v2/positions")
+        ]
+
+    async def orders(self):
+        return [self._order(order) for order in await self.request("GET", "/v2/orders", {"status": "all", "limit": 100}, lane="account")]
+
+    async def submit_order(self, symbol, side, quantity, order_type="market", limit_price=None, client_order_id=None):
+        body = {
+            "symbol": symbol,
+            "qty": str(quantity),
+            "side": side,
+            "type": order_type,
+            "time_in_force": "day",
+            "client_order_id": client_order_id or str(uuid.uuid4()),
+        }
+        if limit_price is not None:
+            body["limit_price"] = str(limit_price)
+        try:
+            order = await self.request("POST", "/v2/orders", body=body, lane="order")
+        except BrokerRejected as exc:
+            if exc.status_code != 422 or "client_order_id must be unique" not in exc.detail:
+                raise
+            # An earlier attempt went through before its response was lost
+            order = await self.request(
+                "GET", "/v2/orders:by_client_order_id", {"client_order_id": body["client_order_id"]}, lane="order"
+            )
+        return self._order(order)
+
+    async def bars(self, symbol, interval, limit):
+        response = await self.request(
+            "GET", f"/v2/stocks/{symbol}/bars", {"timeframe": ALPACA_TIMEFRAMES[interval], "limit": limit}, base="data"
+        )
+        return [
+            {"timestamp": bar["t"], "open": bar["o"], "high": bar["h"], "low": bar["l"], "close": bar["c"], "volume": bar["v"]}
+            for bar in response.get("bars") or []
+        ]
+
+    def _order(self, order: dict) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "id": order["id"],
+            "client_order_id": order.get("client_order_id"),
+            "symbol": order["symbol"],
+            "side": order["side"],
+            "quantity": float(order["qty"]),
+            "order_type": order["type"],
+            "status": order["status"],
+            "filled_quantity": float(order.get("filled_qty") or 0),
+            "filled_price": _float(order.get("filled_avg_price")),
+            "created_at": order.get("created_at"),
+        }
+
+
+class BinanceAdapter(BrokerAdapter):
+    """Spot account quoted in USDT; a non-zero balance is a position in that coin."""
+
+    provider = "binance"
+
+    def _sign(self, method, params, headers):
+        headers["X-MBX-APIKEY"] = self.api_key
+        params["timestamp"] = int(time.time() * 1000)
+        params.setdefault("recvWindow", 5000)
+        params["signature"] = hmac.new(self.api_secret.encode(), urlencode(params).encode(), hashlib.sha256).hexdigest()
+        return params
+
+    async def _observe(self, response):
+        used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is not None:
+            limit = self.limiter.limits[self.provider][0]
+            await self.limiter.observe(self.provider, self.api_key, remaining=limit - int(used), reset_in=60 - time.time() % 60)
+
+    async def _prices(self, lane: str) -> Dict[str, float]:
+        tickers = await self.request("GET", "/api/v3/ticker/price", weight=4, signed=False, lane=lane)
+        return {
+            ticker["symbol"][:-len(BINANCE_QUOTE)]: float(ticker["price"])
+            for ticker in tickers if ticker["symbol"].endswith(BINANCE_QUOTE)
+        }
+
+    async def _balances(self, lane: str) -> Tuple[Dict[str, float], Dict[str, float]]:
+        account, prices = await asyncio.gather(self.request("GET", "/api/v3/account", weight=20, lane=lane), self._prices(lane))
+        balances = {balance["asset"]: float(balance["free"]) + float(balance["locked"]) for balance in account["balances"]}
+        return {asset: amount for asset, amount in balances.items() if amount}, prices
+
+    async def account(self):
+        balances, prices = await self._balances("account")
+        cash = balances.get(BINANCE_QUOTE, 0.0)
+        holdings = sum(amount * prices.get(asset, 0.0) for asset, amount in balances.items() if asset != BINANCE_QUOTE)
+        return {"provider": self.provider, "cash": cash, "equity": cash + holdings, "buying_power": cash, "currency": BINANCE_QUOTE}
+
+    async def positions(self):
+        balances, prices = await self._balances("refresh")
+        # Spot balances carry no entry price; callers keep their own
+        return [
+            {
+                "provider": self.provider,
+                "symbol": asset,
+                "quantity": amount,
+                "avg_entry_price": None,
+                "current_price": prices.get(asset),
+                "market_value": amount * prices[asset] if asset in prices else None,
+                "unrealized_pl": None,
+            }
+            for asset, amount in balances.items() if asset != BINANCE_QUOTE
+        ]
+
+    async def orders(self):
+        return [self._order(order) for order in await self.request("GET", "/api/v3/openOrders", weight=40, lane="account")]
+
+    async def submit_order(self, symbol, side, quantity, order_type="market", limit_price=None, client_order_id=None):
+        params = {
+            "symbol": symbol + BINANCE_QUOTE,
+            "side": side.upper(),
+            "type": order_type.upper(),
+            "quantity": quantity,
+            "newClientOrderId": client_order_id or uuid.uuid4().hex,
+            "newOrderRespType": "FULL",
+        }
+        if limit_price is not None:
+            params.update(price=limit_price, timeInForce="GTC")
+        try:
+            order = await self.request("POST", "/api/v3/order", params, lane="order")
+        except BrokerRejected as exc:
+            if "Duplicate order sent" not in exc.detail:
+                raise
+            # An earlier attempt went through before its response was lost
+            order = await self.request(
+                "GET", "/api/v3/order", {"symbol": params["symbol"], "origClientOrderId": params["newClientOrderId"]},
+                weight=4, lane="order",
+            )
+        return self._order(order)
+
+    async def bars(self, symbol, interval, limit):
+        klines = await self.request(
+            "GET", "/api/v3/klines", {"symbol": symbol + BINANCE_QUOTE, "interval": interval, "limit": limit},
+            base="data", weight=2, signed=False,
+        )
+        return [
+            {
+                "timestamp": _iso(kline[0]),
+                "open": float(kline[1]), "high": float(kline[2]), "low": float(kline[3]),
+                "close": float(kline[4]), "volume": float(kline[5]),
+            }
+            for kline in klines
+        ]
+
+    def _order(self, order: dict) -> Dict[str, Any]:
+        filled = float(order.get("executedQty") or 0)
+        quote = float(order.get("cummulativeQuoteQty") or 0)
+        return {
+            "provider": self.provider,
+            "id": str(order["orderId"]),
+            "client_order_id": order.get("clientOrderId"),
+            "symbol": order["symbol"][:-len(BINANCE_QUOTE)] if order["symbol"].endswith(BINANCE_QUOTE) else order["symbol"],
+            "side": order["side"].lower(),
+            "quantity": float(order["origQty"]),
+            "order_type": order["type"].lower(),
+            "status": order["status"].lower(),
+            "filled_quantity": filled,
+            "filled_price": quote / filled if filled else None,
+            "created_at": _iso(order.get("transactTime") or order.get("time")),
+        }
+
+
+ADAPTERS = {"alpaca": AlpacaAdapter, "binance": BinanceAdapter}
+
+# Loads a user's TradingAPIConfig for a provider, or None
+ConfigLoader = Callable[[str, str], Awaitable[Optional[dict]]]
+
+
+class BrokerPool:
+    """Adapters by (user, provider), each with its own pooled HTTP client.
+
+    An adapter is built on first use from the user's stored config and kept
+    while it is used. Idle ones are closed after ``idle_timeout``, and the
+    least recently used past ``max_clients``. Request budgets live in the
+    ``limiter`` by API key, and circuit breakers are shared by provider
+    endpoint, so users on the same key or the same broker see the same
+    limits and outages.
+    """
+
+    def __init__(
+        self,
+        load_config: ConfigLoader,
+        urls: Dict[str, Dict[str, Dict[str, str]]] = DEFAULT_URLS,
+        limiter: Optional[RateLimiter] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        idle_timeout: float = 300.0,
+        max_clients: int = 1000,
+        timeout: float = 10.0,
+        max_attempts: int = 3,
+        max_wait: float = 30.0,
+    ):
+        self.load_config = load_config
+        self.urls = urls
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.transport = transport
+        self.idle_timeout = idle_timeout
+        self.max_clients = max_clients
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self._adapters: "OrderedDict[Tuple[str, str], BrokerAdapter]" = OrderedDict()
+        self._creating: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.created = 0
+        self.closed = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        adapters = list(self._adapters.values())
+        self._adapters.clear()
+        await asyncio.gather(*[adapter.aclose() for adapter in adapters], return_exceptions=True)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            cutoff = time.monotonic() - self.idle_timeout
+            idle = [key for key, adapter in self._adapters.items() if adapter.last_used < cutoff]
+            for key in idle:
+                await self._close(key)
+
+    async def adapter(self, user_id: str, provider: str) -> BrokerAdapter:
+        """The user's adapter for ``provider``; raises ``BrokerNotConfigured`` without stored credentials."""
+        key = (user_id, provider)
+        adapter = self._adapters.get(key)
+        if adapter is not None:
+            self._adapters.move_to_end(key)
+            return adapter
+        if key in self._creating:
+            return await asyncio.shield(self._creating[key])
+        future = asyncio.get_running_loop().create_future()
+        self._creating[key] = future
+        try:
+            adapter = await self._create(user_id, provider)
+            self._adapters[key] = adapter
+            future.set_result(adapter)
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            self._creating.pop(key, None)
+        while len(self._adapters) > self.max_clients:
+            await self._close(next(iter(self._adapters)))
+        return adapter
+
+    async def _create(self, user_id: str, provider: str) -> BrokerAdapter:
+        if provider not in ADAPTERS:
+            raise BrokerNotConfigured(f"Unsupported provider {provider!r}")
+        config = await self.load_config(user_id, provider)
+        if config is None:
+            raise BrokerNotConfigured(f"No {provider} API config")
+        urls = self.urls[provider]["paper" if config.get("is_paper_trading", True) else "live"]
+        breaker = self._breakers.setdefault(urls["trading"] + "|" + provider, CircuitBreaker())
+        self.created += 1
+        return ADAPTERS[provider](
+            config, urls, self.limiter, breaker,
+            transport=self.transport, timeout=self.timeout, max_attempts=self.max_attempts, max_wait=self.max_wait,
+        )
+
+    async def _close(self, key: Tuple[str, str]):
+        adapter = self._adapters.pop(key, None)
+        if adapter is not None:
+            self.closed += 1
+            await adapter.aclose()
+
+    async def evict(self, user_id: str, provider: Optional[str] = None):
+        """Close the user's adapters, after their credentials change."""
+        for key in [key for key in self._adapters if key[0] == user_id and provider in (None, key[1])]:
+            await self._close(key)
+
+    def stats(self) -> Dict[str, Any]:
+        adapters = list(self._adapters.values())
+        return {
+            "clients": len(adapters),
+            "created": self.created,
+            "closed": self.closed,
+            "requests": sum(adapter.requests for adapter in adapters),
+            "retries": sum(adapter.retries for adapter in adapters),
+            "failures": sum(adapter.failures for adapter in adapters),
+            "breakers": {endpoint: breaker.stats() for endpoint, breaker in self._breakers.items()},
+        }
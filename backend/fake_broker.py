@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse
+
+from market_data import generate_bars
+
+logger = logging.getLogger(__name__)
+
+# An in-memory stand-in for the Alpaca and Binance REST APIs, enough of
+# them for brokers.py to run offline: accounts, positions, market orders
+# that fill at once, and bars from the same generator as the mock market
+# data. Any key/secret pair is accepted. A reused client order id is
+# rejected the way each provider rejects it. It also sends the providers'
+# rate-limit headers, answers 429 past ``rate_limit`` requests a minute,
+# and can fail or stall a share of requests to exercise retries and the
+# circuit breaker.
+#
+#   python fake_broker.py --port 8900
+#   FAKE_BROKER_URL=http://localhost:8900 uvicorn server:app
+
+STARTING_CASH = 100000.0
+ALPACA_TIMEFRAMES = {"1Min": "1m", "5Min": "5m", "15Min": "15m", "1Hour": "1h", "4Hour": "4h", "1Day": "1d"}
+BINANCE_QUOTE = "USDT"
+CRYPTO = {"BTC", "ETH", "SOL", "ADA", "DOGE", "XRP", "DOT", "BNB"}
+
+
+class FakeAccount:
+    def __init__(self):
+        self.cash = STARTING_CASH
+        # symbol -> [quantity, avg entry price]
+        self.positions: Dict[str, list] = {}
+        self.orders: Dict[str, dict] = {}
+        self.by_client_id: Dict[str, str] = {}
+
+    def fill(self, symbol: str, side: str, quantity: float, price: float):
+        signed = quantity if side == "buy" else -quantity
+        held, entry = self.positions.get(symbol, (0.0, 0.0))
+        total = held + signed
+        if held == 0 or (held > 0) == (signed > 0):
+            entry = (held * entry + signed * price) / total
+        elif (total > 0) != (held > 0) and total != 0:
+            entry = price
+        self.cash -= signed * price
+        if abs(total) < 1e-12:
+            self.positions.pop(symbol, None)
+        else:
+            self.positions[symbol] = [total, entry]
+
+
+def price_of(symbol: str) -> float:
+    base = 30000.0 if symbol in CRYPTO else 150.0
+    return float(generate_bars(symbol, "1m", 1, base)["close"][-1])
+
+
+def create_app(rate_limit: int = 200, failure_rate: float = 0.0, latency: float = 0.0, seed: Optional[int] = None) -> FastAPI:
+    app = FastAPI(title="Fake broker")
+    accounts: Dict[str, FakeAccount] = defaultdict(FakeAccount)
+    windows: Dict[str, deque] = defaultdict(deque)
+    rng = random.Random(seed)
+    app.state.accounts = accounts
+    app.state.requests = 0
+
+    @app.middleware("http")
+    async def limits(request: Request, call_next):
+        app.state.requests += 1
+        key = request.headers.get("APCA-API-KEY-ID") or request.headers.get("X-MBX-APIKEY") or request.client.host
+        now = time.time()
+        window = windows[key]
+        while window and window[0] <= now - 60:
+            window.popleft()
+        reset = int(window[0] + 60 if window else now + 60)
+        if len(window) >= rate_limit:
+            return JSONResponse(
+                {"message": "too many requests"},
+                status_code=429,
+                headers={"Retry-After": str(max(1, reset - int(now))), "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset)},
+            )
+        window.append(now)
+        if latency:
+            await asyncio.sleep(latency)
+        if failure_rate and rng.random() < failure_rate:
+            return JSONResponse({"message": "injected failure"}, status_code=503)
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(rate_limit)
+        response.headers["X-RateLimit-Remaining"] = str(rate_limit - len(window))
+        response.headers["X-RateLimit-Reset"] = str(reset)
+        response.headers["X-MBX-USED-WEIGHT-1M"] = str(len(window))
+        return response
+
+    #-------------
+    # Alpaca
+    #-------------
+
+    def alpaca_account(key: str) -> FakeAccount:
+        return accounts["alpaca:" + key]
+
+    def alpaca_order(order: dict) -> dict:
+        return {**order, "qty": str(order["qty"]), "filled_qty": str(order["qty"]), "filled_avg_price": str(order["price"])}
+
+    @app.get("/v2/account")
+    async def alpaca_get_account(key: str = Header(..., alias="APCA-API-KEY-ID")):
+        account = alpaca_account(key)
+        equity = account.cash + sum(quantity * price_of(symbol) for symbol, (quantity, _) in account.positions.items())
+        return {"cash": str(round(account.cash, 2)), "equity": str(round(equity, 2)),
+                "buying_power": str(round(max(account.cash, 0), 2)), "currency": "USD", "status": "ACTIVE"}
+
+    @app.get("/v2/positions")
+    async def alpaca_get_positions(key: str = Header(..., alias="APCA-API-KEY-ID")):
+        positions = []
+        for symbol, (quantity, entry) in alpaca_account(key).positions.items():
+            price = price_of(symbol)
+            positions.append({
+                "symbol": symbol,
+                "qty": str(abs(quantity)),
+                "side": "long" if quantity > 0 else "short",
+                "avg_entry_price": str(round(entry, 4)),
+                "current_price": str(price),
+                "market_value": str(round(quantity * price, 2)),
+                "unrealized_pl": str(round(quantity * (price - entry), 2)),
+            })
+        return positions
+
+    @app.get("/v2/orders")
+    async def alpaca_get_orders(key: str = Header(..., alias="APCA-API-KEY-ID")):
+        return [alpaca_order(order) for order in alpaca_account(key).orders.values()]
+
+    @app.post("/v2/orders")
+    async def alpaca_post_order(body: dict, key: str = Header(..., alias="APCA-API-KEY-ID")):
+        account = alpaca_account(key)
+        client_id = body.get("client_order_id") or str(uuid.uuid4())
+        if client_id in account.by_client_id:
+            return JSONResponse({"code": 40010001, "message": "client_order_id must be unique"}, status_code=422)
+        quantity = float(body.get("qty") or 0)
+        if quantity <= 0 or body.get("side") not in ("buy", "sell"):
+            return JSONResponse({"message": "invalid order"}, status_code=422)
+        price = price_of(body["symbol"])
+        if body["side"] == "buy" and quantity * price > account.cash:
+            return JSONResponse({"message": "insufficient buying power"}, status_code=403)
+        account.fill(body["symbol"], body["side"], quantity, price)
+        order = {
+            "id": str(uuid.uuid4()),
+            "client_order_id": client_id,
+            "symbol": body["symbol"],
+            "side": body["side"],
+            "qty": quantity,
+            "type": body.get("type", "market"),
+            "status": "filled",
+            "price": price,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+        }
+        account.orders[order["id"]] = order
+        account.by_client_id[client_id] = order["id"]
+        return alpaca_order(order)
+
+    @app.get("/v2/orders:by_client_order_id")
+    async def alpaca_get_order_by_client_id(client_order_id: str, key: str = Header(..., alias="APCA-API-KEY-ID")):
+        account = alpaca_account(key)
+        if client_order_id not in account.by_client_id:
+            return JSONResponse({"code": 40410000, "message": "order not found"}, status_code=404)
+        return alpaca_order(account.orders[account.by_client_id[client_order_id]])
+
+    @app.get("/v2/stocks/{symbol}/bars")
+    async def alpaca_get_bars(symbol: str, timeframe: str = "1Day", limit: int = 100):
+        bars = generate_bars(symbol, ALPACA_TIMEFRAMES.get(timeframe, "1d"), min(limit, 10000), 150.0)
+        return {
+            "symbol": symbol,
+            "bars": [
+                {"t": str(timestamp) + "Z", "o": float(open_), "h": float(high), "l": float(low), "c": float(close), "v": int(volume)}
+                for timestamp, open_, high, low, close, volume in zip(
+                    bars["timestamp"], bars["open"], bars["high"], bars["low"], bars["close"], bars["volume"]
+                )
+            ],
+        }
+
+    #-------------
+    # Binance
+    #-------------
+
+    def binance_account(key: str) -> FakeAccount:
+        return accounts["binance:" + key]
+
+    def binance_order(order: dict) -> dict:
+        return {
+            "symbol": order["symbol"] + BINANCE_QUOTE,
+            "orderId": order["id"],
+            "clientOrderId": order["client_order_id"],
+            "transactTime": order["time"],
+            "origQty": str(order["qty"]),
+            "executedQty": str(order["qty"]),
+            "cummulativeQuoteQty": str(order["qty"] * order["price"]),
+            "status": "FILLED",
+            "type": order["type"],
+            "side": order["side"].upper(),
+        }
+
+    def signed(request: Request) -> Optional[JSONResponse]:
+        if "signature" not in request.query_params or "timestamp" not in request.query_params:
+            return JSONResponse({"code": -1102, "msg": "Mandatory parameter 'signature' was not sent"}, status_code=400)
+        return None
+
+    @app.get("/api/v3/account")
+    async def binance_get_account(request: Request, key: str = Header(..., alias="X-MBX-APIKEY")):
+        if error := signed(request):
+            return error
+        account = binance_account(key)
+        balances = [{"asset": BINANCE_QUOTE, "free": str(account.cash), "locked": "0"}]
+        balances += [{"asset": symbol, "free": str(quantity), "locked": "0"} for symbol, (quantity, _) in account.positions.items()]
+        return {"balances": balances}
+
+    @app.get("/api/v3/ticker/price")
+    async def binance_get_prices():
+        return [{"symbol": symbol + BINANCE_QUOTE, "price": str(price_of(symbol))} for symbol in sorted(CRYPTO)]
+
+    @app.get("/api/v3/openOrders")
+    async def binance_get_open_orders(request: Request, key: str = Header(..., alias="X-MBX-APIKEY")):
+        # Market orders fill at once, so nothing is ever open
+        return signed(request) or []
+
+    @app.post("/api/v3/order")
+    async def binance_post_order(request: Request, key: str = Header(..., alias="X-MBX-APIKEY")):
+        if error := signed(request):
+            return error
+        params = request.query_params
+        account = binance_account(key)
+        client_id = params.get("newClientOrderId") or uuid.uuid4().hex
+        if client_id in account.by_client_id:
+            return JSONResponse({"code": -2010, "msg": "Duplicate order sent."}, status_code=400)
+        symbol = params.get("symbol", "").removesuffix(BINANCE_QUOTE)
+        side = params.get("side", "").lower()
+        quantity = float(params.get("quantity") or 0)
+        if symbol not in CRYPTO or quantity <= 0 or side not in ("buy", "sell"):
+            return JSONResponse({"code": -1013, "msg": "Invalid order"}, status_code=400)
+        price = price_of(symbol)
+        held = account.positions.get(symbol, (0.0, 0.0))[0]
+        if (side == "buy" and quantity * price > account.cash) or (side == "sell" and quantity > held):
+            return JSONResponse({"code": -2010, "msg": "Account has insufficient balance"}, status_code=400)
+        account.fill(symbol, side, quantity, price)
+        order = {
+            "id": len(account.orders) + 1,
+            "client_order_id": client_id,
+            "symbol": symbol,
+            "side": side,
+            "qty": quantity,
+            "type": params.get("type", "MARKET"),
+            "price": price,
+            "time": int(time.time() * 1000),
+        }
+        account.orders[str(order["id"])] = order
+        account.by_client_id[client_id] = str(order["id"])
+        return binance_order(order)
+
+    @app.get("/api/v3/order")
+    async def binance_get_order(request: Request, origClientOrderId: str, key: str = Header(..., alias="X-MBX-APIKEY")):
+        if error := signed(request):
+            return error
+        account = binance_account(key)
+        if origClientOrderId not in account.by_client_id:
+            return JSONResponse({"code": -2013, "msg": "Order does not exist."}, status_code=400)
+        return binance_order(account.orders[account.by_client_id[origClientOrderId]])
+
+    @app.get("/api/v3/klines")
+    async def binance_get_klines(symbol: str, interval: str = "1d", limit: int = 500):
+        bars = generate_bars(symbol.removesuffix(BINANCE_QUOTE), interval, min(limit, 1000), 30000.0)
+        step = int((bars["timestamp"][1] - bars["timestamp"][0]).astype(int)) * 1000 if len(bars["timestamp"]) > 1 else 60000
+        return [
+            [int(timestamp.astype("datetime64[ms]").astype(int)), str(open_), str(high), str(low), str(close), str(volume),
+             int(timestamp.astype("datetime64[ms]").astype(int)) + step - 1]
+            for timestamp, open_, high, low, close, volume in zip(
+                bars["timestamp"], bars["open"], bars["high"], bars["low"], bars["close"], bars["volume"]
+            )
+        ]
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve a fake Alpaca/Binance API for offline testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--rate-limit", type=int, default=200, help="requests per key per minute before 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(args.rate_limit, args.failure_rate, args.latency), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
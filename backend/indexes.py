@@ -0,0 +1,177 @@
+import asyncio
+import logging
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Every index the backend relies on, by collection. Names are fixed so that
+# re-running the bootstrap is a no-op.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "assets": [
+        IndexModel([("symbol", ASCENDING)], unique=True, name="symbol_unique"),
+        IndexModel([("registry_version", ASCENDING)], name="registry_version"),
+    ],
+    "api_configs": [
+        IndexModel([("user_id", ASCENDING), ("provider", ASCENDING)], unique=True, name="user_provider_unique"),
+    ],
+    "risk_settings": [
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_unique"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "positions": [
+        IndexModel([("user_id", ASCENDING), ("asset_id", ASCENDING)], name="user_asset"),
+        IndexModel([("id", ASCENDING)], name="id"),
+    ],
+    "portfolio_accounts": [
+        IndexModel([("user_id", ASCENDING)], unique=True, name="user_unique"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "portfolio_snapshots": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", DESCENDING)], name="user_timestamp"),
+    ],
+    "signals": [
+        IndexModel([("user_id", ASCENDING), ("is_active", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_active_created_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        IndexModel([("created_by", ASCENDING), ("is_active", ASCENDING), ("asset_id", ASCENDING)], name="created_by_active_asset"),
+        IndexModel([("is_active", ASCENDING), ("created_at", ASCENDING)], name="active_created"),
+    ],
+    "trades": [
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        IndexModel([("id", ASCENDING)], name="id"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("order_id", ASCENDING)], name="order_id"),
+    ],
+    "fired_stops": [
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "alerts": [
+        IndexModel([("user_id", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_read_created_id"),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+    ],
+    "news": [
+        IndexModel([("asset_id", ASCENDING), ("published_at", DESCENDING), ("id", DESCENDING)], name="asset_published_id"),
+        IndexModel([("published_at", DESCENDING), ("id", DESCENDING)], name="published_id"),
+        IndexModel([("url", ASCENDING)], unique=True, name="url_unique"),
+        IndexModel([("title_hash", ASCENDING)], name="title_hash"),
+    ],
+    "sentiment_state": [
+        IndexModel([("asset_id", ASCENDING)], unique=True, name="asset_unique"),
+    ],
+    "sentiment_series": [
+        IndexModel([("asset_id", ASCENDING), ("timestamp", DESCENDING)], unique=True, name="asset_timestamp"),
+    ],
+    "market_data": [
+        IndexModel(
+            [("symbol", ASCENDING), ("interval", ASCENDING), ("timestamp", ASCENDING)],
+            unique=True,
+            name="symbol_interval_timestamp",
+        ),
+    ],
+    "indicator_state": [
+        IndexModel([("symbol", ASCENDING), ("interval", ASCENDING)], unique=True, name="symbol_interval_unique"),
+    ],
+}
+
+
+class QueryShape(NamedTuple):
+    route: str
+    collection: str
+    equality: Tuple[str, ...]
+    sort: Tuple[Tuple[str, int], ...] = ()
+
+
+# The filter/sort shape of each hot query, checked against INDEXES
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("get_user", "users", ("username",)),
+    QueryShape("register_user", "users", ("email",)),
+    QueryShape("create_api_config", "api_configs", ("user_id", "provider")),
+    QueryShape("get_api_configs", "api_configs", ("user_id",)),
+    QueryShape("portfolio_book.load", "portfolio_snapshots", ("user_id",), (("timestamp", -1),)),
+    QueryShape("portfolio_book.load(balance)", "portfolio_accounts", ("user_id",)),
+    QueryShape("portfolio_book.sync", "portfolio_accounts", ("updated_at",)),
+    QueryShape("get_portfolio_history", "portfolio_snapshots", ("user_id",), (("timestamp", -1),)),
+    QueryShape("portfolio_book.load(positions)", "positions", ("user_id",)),
+    QueryShape("portfolio_book.persist_fill", "positions", ("user_id", "asset_id")),
+    QueryShape("portfolio_book.snapshot", "positions", ("user_id", "asset_id")),
+    QueryShape("sync_broker_positions", "positions", ("user_id",)),
+    QueryShape("get_signals", "signals", ("user_id", "is_active"), (("created_at", -1), ("id", -1))),
+    QueryShape("get_signals(all)", "signals", ("user_id",), (("created_at", -1), ("id", -1))),
+    QueryShape("signal_scheduler.publish", "signals", ("created_by", "is_active", "asset_id")),
+    QueryShape("price_monitor.load", "signals", ("is_active",), (("created_at", 1),)),
+    QueryShape("get_trades", "trades", ("user_id",), (("created_at", -1), ("id", -1))),
+    QueryShape("trade_writer.flush", "trades", ("id",)),
+    QueryShape("take_over_orders", "trades", ("status",)),
+    QueryShape("settle_resting_orders", "trades", ("order_id",)),
+    QueryShape("get_alerts", "alerts", ("user_id",), (("created_at", -1), ("id", -1))),
+    QueryShape("get_alerts(unread)", "alerts", ("user_id", "is_read"), (("created_at", -1), ("id", -1))),
+    QueryShape("get_risk_settings", "risk_settings", ("user_id",)),
+    QueryShape("risk_book.refresh", "risk_settings", (), (("updated_at", 1),)),
+    QueryShape("get_news", "news", (), (("published_at", -1), ("id", -1))),
+    QueryShape("get_news(symbol)", "news", ("asset_id",), (("published_at", -1), ("id", -1))),
+    QueryShape("sentiment_pipeline.ingest", "news", ("url",)),
+    QueryShape("sentiment_pipeline.memo", "news", ("title_hash",)),
+    QueryShape("sentiment_pipeline.latest", "sentiment_series", ("asset_id",), (("timestamp", -1),)),
+    QueryShape("sentiment_pipeline.state", "sentiment_state", ("asset_id",)),
+    QueryShape("asset_registry.refresh", "assets", (), (("registry_version", 1),)),
+    QueryShape("bar_store.get_range", "market_data", ("symbol", "interval"), (("timestamp", 1),)),
+    QueryShape("indicator_state.restore", "indicator_state", ("interval", "symbol")),
+]
+
+
+async def ensure_indexes(db, collections: Optional[Sequence[str]] = None):
+    """Create every declared index; safe to run on each startup.
+
+    Each index is created on its own so that one failure (for example a
+    unique index blocked by existing duplicates) is logged without stopping
+    the rest.
+    """
+    names = collections or list(INDEXES)
+
+    async def create(collection: str, index: IndexModel):
+        try:
+            await db[collection].create_indexes([index])
+        except OperationFailure as exc:
+            logger.warning("Could not create index %s.%s: %s", collection, index.document["name"], exc)
+
+    await asyncio.gather(*[create(name, index) for name in names for index in INDEXES[name]])
+
+
+def index_supports(key: Sequence[Tuple[str, int]], shape: QueryShape) -> bool:
+    """True if an index with ``key`` serves ``shape`` without a collection scan or in-memory sort.
+
+    The equality fields must form the index prefix (in any order), followed
+    by the sort fields in order, all in the index direction or all reversed.
+    """
+    key = list(key)
+    fields = [field for field, _ in key]
+    prefix = len(shape.equality)
+    if set(fields[:prefix]) != set(shape.equality):
+        return False
+    if not shape.sort:
+        return prefix > 0
+    tail = list(key[prefix:prefix + len(shape.sort)])
+    if [field for field, _ in tail] != [field for field, _ in shape.sort]:
+        return False
+    same = all(direction == wanted for (_, direction), (_, wanted) in zip(tail, shape.sort))
+    reversed_ = all(direction == -wanted for (_, direction), (_, wanted) in zip(tail, shape.sort))
+    return same or reversed_
+
+
+async def missing_index_report(db, shapes: Sequence[QueryShape] = QUERY_SHAPES) -> List[dict]:
+    """Query shapes that no index actually present in the database supports."""
+    info = {}
+    for collection in {shape.collection for shape in shapes}:
+        info[collection] = await db[collection].index_information()
+    missing = []
+    for shape in shapes:
+        keys = [index["key"] for index in info[shape.collection].values()]
+        if not any(index_supports(key, shape) for key in keys):
+            missing.append(shape._asdict())
+    return missing
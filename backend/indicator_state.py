@@ -0,0 +1,281 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Sequence
+
+import numpy as np
+from pymongo import UpdateOne
+
+from indicators import TIMEFRAMES, bars_matrix
+from market_data import align_end, interval_delta
+
+# Scalar state carried from bar to bar for each symbol
+SCALARS = ("prev_close", "ema_12", "ema_26", "macd_signal", "avg_gain", "avg_loss", "atr_14")
+# Closes kept for the 20-bar SMA and Bollinger band, oldest first
+WINDOW = 20
+
+BarLoader = Callable[[str, int], Awaitable[Dict[str, np.ndarray]]]
+
+
+def empty_state(count: int) -> Dict[str, np.ndarray]:
+    state = {name: np.full(count, np.nan) for name in SCALARS}
+    state["window"] = np.full((count, WINDOW), np.nan)
+    state["bars"] = np.zeros(count, dtype=np.int64)
+    state["timestamp"] = np.full(count, np.datetime64("NaT"), dtype="datetime64[s]")
+    return state
+
+
+def _smooth(state: np.ndarray, value: np.ndarray, alpha: float) -> np.ndarray:
+    # Same recursion as indicators._ewm: seeded with the first real value
+    return np.where(np.isnan(state), value, state + alpha * (value - state))
+
+
+def step(state: Dict[str, np.ndarray], high: np.ndarray, low: np.ndarray, close: np.ndarray) -> Dict[str, np.ndarray]:
+    """Advance every row of ``state`` by one bar in constant time.
+
+    Returns new arrays and leaves ``state`` untouched, so the open bar can be
+    applied provisionally. Rows whose close is NaN have no bar and keep their
+    state. The result matches the last column of ``compute_indicators`` over
+    the full history.
+    """
+    prev_close = state["prev_close"]
+    change = close - prev_close
+    ema_12 = _smooth(state["ema_12"], close, 2.0 / 13)
+    ema_26 = _smooth(state["ema_26"], close, 2.0 / 27)
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+    has_bar = ~np.isnan(close)
+    new = {
+        "prev_close": close,
+        "ema_12": ema_12,
+        "ema_26": ema_26,
+        "macd_signal": _smooth(state["macd_signal"], ema_12 - ema_26, 2.0 / 10),
+        "avg_gain": _smooth(state["avg_gain"], np.clip(change, 0, None), 1.0 / 14),
+        "avg_loss": _smooth(state["avg_loss"], np.clip(-change, 0, None), 1.0 / 14),
+        "atr_14": _smooth(state["atr_14"], true_range, 1.0 / 14),
+    }
+    for name in SCALARS:
+        new[name] = np.where(has_bar, new[name], state[name])
+    shifted = np.concatenate([state["window"][:, 1:], close[:, None]], axis=1)
+    new["window"] = np.where(has_bar[:, None], shifted, state["window"])
+    new["bars"] = state["bars"] + has_bar
+    new["timestamp"] = state["timestamp"]
+    return new
+
+
+def latest(state: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Indicator values for the last applied bar, keyed like ``indicators.latest_values``."""
+    window = state["window"]
+    full = ~np.isnan(window).any(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mid = np.where(full, window.mean(axis=1), np.nan)
+        std = np.where(full, window.std(axis=1), np.nan)
+        rsi = 100 - 100 / (1 + state["avg_gain"] / state["avg_loss"])
+    rsi = np.where((state["avg_loss"] == 0) & (state["avg_gain"] > 0), 100.0, rsi)
+    macd = state["ema_12"] - state["ema_26"]
+    return {
+        "close": state["prev_close"],
+        "sma_20": mid,
+        "ema_12": state["ema_12"],
+        "ema_26": state["ema_26"],
+        "rsi_14": rsi,
+        "macd": macd,
+        "macd_signal": state["macd_signal"],
+        "macd_hist": macd - state["macd_signal"],
+        "bb_mid": mid,
+        "bb_upper": mid + 2 * std,
+        "bb_lower": mid - 2 * std,
+        "atr_14": state["atr_14"],
+        "bars": state["bars"],
+    }
+
+
+def crossings(before: Dict[str, np.ndarray], after: Dict[str, np.ndarray]) -> List[List[str]]:
+    """Indicator events between two ``latest`` snapshots, one list per row."""
+    checks = [
+        ((before["macd_hist"] <= 0) & (after["macd_hist"] > 0), "MACD crossed above its signal line"),
+        ((before["macd_hist"] >= 0) & (after["macd_hist"] < 0), "MACD crossed below its signal line"),
+        ((before["rsi_14"] >= 30) & (after["rsi_14"] < 30), "RSI fell below 30"),
+        ((before["rsi_14"] <= 70) & (after["rsi_14"] > 70), "RSI rose above 70"),
+    ]
+    events = [[] for _ in range(len(after["close"]))]
+    for mask, message in checks:
+        for row in np.flatnonzero(mask):
+            events[row].append(message)
+    return events
+
+
+class StateBook:
+    """Incremental indicator state for every symbol on one interval.
+
+    Each symbol owns one row of a set of preallocated arrays that grow by
+    doubling, so a batch of symbols is advanced with a handful of vector
+    operations instead of a loop over per-symbol objects.
+    """
+
+    def __init__(self, interval: str, capacity: int = 64):
+        self.interval = interval
+        self.rows: Dict[str, int] = {}
+        self.arrays = empty_state(capacity)
+
+    def ensure_rows(self, symbols: Sequence[str]) -> np.ndarray:
+        for symbol in symbols:
+            if symbol not in self.rows:
+                if len(self.rows) == len(self.arrays["bars"]):
+                    grown = empty_state(2 * len(self.rows))
+                    for name, values in self.arrays.items():
+                        grown[name][:len(values)] = values
+                    self.arrays = grown
+                self.rows[symbol] = len(self.rows)
+        return np.array([self.rows[symbol] for symbol in symbols], dtype=np.int64)
+
+    def get(self, rows: np.ndarray) -> Dict[str, np.ndarray]:
+        return {name: values[rows] for name, values in self.arrays.items()}
+
+    def put(self, rows: np.ndarray, state: Dict[str, np.ndarray]):
+        for name, values in state.items():
+            self.arrays[name][rows] = values
+
+    def reset(self, rows: np.ndarray):
+        self.put(rows, empty_state(len(rows)))
+
+
+class IndicatorState:
+    """Per-(symbol, interval) indicator state kept current one bar at a time.
+
+    Evaluating a batch reads only the bars closed since each symbol was last
+    seen (usually one) plus the still-open bar, which is applied
+    provisionally and never committed. Committed state is written to
+    ``db.indicator_state`` so a restart resumes where it left off instead of
+    warming up from the full history again.
+    """
+
+    def __init__(self, db, collection: str = "indicator_state", max_catch_up: int = 500):
+        self.db = db
+        self.collection_name = collection
+        self.max_catch_up = max_catch_up
+        self._books: Dict[str, StateBook] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.evaluations = 0
+        self.bars_applied = 0
+        self.warmups = 0
+        self.restored = 0
+        self.last_evaluation_ms = 0.0
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name]
+
+    async def evaluate(self, interval: str, symbols: Sequence[str], load_bars: BarLoader, warmup: int = 100) -> Dict[str, Any]:
+        """Latest indicator values for ``symbols``, including the open bar.
+
+        ``load_bars(symbol, limit)`` must return the latest ``limit`` bars with
+        the still-open bar last, as ``BarStore.get_bars`` does. Symbols with no
+        usable state are warmed up from ``warmup`` bars. The result is keyed
+        like ``indicators.latest_values`` with an extra ``events`` list per
+        symbol.
+        """
+        if interval not in TIMEFRAMES:
+            interval = "1d"
+        started = time.perf_counter()
+        book = self._books.setdefault(interval, StateBook(interval))
+        lock = self._locks.setdefault(interval, asyncio.Lock())
+        async with lock:
+            unknown = [symbol for symbol in symbols if symbol not in book.rows]
+            if unknown:
+                await self._restore(book, unknown)
+            rows = book.ensure_rows(symbols)
+
+            open_start = np.datetime64(align_end(datetime.utcnow(), interval), "s")
+            step_seconds = int(interval_delta(interval).total_seconds())
+            state = book.get(rows)
+            missed = (open_start - state["timestamp"]).astype("timedelta64[s]").astype(np.int64) // step_seconds - 1
+            stale = np.isnat(state["timestamp"]) | (missed > self.max_catch_up) | (missed < 0)
+            if stale.any():
+                book.reset(rows[stale])
+                state = book.get(rows)
+                self.warmups += int(stale.sum())
+            limits = np.where(stale, warmup, missed + 1)
+
+            series = await asyncio.gather(*[
+                load_bars(symbol, int(limit)) for symbol, limit in zip(symbols, limits)
+            ])
+
+            applied_before = state["bars"]
+            state = self._catch_up(state, series, open_start)
+            book.put(rows, state)
+            await self._persist(interval, symbols, state, state["bars"] > applied_before)
+
+        committed = latest(state)
+        open_bar = bars_matrix([
+            {field: values[-1:] if len(values) and bars["timestamp"][-1] == open_start else values[:0] for field, values in bars.items()}
+            for bars in series
+        ])
+        values = latest(step(state, open_bar["high"][:, -1], open_bar["low"][:, -1], open_bar["close"][:, -1]))
+        values["events"] = crossings(committed, values)
+
+        self.evaluations += 1
+        self.last_evaluation_ms = round((time.perf_counter() - started) * 1000, 2)
+        return values
+
+    def _catch_up(self, state: Dict[str, np.ndarray], series: List[Dict[str, np.ndarray]], open_start: np.datetime64) -> Dict[str, np.ndarray]:
+        # Right-align each symbol's newly closed bars so one step per column
+        # advances all symbols together; shorter rows are NaN-padded no-ops
+        fresh = []
+        for row, bars in enumerate(series):
+            keep = bars["timestamp"] < open_start
+            if not np.isnat(state["timestamp"][row]):
+                keep &= bars["timestamp"] > state["timestamp"][row]
+            fresh.append({field: values[keep] for field, values in bars.items()})
+
+        matrices = bars_matrix(fresh)
+        for column in range(matrices["close"].shape[1]):
+            state = step(state, matrices["high"][:, column], matrices["low"][:, column], matrices["close"][:, column])
+        self.bars_applied += int((~np.isnan(matrices["close"])).sum())
+
+        state["timestamp"] = np.array([
+            bars["timestamp"][-1] if len(bars["timestamp"]) else state["timestamp"][row]
+            for row, bars in enumerate(fresh)
+        ], dtype="datetime64[s]")
+        return state
+
+    async def _restore(self, book: StateBook, symbols: List[str]):
+        docs = await self.collection.find(
+            {"interval": book.interval, "symbol": {"$in": symbols}}, {"_id": 0}
+        ).to_list(length=None)
+        if not docs:
+            return
+        rows = book.ensure_rows([doc["symbol"] for doc in docs])
+        state = empty_state(len(docs))
+        for name in SCALARS:
+            state[name] = np.array([doc[name] for doc in docs], dtype=float)
+        state["window"] = np.array([doc["window"] for doc in docs], dtype=float)
+        state["bars"] = np.array([doc["bars"] for doc in docs], dtype=np.int64)
+        state["timestamp"] = np.array([doc["timestamp"] for doc in docs], dtype="datetime64[s]")
+        book.put(rows, state)
+        self.restored += len(docs)
+
+    async def _persist(self, interval: str, symbols: Sequence[str], state: Dict[str, np.ndarray], changed: np.ndarray):
+        operations = []
+        for row in np.flatnonzero(changed):
+            symbol = symbols[row]
+            doc = {name: float(state[name][row]) for name in SCALARS}
+            doc.update(
+                window=state["window"][row].tolist(),
+                bars=int(state["bars"][row]),
+                timestamp=state["timestamp"][row].astype(datetime),
+                updated_at=datetime.utcnow(),
+            )
+            operations.append(UpdateOne({"symbol": symbol, "interval": interval}, {"$set": doc}, upsert=True))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "symbols": {interval: len(book.rows) for interval, book in self._books.items()},
+            "evaluations": self.evaluations,
+            "bars_applied": self.bars_applied,
+            "warmups": self.warmups,
+            "restored": self.restored,
+            "last_evaluation_ms": self.last_evaluation_ms,
+        }
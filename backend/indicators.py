@@ -0,0 +1,258 @@
+from datetime import timedelta
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+# Every function works on a (symbols x bars) matrix, oldest bar first, and
+# computes all symbols at once. Series shorter than the matrix are
+# left-padded with NaN and simply produce NaN until they have enough data.
+
+SIGNAL_TYPES = np.array(["sell", "hold", "buy"])
+
+# Enough bars for the slowest indicator (MACD 26 + 9) to have settled
+MIN_BARS = 35
+
+# Bars per step of the blocked EWM used on long series
+EWM_BLOCK = 512
+
+TIMEFRAMES = {
+    "1m": "short_term",
+    "5m": "short_term",
+    "15m": "short_term",
+    "1h": "medium_term",
+    "4h": "medium_term",
+    "1d": "long_term",
+}
+
+# How long a signal stays active for each timeframe
+SIGNAL_LIFETIMES = {
+    "short_term": timedelta(hours=4),
+    "medium_term": timedelta(days=2),
+    "long_term": timedelta(days=7),
+}
+
+
+def bars_matrix(series: Sequence[Dict[str, np.ndarray]], fields: Sequence[str] = ("high", "low", "close")) -> Dict[str, np.ndarray]:
+    """Stack per-symbol columnar bars into right-aligned, NaN-padded matrices."""
+    length = max((len(bars["close"]) for bars in series), default=0)
+    matrices = {}
+    for field in fields:
+        matrix = np.full((len(series), length), np.nan)
+        for row, bars in enumerate(series):
+            values = bars[field]
+            if len(values):
+                matrix[row, length - len(values):] = values
+        matrices[field] = matrix
+    return matrices
+
+
+def _ewm(values: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponential smoothing seeded with each row's first value (pandas ``adjust=False``).
+
+    The recursion runs over bars, so each step is one vector operation
+    across every symbol rather than a loop per symbol. Long series with NaN
+    only as left padding (backtests over years of bars) take the blocked
+    closed form instead, one step per ``EWM_BLOCK`` bars.
+    """
+    if values.shape[1] > EWM_BLOCK and alpha < 1:
+        padding = np.isnan(values)
+        leading = np.logical_and.accumulate(padding, axis=1)
+        if not (padding & ~leading).any():
+            return _ewm_blocked(values, alpha, leading)
+    columns = values.T
+    out = np.empty_like(columns)
+    state = columns[0].copy()
+    out[0] = state
+    for step in range(1, len(columns)):
+        current = columns[step]
+        state = np.where(np.isnan(state), current, np.where(np.isnan(current), state, state + alpha * (current - state)))
+        out[step] = state
+    return out.T
+
+
+def _ewm_blocked(values: np.ndarray, alpha: float, leading: np.ndarray) -> np.ndarray:
+    """``_ewm`` for rows whose only NaNs are leading padding.
+
+    Within a block, ``y[i] = decay**(i+1) * y[-1] + alpha * decay**i *
+    cumsum(x[k] / decay**k)``, so each block is a few array operations and
+    only the block-to-block carry is sequential.
+    """
+    rows, length = values.shape
+    decay = 1.0 - alpha
+    first = np.minimum(leading.sum(axis=1), length - 1)
+    seed = values[np.arange(rows), first]
+    # The padding takes the first real value, which leaves the state where it starts
+    filled = np.where(leading, seed[:, None], values)
+    out = np.empty_like(filled)
+    block = min(EWM_BLOCK, max(1, int(600 / -np.log(decay))))
+    powers = decay ** np.arange(block + 1)
+    state = seed
+    for start in range(0, length, block):
+        chunk = filled[:, start:start + block]
+        size = chunk.shape[1]
+        scaled = np.cumsum(chunk / powers[:size], axis=1)
+        out[:, start:start + size] = powers[1:size + 1] * state[:, None] + alpha * powers[:size] * scaled
+        state = out[:, start + size - 1]
+    out[leading] = np.nan
+    return out
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    # NaN until a full window of real values is available
+    filled = np.nan_to_num(values)
+    sums = np.cumsum(filled, axis=1)
+    counts = np.cumsum(~np.isnan(values), axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    return np.where(counts == window, sums, np.nan)
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_sum(values, window) / window
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    return _ewm(values, 2.0 / (span + 1))
+
+
+def wilder(values: np.ndarray, period: int) -> np.ndarray:
+    return _ewm(values, 1.0 / period)
+
+
+def rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    change = np.diff(close, axis=1, prepend=np.nan)
+    missing = np.isnan(change)
+    gains = wilder(np.where(missing, np.nan, np.clip(change, 0, None)), period)
+    losses = wilder(np.where(missing, np.nan, np.clip(-change, 0, None)), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = gains / losses
+        values = 100 - 100 / (1 + rs)
+    # No losses at all means maximum strength rather than NaN
+    return np.where((losses == 0) & (gains > 0), 100.0, values)
+
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    line = ema(close, fast) - ema(close, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(close: np.ndarray, window: int = 20, width: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    mid = sma(close, window)
+    variance = _rolling_sum(close * close, window) / window - mid * mid
+    std = np.sqrt(np.clip(variance, 0, None))
+    return mid, mid + width * std, mid - width * std
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    prev_close = np.roll(close, 1, axis=1)
+    prev_close[:, 0] = np.nan
+    # fmax skips the NaN gap before the first bar instead of propagating it
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    return wilder(true_range(high, low, close), period)
+
+
+def compute_indicators(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> Dict[str, np.ndarray]:
+    macd_line, macd_signal, macd_hist = macd(close)
+    bb_mid, bb_upper, bb_lower = bollinger(close)
+    return {
+        "close": close,
+        "sma_20": sma(close, 20),
+        "ema_12": ema(close, 12),
+        "ema_26": ema(close, 26),
+        "rsi_14": rsi(close),
+        "macd": macd_line,
+        "macd_signal": macd_signal,
+        "macd_hist": macd_hist,
+        "bb_mid": bb_mid,
+        "bb_upper": bb_upper,
+        "bb_lower": bb_lower,
+        "atr_14": atr(high, low, close),
+    }
+
+
+def latest_values(indicators: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """The last bar of each indicator matrix, plus how many bars each row had."""
+    latest = {name: values[:, -1] for name, values in indicators.items()}
+    latest["bars"] = (~np.isnan(indicators["close"])).sum(axis=1)
+    return latest
+
+
+def composite_score(values: Dict[str, np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The weighted component vote in [-1, 1], how far the components agree, and the Bollinger %B.
+
+    Works on arrays of any shape: one value per symbol, or whole
+    (symbols x bars) indicator matrices when replaying history.
+    """
+    close = values["close"]
+    atr_last = np.where(values["atr_14"] > 0, values["atr_14"], np.nan)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trend = np.tanh((values["ema_12"] - values["ema_26"]) / atr_last)
+        momentum = np.tanh(values["macd_hist"] / atr_last * 2)
+        strength = np.clip((values["rsi_14"] - 50) / 30, -1, 1)
+        band_width = values["bb_upper"] - values["bb_lower"]
+        percent_b = np.where(band_width > 0, (close - values["bb_lower"]) / band_width, 0.5)
+    reversion = np.clip(1 - 2 * percent_b, -1, 1)
+
+    components = np.nan_to_num(np.stack([trend, momentum, strength, reversion]))
+    composite = np.tensordot(np.array([0.35, 0.3, 0.2, 0.15]), components, axes=1)
+    agreement = np.abs(np.sign(components).mean(axis=0))
+    return composite, agreement, percent_b
+
+
+def score(latest: Dict[str, np.ndarray], entry_threshold: float = 0.2) -> Dict[str, np.ndarray]:
+    """Turn each symbol's latest indicator values into one signal.
+
+    Four components, each scaled to [-1, 1], vote on direction: EMA 12/26
+    trend and MACD histogram (both in ATR units), RSI distance from 50, and
+    the close's position inside the Bollinger band (mean reversion). The
+    weighted score picks buy/sell/hold; its magnitude and the agreement
+    between components set the confidence. Targets and stops are placed in
+    ATR multiples from the close.
+    """
+    close = latest["close"]
+    composite, agreement, percent_b = composite_score(latest)
+    atr_last = np.where(latest["atr_14"] > 0, latest["atr_14"], np.nan)
+
+    direction = np.where(composite > entry_threshold, 1, np.where(composite < -entry_threshold, -1, 0))
+    confidence = np.clip(0.5 + 0.35 * np.abs(composite) / 0.6 + 0.15 * agreement, 0.5, 0.99)
+    atr_or_pct = np.where(np.isnan(atr_last), close * 0.02, atr_last)
+
+    return {
+        "score": composite,
+        "signal_type": SIGNAL_TYPES[direction + 1],
+        "confidence": np.round(confidence, 2),
+        "price_target": np.round(close + direction * 2.0 * atr_or_pct, 2),
+        "stop_loss": np.round(close - direction * 1.5 * atr_or_pct, 2),
+        "rsi": latest["rsi_14"],
+        "macd_hist": latest["macd_hist"],
+        "percent_b": percent_b,
+        "trend_up": latest["ema_12"] > latest["ema_26"],
+        "valid": latest["bars"] >= MIN_BARS,
+        "events": latest.get("events", [[] for _ in range(len(close))]),
+    }
+
+
+def score_latest(indicators: Dict[str, np.ndarray], entry_threshold: float = 0.2) -> Dict[str, np.ndarray]:
+    return score(latest_values(indicators), entry_threshold)
+
+
+def rationale(symbol: str, scored: Dict[str, np.ndarray], row: int) -> str:
+    trend = "above" if scored["trend_up"][row] else "below"
+    return (
+        f"{symbol}: RSI {scored['rsi'][row]:.0f}, MACD histogram {scored['macd_hist'][row]:+.2f}, "
+        f"EMA12 {trend} EMA26, close at {scored['percent_b'][row]:.0%} of the Bollinger band "
+        f"(composite score {scored['score'][row]:+.2f})."
+    )
+
+
+def timeframe_for(interval: str) -> str:
+    return TIMEFRAMES.get(interval, "medium_term")
+
+
+def signal_lifetime(interval: str) -> timedelta:
+    return SIGNAL_LIFETIMES[timeframe_for(interval)]
@@ -0,0 +1,49 @@
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+
+class Lease:
+    """A named lease in ``db.locks`` that at most one worker holds at a time.
+
+    The holder renews it on every ``acquire``; if the holder stops renewing
+    for ``ttl`` seconds another worker takes it over.
+    """
+
+    def __init__(self, db, name: str, ttl: float = 30.0):
+        self.db = db
+        self.name = name
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.held = False
+
+    async def acquire(self) -> bool:
+        """Take or renew the lease; True while this worker holds it."""
+        now = datetime.utcnow()
+        try:
+            lease = await self.db.locks.find_one_and_update(
+                {"_id": self.name, "$or": [{"owner": self.owner}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expires_at": now + timedelta(seconds=self.ttl)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            held = lease is not None and lease["owner"] == self.owner
+        except DuplicateKeyError:
+            # Held by another worker: the upsert collided with its document
+            held = False
+        if held != self.held:
+            logger.info("%s lease %s by %s", self.name, "acquired" if held else "lost", self.owner)
+        self.held = held
+        return held
+
+    async def release(self):
+        if self.held:
+            await self.db.locks.delete_one({"_id": self.name, "owner": self.owner})
+            self.held = False
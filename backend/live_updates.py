@@ -0,0 +1,321 @@
+import asyncio
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from market_data import BASE_INTERVAL, INTERVALS
+from pubsub import Hub, Subscriber, frame
+
+logger = logging.getLogger(__name__)
+
+# Per-user event channels a client can follow besides market bars, and the
+# frame type each one's items are sent as
+CHANNELS = {"signals": "signal", "alerts": "alert"}
+
+# (symbol, interval) of a bar stream
+Topic = Tuple[str, str]
+# Returns the newest bar record for (symbol, interval), or None
+BarLoader = Callable[[str, str], Awaitable[Optional[dict]]]
+# Filters a list of symbols down to the known ones
+SymbolFilter = Callable[[List[str]], List[str]]
+
+RESYNC = frame("resync", None)
+
+
+def bar_topic(topic: Topic) -> str:
+    return f"bars:{topic[0]}:{topic[1]}"
+
+
+def user_topic(channel: str, user_id: str) -> str:
+    return f"{channel}:{user_id}"
+
+
+class ClientSession(Subscriber):
+    """One WebSocket client: its subscriptions and its queue of pending frames.
+
+    Bar frames are keyed by topic, so while a send is in flight a newer bar
+    replaces the pending one and a slow client gets the latest price rather
+    than a backlog. Signals and alerts queue in order. If the queue
+    overflows, the oldest frames are dropped and the next message starts
+    with a ``resync`` frame telling the client to reload over REST.
+    """
+
+    def __init__(self, user_id: str, send: Callable[[str], Awaitable[None]], maxsize: int = 256):
+        super().__init__(maxsize)
+        self.user_id = user_id
+        self.send = send
+        self.topics: Set[Topic] = set()
+        self.channels: Set[str] = set()
+        self.messages = 0
+
+    def reply(self, kind: str, payload: Any):
+        self.put(frame(kind, payload))
+
+    async def flush_forever(self, send_timeout: float):
+        """Send pending frames as they arrive, each batch as one JSON array.
+
+        Raises ``TimeoutError`` if the client stops reading.
+        """
+        while True:
+            frames = await self.get()
+            if self.overflowed:
+                self.overflowed = False
+                frames.insert(0, RESYNC)
+            # Frames are already encoded; joining them re-serializes nothing
+            async with asyncio.timeout(send_timeout):
+                await self.send("[" + ",".join(frames) + "]")
+            self.messages += 1
+
+
+class LiveUpdates:
+    """Pushes bar updates, signals and alerts to connected WebSocket clients.
+
+    Clients subscribe to (symbol, interval) bar streams and to their own
+    signals and alerts; delivery goes through the ``Hub``. One feed task
+    polls each subscribed topic per ``tick``, however many clients share
+    it. Each symbol's newest ``BASE_INTERVAL`` bar is read first, and the
+    coarser open bars are only re-read when it has moved. Bars are
+    published to this worker only, since every worker polls the topics its
+    own clients watch. Signals and alerts are published by whoever writes
+    them and reach the owner's sessions on any worker through the hub's
+    bridge.
+    """
+
+    def __init__(
+        self,
+        hub: Hub,
+        load_bar: BarLoader,
+        known_symbols: SymbolFilter,
+        tick: float = 2.0,
+        send_timeout: float = 10.0,
+        queue_size: int = 256,
+        max_symbols: int = 100,
+        poll_concurrency: int = 16,
+    ):
+        self.hub = hub
+        self.load_bar = load_bar
+        self.known_symbols = known_symbols
+        self.tick = tick
+        self.send_timeout = send_timeout
+        self.queue_size = queue_size
+        self.max_symbols = max_symbols
+        self._sessions: Set[ClientSession] = set()
+        # Sessions watching each bar topic, and the last bar published on it with its frame
+        self._watchers: Dict[Topic, int] = {}
+        self._last_bars: Dict[Topic, Tuple[dict, str]] = {}
+        self._base: Dict[str, dict] = {}
+        self._poll_slots = asyncio.Semaphore(poll_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.connections = 0
+        self.disconnects: Dict[str, int] = {}
+        self.polls = 0
+        self.bars_published = 0
+        self.events_published = 0
+        # Counters of sessions that have already disconnected
+        self._retired = {"messages": 0, "delivered": 0, "coalesced": 0, "dropped": 0}
+
+    def session(self, user_id: str, send: Callable[[str], Awaitable[None]]) -> ClientSession:
+        return ClientSession(user_id, send, self.queue_size)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._feed_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _feed_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.poll()
+            except Exception:
+                logger.exception("Live update feed poll failed")
+
+    async def poll(self):
+        """Publish every subscribed topic whose bar changed since the last poll."""
+        intervals: Dict[str, Set[str]] = {}
+        for symbol, interval in self._watchers:
+            intervals.setdefault(symbol, set()).add(interval)
+        await asyncio.gather(*[self._poll_symbol(symbol, wanted) for symbol, wanted in intervals.items()])
+        self.polls += 1
+
+    async def _poll_symbol(self, symbol: str, intervals: Set[str]):
+        async with self._poll_slots:
+            base = await self.load_bar(symbol, BASE_INTERVAL)
+            if base is None or base == self._base.get(symbol):
+                # No new base bar, so no coarser open bar can have moved either
+                return
+            self._base[symbol] = base
+            for interval in intervals:
+                bar = base if interval == BASE_INTERVAL else await self.load_bar(symbol, interval)
+                last = self._last_bars.get((symbol, interval))
+                if bar is not None and (last is None or bar != last[0]):
+                    self.publish_bar(symbol, interval, bar)
+
+    def publish_bar(self, symbol: str, interval: str, bar: dict):
+        topic = (symbol, interval)
+        if topic not in self._watchers:
+            return
+        name = bar_topic(topic)
+        text = self.hub.publish(name, "bar", {"symbol": symbol, "interval": interval, **bar}, key=name, bridge=False)
+        self._last_bars[topic] = (bar, text)
+        self.bars_published += 1
+
+    def publish_events(self, channel: str, items: Iterable[dict]):
+        """Publish signal or alert documents, as stored, to their owners on every worker."""
+        kind = CHANNELS[channel]
+        for item in items:
+            item = {key: value for key, value in item.items() if key != "_id"}
+            self.hub.publish(user_topic(channel, item["user_id"]), kind, item)
+            self.events_published += 1
+
+    async def serve(self, session: ClientSession, receive: Callable[[], Awaitable[str]], expires_in: Optional[float] = None) -> str:
+        """Run one connection until it ends; returns ``"closed"``, ``"slow"`` or ``"expired"``.
+
+        Incoming messages are handled as they arrive while a separate task
+        sends pending frames. A client that does not take a message within
+        ``send_timeout`` is disconnected instead of buffering without bound.
+        """
+        self._sessions.add(session)
+        self.connections += 1
+        sender = asyncio.create_task(session.flush_forever(self.send_timeout))
+        receiver = asyncio.create_task(self._receive(session, receive))
+        tasks = {sender, receiver}
+        expiry = None
+        if expires_in is not None:
+            expiry = asyncio.create_task(asyncio.sleep(max(0.0, expires_in)))
+            tasks.add(expiry)
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Unregister before awaiting anything, in case this task is being cancelled
+            self._remove(session)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if expiry in done:
+            reason = "expired"
+        elif sender in done and isinstance(sender.exception(), TimeoutError):
+            reason = "slow"
+        else:
+            reason = "closed"
+        self.disconnects[reason] = self.disconnects.get(reason, 0) + 1
+        return reason
+
+    async def _receive(self, session: ClientSession, receive: Callable[[], Awaitable[str]]):
+        while True:
+            raw = await receive()
+            try:
+                message = json.loads(raw)
+                if not isinstance(message, dict):
+                    raise ValueError("Messages must be JSON objects")
+                self.handle(session, message)
+            except ValueError as exc:
+                session.reply("error", {"detail": str(exc)})
+
+    def handle(self, session: ClientSession, message: dict):
+        """Apply one client message and queue the reply; raises ``ValueError`` for invalid ones.
+
+        ``{"action": "subscribe", "symbols": [...], "interval": "1m", "channels": ["signals", "alerts"]}``
+        adds bar streams and event channels, ``"unsubscribe"`` removes them,
+        and ``"ping"`` answers ``pong``.
+        """
+        action = message.get("action")
+        if action == "ping":
+            session.reply("pong", None)
+            return
+        if action not in ("subscribe", "unsubscribe"):
+            raise ValueError(f"Unknown action {action!r}")
+
+        symbols = message.get("symbols", [])
+        interval = message.get("interval", "1d")
+        channels = message.get("channels", [])
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ValueError("symbols must be a list of strings")
+        if interval not in INTERVALS:
+            raise ValueError(f"interval must be one of {', '.join(INTERVALS)}")
+        if not isinstance(channels, list) or not set(channels) <= set(CHANNELS):
+            raise ValueError(f"channels must be a subset of {', '.join(CHANNELS)}")
+        symbols = list(dict.fromkeys(symbols))
+
+        if action == "unsubscribe":
+            for symbol in symbols:
+                self._unsubscribe(session, (symbol, interval))
+            for channel in channels:
+                session.channels.discard(channel)
+                self.hub.unsubscribe(user_topic(channel, session.user_id), session)
+            session.reply("unsubscribed", {"symbols": symbols, "interval": interval, "channels": channels})
+            return
+
+        found = self.known_symbols(symbols)
+        new_topics = [(symbol, interval) for symbol in found if (symbol, interval) not in session.topics]
+        if len(session.topics) + len(new_topics) > self.max_symbols:
+            raise ValueError(f"At most {self.max_symbols} bar subscriptions per connection")
+        for channel in channels:
+            session.channels.add(channel)
+            self.hub.subscribe(user_topic(channel, session.user_id), session)
+        session.reply("subscribed", {
+            "symbols": found,
+            "interval": interval,
+            "channels": sorted(session.channels),
+            "missing": [symbol for symbol in symbols if symbol not in found],
+        })
+        for topic in new_topics:
+            session.topics.add(topic)
+            self.hub.subscribe(bar_topic(topic), session)
+            self._watchers[topic] = self._watchers.get(topic, 0) + 1
+            if topic in self._last_bars:
+                # Current bar right away rather than at the next change
+                session.put(self._last_bars[topic][1], bar_topic(topic))
+            else:
+                # A topic nobody watched: have the next poll publish it
+                self._base.pop(topic[0], None)
+
+    def _unsubscribe(self, session: ClientSession, topic: Topic):
+        if topic not in session.topics:
+            return
+        session.topics.discard(topic)
+        self.hub.unsubscribe(bar_topic(topic), session)
+        self._watchers[topic] -= 1
+        if not self._watchers[topic]:
+            # Nobody watches it: stop polling and forget the cached bar
+            del self._watchers[topic]
+            self._last_bars.pop(topic, None)
+            if not any(symbol == topic[0] for symbol, _ in self._watchers):
+                self._base.pop(topic[0], None)
+
+    def _remove(self, session: ClientSession):
+        for topic in list(session.topics):
+            self._unsubscribe(session, topic)
+        for channel in session.channels:
+            self.hub.unsubscribe(user_topic(channel, session.user_id), session)
+        self._sessions.discard(session)
+        for key in self._retired:
+            self._retired[key] += getattr(session, key)
+
+    def _total(self, counter: str) -> int:
+        return self._retired[counter] + sum(getattr(session, counter) for session in self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": len(self._sessions),
+            "connections": self.connections,
+            "disconnects": dict(self.disconnects),
+            "bar_topics": len(self._watchers),
+            "polls": self.polls,
+            "bars_published": self.bars_published,
+            "events_published": self.events_published,
+            "messages_sent": self._total("messages"),
+            "frames_sent": self._total("delivered"),
+            "frames_coalesced": self._total("coalesced"),
+            "frames_dropped": self._total("dropped"),
+            "hub": self.hub.stats(),
+        }
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import zlib
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+# numpy loads on first use, so importing the interval helpers stays cheap
+if TYPE_CHECKING:
+    import numpy as np
+
+# Supported bar intervals, finest first. Only BASE_INTERVAL is generated and
+# stored raw; coarser intervals are resampled from it.
+BASE_INTERVAL = "1m"
+
+INTERVALS = {
+    "1m": timedelta(minutes=1),
+    "5m": timedelta(minutes=5),
+    "15m": timedelta(minutes=15),
+    "1h": timedelta(hours=1),
+    "4h": timedelta(hours=4),
+    "1d": timedelta(days=1),
+}
+
+BAR_FIELDS = ("open", "high", "low", "close", "volume")
+
+
+def interval_delta(interval: str) -> timedelta:
+    # Unknown intervals fall back to daily bars, as the route always has
+    return INTERVALS.get(interval, INTERVALS["1d"])
+
+
+def align_end(end: datetime, interval: str) -> datetime:
+    """Floor ``end`` to the start of the bar it falls in."""
+    step = int(interval_delta(interval).total_seconds())
+    epoch = int(end.timestamp()) if end.tzinfo else int((end - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % step)
+
+
+def symbol_seed(symbol: str, interval: str, end: datetime) -> int:
+    return zlib.crc32(f"{symbol}|{interval}|{end.isoformat()}".encode())
+
+
+def generate_bars(
+    symbol: str,
+    interval: str,
+    limit: int,
+    base_price: float,
+    end: Optional[datetime] = None,
+) -> Dict[str, np.ndarray]:
+    """Generate ``limit`` mock OHLCV bars ending at the bar containing ``end``.
+
+    The whole series is built with array operations: closes are a
+    cumulative-product random walk, and open/high/low are derived from it in
+    bulk. The RNG is seeded from (symbol, interval, aligned end), so the same
+    window always yields the same bars. Volatility and volume scale with the
+    bar length so that resampled 1m bars look like native daily ones.
+    """
+    import numpy as np
+
+    end = align_end(end or datetime.utcnow(), interval)
+    delta = interval_delta(interval)
+    rng = np.random.default_rng(symbol_seed(symbol, interval, end))
+    day_fraction = delta / timedelta(days=1)
+    scale = np.sqrt(day_fraction)
+
+    step = np.timedelta64(int(delta.total_seconds()), "s")
+    last = np.datetime64(end, "s")
+    timestamps = last - step * np.arange(limit - 1, -1, -1)
+
+    returns = rng.normal(0, 0.01 * scale, limit)
+    close = np.maximum(0.01, base_price * np.cumprod(1 + returns))
+
+    # Each bar opens near the previous close
+    prev_close = np.empty(limit)
+    prev_close[0] = base_price
+    prev_close[1:] = close[:-1]
+    open_ = np.maximum(0.01, prev_close * (1 + rng.normal(0, 0.002 * scale, limit)))
+
+    wicks = np.abs(rng.normal(0, 0.005 * scale, (2, limit)))
+    high = np.maximum(open_, close) * (1 + wicks[0])
+    low = np.maximum(0.01, np.minimum(open_, close) * (1 - wicks[1]))
+    volume = rng.integers(max(1, int(1000 * day_fraction)), max(2, int(1000000 * day_fraction)), limit)
+
+    return {
+        "timestamp": timestamps,
+        "open": np.round(open_, 2),
+        "high": np.round(high, 2),
+        "low": np.round(low, 2),
+        "close": np.round(close, 2),
+        "volume": volume,
+    }
+
+
+def resample_bars(bars: Dict[str, np.ndarray], interval: str) -> Dict[str, np.ndarray]:
+    """Aggregate ascending bars into ``interval`` buckets.
+
+    Buckets are aligned to the epoch like ``align_end``: first open, max high,
+    min low, last close and summed volume, computed with ``reduceat`` over the
+    bucket boundaries rather than a Python group-by.
+    """
+    import numpy as np
+
+    if not len(bars["timestamp"]):
+        return {key: values[:0] for key, values in bars.items()}
+    step = int(interval_delta(interval).total_seconds())
+    seconds = bars["timestamp"].astype("datetime64[s]").astype(np.int64)
+    buckets = seconds - seconds % step
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return {
+        "timestamp": buckets[starts].astype("datetime64[s]"),
+        "open": bars["open"][starts],
+        "high": np.maximum.reduceat(bars["high"], starts),
+        "low": np.minimum.reduceat(bars["low"], starts),
+        "close": bars["close"][ends],
+        "volume": np.add.reduceat(bars["volume"], starts),
+    }
+
+
+def bars_to_records(bars: Dict[str, np.ndarray]) -> List[dict]:
+    """Convert columnar bars into the per-bar dicts the API returns."""
+    import numpy as np
+
+    timestamps = np.datetime_as_string(bars["timestamp"], unit="s").tolist()
+    columns = [bars[field].tolist() for field in BAR_FIELDS]
+    return [
+        {"timestamp": ts, "open": o, "high": h, "low": l, "close": c, "volume": v}
+        for ts, o, h, l, c, v in zip(timestamps, *columns)
+    ]
+
+
+def bars_to_columns(bars: Dict[str, np.ndarray]) -> Dict[str, list]:
+    """Convert columnar bars into parallel JSON arrays, one per field."""
+    import numpy as np
+
+    columns = {"timestamp": np.datetime_as_string(bars["timestamp"], unit="s").tolist()}
+    columns.update({field: bars[field].tolist() for field in BAR_FIELDS})
+    return columns
@@ -0,0 +1,216 @@
+import asyncio
+import importlib
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSpec(NamedTuple):
+    """Where a worker finds a model: ``loader`` is ``"module:function"``, called once per worker."""
+    name: str
+    loader: str
+    args: Tuple = ()
+    method: str = "predict"
+
+
+# Models loaded in this worker process, by name
+_worker_models: Dict[str, Any] = {}
+
+
+def _load_models(specs: List[ModelSpec]):
+    for spec in specs:
+        module_name, function_name = spec.loader.split(":")
+        loader = getattr(importlib.import_module(module_name), function_name)
+        _worker_models[spec.name] = (loader(*spec.args), spec.method)
+
+
+def _warm() -> int:
+    # Occupies a worker briefly so every process gets started and loaded
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def _predict(name: str, features: np.ndarray) -> np.ndarray:
+    model, method = _worker_models[name]
+    return np.asarray(getattr(model, method)(features))
+
+
+class MicroBatcher:
+    """Collects single-row requests for one model into vectorized calls.
+
+    A batch is sent once it holds ``max_batch`` rows or its oldest row has
+    waited ``max_wait`` seconds. At most ``max_in_flight`` batches run at
+    once (one per worker), so under load rows queue up and the next batch is
+    bigger rather than the pool being flooded with tiny calls.
+    """
+
+    def __init__(self, pool: "ModelPool", name: str, max_batch: int, max_wait: float, max_in_flight: int):
+        self.pool = pool
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[np.ndarray, asyncio.Future, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._tasks: set = set()
+        self.requests = 0
+        self.batches = 0
+        self.rows = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.latencies = deque(maxlen=2048)
+
+    def submit(self, features: np.ndarray) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((features, future, time.perf_counter()))
+        self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[np.ndarray, asyncio.Future, float]]):
+        async with self._slots:
+            features = np.stack([row for row, _, _ in batch])
+            started = time.perf_counter()
+            try:
+                results = await self.pool.run(self.name, features)
+            except Exception as exc:
+                self.failures += 1
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+            finished = time.perf_counter()
+            self.busy_seconds += finished - started
+            self.batches += 1
+            self.rows += len(batch)
+            for (_, future, queued_at), result in zip(batch, results):
+                self.latencies.append(finished - queued_at)
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.array(self.latencies) * 1000
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0.0, 0.0, 0.0]
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "failures": self.failures,
+            "queued": len(self._pending),
+            "avg_batch_size": round(self.rows / self.batches, 1) if self.batches else 0.0,
+            "rows_per_busy_second": round(self.rows / self.busy_seconds, 1) if self.busy_seconds else 0.0,
+            "latency_ms": {
+                "p50": round(float(percentiles[0]), 2),
+                "p95": round(float(percentiles[1]), 2),
+                "p99": round(float(percentiles[2]), 2),
+            },
+        }
+
+
+class ModelPool:
+    """Warm worker processes that each load every registered model once.
+
+    Handlers call ``await predict(name, rows)``; rows from concurrent callers
+    are merged by a per-model ``MicroBatcher`` into one ``predict`` call in a
+    worker, so the event loop never runs inference itself. If a worker
+    dies, the batches it broke fail and the pool is replaced with fresh
+    workers for the calls that follow.
+    """
+
+    def __init__(self, workers: int = 2, max_batch: int = 256, max_wait: float = 0.005):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._specs: Dict[str, ModelSpec] = {}
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.started_at: Optional[float] = None
+        self.restarts = 0
+
+    def register(self, spec: ModelSpec):
+        if self._executor is not None:
+            raise RuntimeError("Models must be registered before the pool starts")
+        self._specs[spec.name] = spec
+
+    async def start(self):
+        if self._executor is not None:
+            return
+        self._executor = self._new_executor()
+        self._batchers = {
+            name: MicroBatcher(self, name, self.max_batch, self.max_wait, self.workers) for name in self._specs
+        }
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[loop.run_in_executor(self._executor, _warm) for _ in range(self.workers)])
+        self.started_at = time.monotonic()
+        logger.info("Model pool warm: %d workers (%d processes) with %s", self.workers, len(set(pids)), sorted(self._specs))
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_load_models, initargs=(list(self._specs.values()),)
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, name: str, features: np.ndarray) -> np.ndarray:
+        """Run one already-batched call in a worker."""
+        executor = self._executor
+        if executor is None:
+            raise RuntimeError("Model pool is not running")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, _predict, name, features)
+        except BrokenProcessPool:
+            # Every batch in flight on the broken pool lands here; replace it once
+            if self._executor is executor:
+                logger.error("Model pool worker died, restarting %d workers", self.workers)
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                self.restarts += 1
+            raise
+
+    async def predict(self, name: str, rows: np.ndarray) -> np.ndarray:
+        """Predictions for a 2-D array of feature rows, batched with other callers.
+
+        The first call starts the pool, so a process that never runs a
+        model never spawns workers. A pool that was shut down stays down.
+        """
+        if self._executor is None and self.started_at is None:
+            await self.start()
+        if name not in self._batchers:
+            raise KeyError(f"Unknown model {name}")
+        batcher = self._batchers[name]
+        return np.stack(await asyncio.gather(*[batcher.submit(row) for row in rows]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self._executor is not None,
+            "restarts": self.restarts,
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1) if self.started_at else 0.0,
+            "models": {name: batcher.stats() for name, batcher in self._batchers.items()},
+        }
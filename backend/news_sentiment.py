@@ -0,0 +1,325 @@
+import asyncio
+import hashlib
+import math
+import re
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from indicators import SIGNAL_TYPES
+
+MODEL_NAME = "news_sentiment"
+
+
+def title_hash(title: str) -> str:
+    """Content hash of a headline; syndicated copies differing only in case, spacing or punctuation share it."""
+    normalized = " ".join(re.sub(r"[^\w\s]", " ", title.lower()).split())
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+class HeadlineScorer:
+    """TextBlob polarity (-1 to 1) for a batch of headlines; loaded once per pool worker."""
+
+    def __init__(self):
+        from textblob import TextBlob
+        self._blob = TextBlob
+
+    def score(self, titles: np.ndarray) -> np.ndarray:
+        return np.array([self._blob(str(title)).sentiment.polarity for title in titles])
+
+
+def load_scorer() -> HeadlineScorer:
+    return HeadlineScorer()
+
+
+def bucket_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class DecayedSentiment:
+    """Importance-weighted sentiment mean where each item's weight halves every ``half_life``.
+
+    Sums are kept relative to the newest item seen (``ref``), so late
+    arrivals are discounted by their age instead of being dropped, and no
+    term ever grows without bound.
+    """
+
+    __slots__ = ("ref", "weighted_sum", "weight_sum", "items")
+
+    def __init__(self, ref: Optional[datetime] = None, weighted_sum: float = 0.0, weight_sum: float = 0.0, items: int = 0):
+        self.ref = ref
+        self.weighted_sum = weighted_sum
+        self.weight_sum = weight_sum
+        self.items = items
+
+    def add(self, published_at: datetime, score: float, importance: float, half_life: timedelta):
+        if self.ref is None:
+            self.ref = published_at
+        if published_at > self.ref:
+            factor = math.pow(0.5, (published_at - self.ref) / half_life)
+            self.weighted_sum *= factor
+            self.weight_sum *= factor
+            self.ref = published_at
+        weight = importance * math.pow(0.5, (self.ref - published_at) / half_life)
+        self.weighted_sum += weight * score
+        self.weight_sum += weight
+        self.items += 1
+
+    @property
+    def sentiment(self) -> float:
+        return self.weighted_sum / self.weight_sum if self.weight_sum > 0 else 0.0
+
+    def weight_at(self, moment: datetime, half_life: timedelta) -> float:
+        """Total remaining weight at ``moment``; near zero means the news has gone quiet."""
+        if self.ref is None:
+            return 0.0
+        return self.weight_sum * math.pow(0.5, max(timedelta(0), moment - self.ref) / half_life)
+
+
+class SentimentPipeline:
+    """Scores news headlines in batches and keeps a decayed sentiment series per asset.
+
+    Headlines are deduplicated by ``title_hash`` before scoring: first
+    against an in-process LRU, then against items already stored in
+    ``db.news``, and only the remaining unique titles go to the model pool,
+    where concurrent batches are merged into single worker calls. Items are
+    written with one bulk upsert keyed by URL, so re-ingesting a feed only
+    refreshes it. Each asset's running ``DecayedSentiment`` lives in
+    ``db.sentiment_state``; new items are added to it by compare-and-set on
+    the row's ``version``, so workers ingesting the same asset retry on each
+    other's state instead of overwriting it. The state is also snapshotted
+    into ``db.sentiment_series`` once per hour bucket, where a bucket only
+    moves forward to a state with more items. ``current`` re-reads the
+    state rows in one query.
+    """
+
+    def __init__(self, db, pool, half_life: timedelta = timedelta(hours=6), memo_size: int = 50000):
+        self.db = db
+        self.pool = pool
+        self.half_life = half_life
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, float]" = OrderedDict()
+        self._states: Dict[str, DecayedSentiment] = {}
+        # Stored version each state was read or written at; 0 if it has no row yet
+        self._versions: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+        self.items = 0
+        self.memo_hits = 0
+        self.stored_hits = 0
+        self.scored = 0
+        self.batches = 0
+
+    async def ingest(self, items: Sequence[dict]) -> List[dict]:
+        """Score, store and aggregate news items; returns them with ``sentiment_score`` filled in.
+
+        Items need ``asset_id``, ``title``, ``source``, ``url``, ``importance``
+        and ``published_at``; an existing ``id`` is kept for new rows.
+        """
+        if not items:
+            return []
+        hashes = [title_hash(item["title"]) for item in items]
+        scores = await self._scores(dict(zip(hashes, (item["title"] for item in items))))
+
+        now = datetime.utcnow()
+        scored_items = []
+        operations = []
+        for item, digest in zip(items, hashes):
+            fields = {
+                **{key: value for key, value in item.items() if key not in ("id", "_id")},
+                "title_hash": digest,
+                "sentiment_score": round(scores[digest], 4),
+                "analyzed_at": now,
+            }
+            new_id = item.get("id") or str(uuid.uuid4())
+            operations.append(UpdateOne({"url": item["url"]}, {"$set": fields, "$setOnInsert": {"id": new_id}}, upsert=True))
+            scored_items.append({**fields, "id": new_id})
+        result = await self.db.news.bulk_write(operations, ordered=False)
+
+        # URLs that already existed keep their original id
+        updated = [item for index, item in enumerate(scored_items) if index not in result.upserted_ids]
+        if updated:
+            ids = {}
+            async for row in self.db.news.find({"url": {"$in": [item["url"] for item in updated]}}, {"_id": 0, "url": 1, "id": 1}):
+                ids[row["url"]] = row["id"]
+            for item in updated:
+                item["id"] = ids.get(item["url"], item["id"])
+
+        # Only items seen for the first time count towards the aggregate
+        await self._aggregate([item for index, item in enumerate(scored_items) if index in result.upserted_ids])
+        self.items += len(items)
+        self.batches += 1
+        return scored_items
+
+    async def _scores(self, titles: Dict[str, str]) -> Dict[str, float]:
+        scores = {}
+        for digest in titles:
+            if digest in self._memo:
+                self._memo.move_to_end(digest)
+                scores[digest] = self._memo[digest]
+        self.memo_hits += len(scores)
+
+        unknown = [digest for digest in titles if digest not in scores]
+        if unknown:
+            async for row in self.db.news.find(
+                {"title_hash": {"$in": unknown}}, {"_id": 0, "title_hash": 1, "sentiment_score": 1}
+            ):
+                if row["title_hash"] not in scores:
+                    scores[row["title_hash"]] = row["sentiment_score"]
+                    self.stored_hits += 1
+
+        missing = [digest for digest in titles if digest not in scores]
+        if missing:
+            results = await self.pool.predict(MODEL_NAME, np.array([titles[digest] for digest in missing], dtype=object))
+            scores.update(zip(missing, (float(value) for value in results)))
+            self.scored += len(missing)
+
+        for digest, value in scores.items():
+            self._memo[digest] = value
+            self._memo.move_to_end(digest)
+        while len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return scores
+
+    async def _aggregate(self, items: Iterable[dict]):
+        by_asset: Dict[str, List[dict]] = {}
+        for item in items:
+            by_asset.setdefault(item["asset_id"], []).append(item)
+
+        async with self._lock:
+            await self._load_states([asset_id for asset_id in by_asset if asset_id not in self._versions])
+            operations = []
+            for asset_id, asset_items in by_asset.items():
+                snapshots = await self._apply(asset_id, sorted(asset_items, key=lambda item: item["published_at"]))
+                for bucket, snapshot in snapshots.items():
+                    operations.append(UpdateOne(
+                        {"asset_id": asset_id, "timestamp": bucket, "items": {"$lt": snapshot["items"]}},
+                        {"$set": {**snapshot, "updated_at": datetime.utcnow()}},
+                        upsert=True
+                    ))
+            if operations:
+                try:
+                    await self.db.sentiment_series.bulk_write(operations, ordered=False)
+                except BulkWriteError as exc:
+                    # A bucket another worker already moved past this state keeps its row
+                    if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                        raise
+
+    async def _apply(self, asset_id: str, items: List[dict]) -> Dict[datetime, dict]:
+        """Add items, in time order, to the asset's stored state; returns the snapshot for each hour bucket."""
+        while True:
+            if asset_id not in self._versions:
+                await self._load_states([asset_id])
+            version = self._versions[asset_id]
+            base = self._states.get(asset_id)
+            state = DecayedSentiment(base.ref, base.weighted_sum, base.weight_sum, base.items) if base else DecayedSentiment()
+            # Each bucket keeps the state as of its last item, so the stored series shows how it moved
+            snapshots = {}
+            for item in items:
+                state.add(item["published_at"], item["sentiment_score"], item.get("importance", 1.0), self.half_life)
+                snapshots[bucket_start(item["published_at"])] = {
+                    "sentiment": round(state.sentiment, 4),
+                    "ref": state.ref,
+                    "weighted_sum": state.weighted_sum,
+                    "weight_sum": state.weight_sum,
+                    "items": state.items,
+                }
+            fields = {"ref": state.ref, "weighted_sum": state.weighted_sum, "weight_sum": state.weight_sum, "items": state.items}
+            if version == 0:
+                try:
+                    await self.db.sentiment_state.insert_one({"asset_id": asset_id, **fields, "version": 1})
+                    written = True
+                except DuplicateKeyError:
+                    written = False
+            else:
+                result = await self.db.sentiment_state.update_one(
+                    {"asset_id": asset_id, "version": version}, {"$set": {**fields, "version": version + 1}}
+                )
+                written = result.matched_count == 1
+            if written:
+                self._states[asset_id] = state
+                self._versions[asset_id] = version + 1
+                return snapshots
+            # Another worker added items first: start again from its state
+            del self._versions[asset_id]
+
+    async def _load_states(self, asset_ids: List[str]):
+        """Read each asset's stored state; one without a state row starts from its latest series row."""
+        if not asset_ids:
+            return
+        found = set()
+        async for doc in self.db.sentiment_state.find({"asset_id": {"$in": asset_ids}}, {"_id": 0}):
+            self._states[doc["asset_id"]] = DecayedSentiment(doc["ref"], doc["weighted_sum"], doc["weight_sum"], doc["items"])
+            self._versions[doc["asset_id"]] = doc["version"]
+            found.add(doc["asset_id"])
+        missing = [asset_id for asset_id in asset_ids if asset_id not in found]
+
+        async def latest(asset_id: str):
+            return await self.db.sentiment_series.find_one({"asset_id": asset_id}, sort=[("timestamp", -1)])
+
+        for asset_id, doc in zip(missing, await asyncio.gather(*[latest(asset_id) for asset_id in missing])):
+            if doc:
+                self._states[asset_id] = DecayedSentiment(doc["ref"], doc["weighted_sum"], doc["weight_sum"], doc["items"])
+            else:
+                self._states.pop(asset_id, None)
+            self._versions[asset_id] = 0
+
+    async def current(self, asset_ids: Sequence[str], at: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Latest stored decayed sentiment and remaining weight for each asset (0 for assets with no news)."""
+        at = at or datetime.utcnow()
+        async with self._lock:
+            await self._load_states(list(asset_ids))
+        states = [self._states.get(asset_id) for asset_id in asset_ids]
+        return {
+            "sentiment": np.array([state.sentiment if state else 0.0 for state in states]),
+            "weight": np.array([state.weight_at(at, self.half_life) if state else 0.0 for state in states]),
+            "items": np.array([state.items if state else 0 for state in states]),
+        }
+
+    async def series(self, asset_ids: Sequence[str], since: datetime) -> List[dict]:
+        return await self.db.sentiment_series.find(
+            {"asset_id": {"$in": list(asset_ids)}, "timestamp": {"$gte": since}},
+            {"_id": 0, "asset_id": 1, "timestamp": 1, "sentiment": 1, "items": 1}
+        ).sort("timestamp", 1).to_list(length=None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "batches": self.batches,
+            "memo_size": len(self._memo),
+            "memo_hits": self.memo_hits,
+            "stored_hits": self.stored_hits,
+            "scored": self.scored,
+            "assets_tracked": len(self._states),
+            "half_life_hours": self.half_life / timedelta(hours=1),
+        }
+
+
+def score(inputs: Dict[str, np.ndarray], threshold: float = 0.15, min_weight: float = 0.5) -> Dict[str, Any]:
+    """Signals from each asset's decayed news sentiment; too little recent news means hold."""
+    sentiment = inputs["sentiment"]
+    close = inputs["close"]
+    informed = inputs["weight"] >= min_weight
+    direction = np.where(informed & (sentiment > threshold), 1, np.where(informed & (sentiment < -threshold), -1, 0))
+    atr = np.where(inputs["atr"] > 0, inputs["atr"], close * 0.02)
+    return {
+        "sentiment": sentiment,
+        "items": inputs["items"],
+        "signal_type": SIGNAL_TYPES[direction + 1],
+        "confidence": np.round(np.clip(0.5 + np.abs(sentiment) * np.minimum(1.0, inputs["weight"] / 4), 0.5, 0.99), 2),
+        "price_target": np.round(close + direction * 2.0 * atr, 2),
+        "stop_loss": np.round(close - direction * 1.5 * atr, 2),
+        "valid": ~np.isnan(close),
+        "events": [[] for _ in range(len(close))],
+    }
+
+
+def rationale(symbol: str, scored: Dict[str, Any], row: int) -> str:
+    return (
+        f"{symbol}: news sentiment {scored['sentiment'][row]:+.2f} "
+        f"(time-decayed over {int(scored['items'][row])} headlines)."
+    )
@@ -0,0 +1,438 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from leases import Lease
+
+logger = logging.getLogger(__name__)
+
+# Given a user, a provider and the ids of their orders resting there, returns
+# the ids the broker no longer holds open, once their fills are in the book
+OrderSettler = Callable[[str, str, List[str]], Awaitable[Iterable[str]]]
+
+# Latency histogram bucket upper bounds, in microseconds
+LATENCY_BOUNDS_US = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+
+class RiskRejected(Exception):
+    """An order failed a pre-trade check; ``rule`` names the check."""
+
+    def __init__(self, rule: str, detail: str):
+        super().__init__(detail)
+        self.rule = rule
+        self.detail = detail
+
+
+class OrdersElsewhere(Exception):
+    """This worker does not own the order path; another worker takes orders."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Orders are served by another worker")
+        self.retry_after = retry_after
+
+
+class RiskLimits(NamedTuple):
+    """A user's ``RiskSettings`` as fractions of portfolio value, ready for the check."""
+    max_position: float
+    max_loss: float
+    stop: float
+    trailing: bool = False
+
+
+class OrderCheck(NamedTuple):
+    """An order that passed the check; its exposure stays reserved until ``RiskBook.release``."""
+    user_id: str
+    asset_id: str
+    quantity: float  # signed: negative sells
+    cash: float  # reserved for a buy
+    stop_price: float
+    checked_at: float
+
+
+def limits_from_settings(settings: dict) -> RiskLimits:
+    stop = settings.get("trailing_stop_pct") if settings.get("trailing_stop_loss") else None
+    return RiskLimits(
+        max_position=settings["max_position_size"] / 100,
+        max_loss=settings["max_loss_per_trade"] / 100,
+        stop=(stop or settings["default_stop_loss"]) / 100,
+        trailing=bool(stop),
+    )
+
+
+class LatencyHistogram:
+    """Counts per fixed latency bucket, plus percentiles over the most recent samples."""
+
+    def __init__(self, bounds_us=LATENCY_BOUNDS_US, recent: int = 2048):
+        self.bounds_us = bounds_us
+        self.counts = [0] * (len(bounds_us) + 1)
+        self.recent: Deque[float] = deque(maxlen=recent)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        micros = seconds * 1e6
+        self.counts[bisect.bisect_left(self.bounds_us, micros)] += 1
+        self.recent.append(micros)
+        self.count += 1
+        self.total += micros
+
+    def stats(self) -> Dict[str, Any]:
+        import numpy as np
+
+        percentiles = np.percentile(np.array(self.recent), [50, 95, 99]) if self.recent else [0.0, 0.0, 0.0]
+        labels = [str(bound) for bound in self.bounds_us] + ["+Inf"]
+        return {
+            "count": self.count,
+            "avg_us": round(self.total / self.count, 1) if self.count else 0.0,
+            "latency_us": {
+                "p50": round(float(percentiles[0]), 1),
+                "p95": round(float(percentiles[1]), 1),
+                "p99": round(float(percentiles[2]), 1),
+            },
+            # Non-cumulative: orders whose latency fell at or under each bound and above the previous one
+            "buckets_us": dict(zip(labels, self.counts)),
+        }
+
+
+class RiskBook:
+    """Pre-trade risk checks against cached settings and live positions.
+
+    Every user's ``RiskSettings`` are loaded at startup and kept current:
+    writes through this worker apply at once, and a background refresh
+    picks up other workers' writes by ``updated_at``. ``check`` itself is
+    plain arithmetic on those limits and the ``PortfolioBook`` account, so
+    an order never waits on the database to be checked.
+
+    Exposure of orders that passed but are not filled yet stays reserved
+    until ``release``. So concurrent orders cannot each pass against the
+    same headroom. An order the broker only accepted (a resting limit
+    order) keeps its unfilled part reserved through ``hold``; each refresh
+    asks ``settle`` which resting orders have closed, and releases those.
+    Until then a partial fill that a positions sync already brought into
+    the book is counted twice, never missed.
+
+    Reservations and the book are per process, so only one worker takes
+    orders: the one holding the ``order_path`` lease, renewed with every
+    refresh. Others raise ``OrdersElsewhere``. ``entrypoint.sh`` runs that
+    worker as a process of its own, and nginx sends it every order; the
+    API workers run with ``ORDER_PATH_ENABLED=false``. The lease keeps a
+    second order process (another host, or a restart overlapping the old
+    one) from taking orders at the same time. A worker that takes over
+    runs ``on_takeover`` first, to bring its book up to date. The check
+    never waits on the database, but a user's first order still waits for
+    their account to load. ``accept_orders=False`` keeps a worker out of
+    the order path entirely.
+    """
+
+    def __init__(
+        self,
+        db,
+        default: Callable[[str], dict],
+        refresh_interval: float = 5.0,
+        accept_orders: bool = True,
+        on_takeover: Optional[Callable[[], Awaitable[Any]]] = None,
+        settle: Optional[OrderSettler] = None,
+    ):
+        self.db = db
+        self.default = default
+        self.refresh_interval = refresh_interval
+        self.accept_orders = accept_orders
+        self.on_takeover = on_takeover
+        self.settle = settle
+        self.lease = Lease(db, "order_path", ttl=max(30.0, 3 * refresh_interval))
+        self.owns_orders = False
+        self._limits: Dict[str, RiskLimits] = {}
+        self._seen: Optional[datetime] = None
+        self._default_limits: Optional[RiskLimits] = None
+        # (user_id, asset_id) -> signed quantity of orders in flight; user_id -> cash they hold
+        self._pending_quantity: Dict[Tuple[str, str], float] = {}
+        self._pending_cash: Dict[str, float] = {}
+        # order id -> (provider, reservation) of orders resting at the broker
+        self._resting: Dict[str, Tuple[str, OrderCheck]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.checks = 0
+        self.rejections: Dict[str, int] = {}
+        self.check_latency = LatencyHistogram()
+        self.submit_latency = LatencyHistogram()
+
+    async def load(self):
+        self._limits.clear()
+        async for settings in self.db.risk_settings.find():
+            self._apply(settings)
+        logger.info("Risk book loaded settings for %d users", len(self._limits))
+        await self.claim()
+
+    async def claim(self) -> bool:
+        """Take or renew the order-path lease; True while this worker takes orders."""
+        if not self.accept_orders:
+            return False
+        held = await self.lease.acquire()
+        if held and not self.owns_orders and self.on_takeover is not None:
+            await self.on_takeover()
+        self.owns_orders = held
+        return held
+
+    def require_owner(self):
+        if not self.owns_orders:
+            raise OrdersElsewhere(self.lease.ttl)
+
+    async def refresh(self):
+        """Apply settings written by other workers since the last load or refresh."""
+        query = {"updated_at": {"$gt": self._seen}} if self._seen else {}
+        async for settings in self.db.risk_settings.find(query):
+            self._apply(settings)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.owns_orders = False
+        await self.lease.release()
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.claim()
+                await self.refresh()
+                if self.owns_orders:
+                    await self.settle_resting()
+            except Exception:
+                logger.exception("Risk settings refresh failed")
+
+    def set(self, settings: dict):
+        """Apply a user's settings as just written."""
+        self._apply(settings)
+
+    def _apply(self, settings: dict):
+        self._limits[settings["user_id"]] = limits_from_settings(settings)
+        updated_at = settings.get("updated_at")
+        if updated_at is not None and (self._seen is None or updated_at > self._seen):
+            self._seen = updated_at
+
+    def limits(self, user_id: str) -> RiskLimits:
+        limits = self._limits.get(user_id)
+        if limits is None:
+            if self._default_limits is None:
+                self._default_limits = limits_from_settings(self.default(user_id))
+            limits = self._default_limits
+        return limits
+
+    def check(self, account, asset_id: str, side: str, quantity: float, price: float,
+              stop_price: Optional[float] = None) -> OrderCheck:
+        """Check one order against the account; raises ``RiskRejected`` or reserves its exposure.
+
+        ``account`` is the user's ``portfolio.Account``. Orders that only
+        reduce a position always pass the size and loss limits.
+        """
+        self.require_owner()
+        started = time.perf_counter()
+        self.checks += 1
+        try:
+            user_id = account.user_id
+            limits = self.limits(user_id)
+            signed = quantity if side == "buy" else -quantity
+            holding = account.holdings.get(asset_id)
+            held = (holding.quantity if holding is not None else 0.0) + self._pending_quantity.get((user_id, asset_id), 0.0)
+            after = held + signed
+            equity = account.cash + account.market_value
+            cash = quantity * price if side == "buy" else 0.0
+            if stop_price is None:
+                stop_price = price * (1 - limits.stop) if signed > 0 else price * (1 + limits.stop)
+
+            if quantity <= 0 or price <= 0:
+                self._reject("invalid", "Quantity and price must be positive")
+            if equity <= 0:
+                self._reject("equity", "Portfolio has no value to risk")
+            if abs(after) > abs(held):
+                if abs(after) * price > limits.max_position * equity:
+                    self._reject(
+                        "max_position_size",
+                        f"Position would be {abs(after) * price / equity:.2%} of the portfolio, over the {limits.max_position:.2%} limit",
+                    )
+                loss = (abs(after) - abs(held)) * abs(price - stop_price)
+                if loss > limits.max_loss * equity:
+                    self._reject(
+                        "max_loss_per_trade",
+                        f"Loss at the stop would be {loss / equity:.2%} of the portfolio, over the {limits.max_loss:.2%} limit",
+                    )
+            if cash > account.cash - self._pending_cash.get(user_id, 0.0):
+                self._reject("cash", "Not enough cash for the order")
+
+            check = OrderCheck(user_id, asset_id, signed, cash, round(stop_price, 8), started)
+            self._reserve(check)
+        finally:
+            self.check_latency.record(time.perf_counter() - started)
+        return check
+
+    def _reserve(self, check: OrderCheck):
+        key = (check.user_id, check.asset_id)
+        self._pending_quantity[key] = self._pending_quantity.get(key, 0.0) + check.quantity
+        if check.cash:
+            self._pending_cash[check.user_id] = self._pending_cash.get(check.user_id, 0.0) + check.cash
+
+    def _reject(self, rule: str, detail: str):
+        self.rejections[rule] = self.rejections.get(rule, 0) + 1
+        raise RiskRejected(rule, detail)
+
+    def release(self, check: OrderCheck, submitted: bool = True):
+        """Drop the order's reservation, once it is filled into the book or has failed."""
+        key = (check.user_id, check.asset_id)
+        remaining = self._pending_quantity.get(key, 0.0) - check.quantity
+        if abs(remaining) < 1e-12:
+            self._pending_quantity.pop(key, None)
+        else:
+            self._pending_quantity[key] = remaining
+        if check.cash:
+            cash = self._pending_cash.get(check.user_id, 0.0) - check.cash
+            if cash < 1e-9:
+                self._pending_cash.pop(check.user_id, None)
+            else:
+                self._pending_cash[check.user_id] = cash
+        if submitted:
+            self.submit_latency.record(time.perf_counter() - check.checked_at)
+
+    def hold(self, check: OrderCheck, filled: float, provider: str, order_id: str):
+        """Release the filled part of an order the broker accepted, and keep the rest reserved while it rests."""
+        share = min(filled / abs(check.quantity), 1.0)
+        self.release(check._replace(quantity=check.quantity * share, cash=check.cash * share))
+        self._resting[order_id] = (provider, check._replace(quantity=check.quantity * (1 - share), cash=check.cash * (1 - share)))
+
+    def resume(self, trade: dict):
+        """Reserve a ``Trade`` left resting by a previous owner of the order path."""
+        if trade["order_id"] in self._resting:
+            return
+        quantity = float(trade["quantity"])
+        buy = trade["side"] == "buy"
+        check = OrderCheck(
+            trade["user_id"], trade["asset_id"], quantity if buy else -quantity,
+            quantity * float(trade["price"]) if buy else 0.0, 0.0, time.perf_counter(),
+        )
+        self._reserve(check)
+        self._resting[trade["order_id"]] = (trade["provider"], check)
+
+    async def settle_resting(self):
+        """Release the reservations of resting orders the broker has filled or cancelled since."""
+        if self.settle is None or not self._resting:
+            return
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        for order_id, (provider, check) in self._resting.items():
+            groups.setdefault((check.user_id, provider), []).append(order_id)
+        results = await asyncio.gather(
+            *[self.settle(user_id, provider, order_ids) for (user_id, provider), order_ids in groups.items()],
+            return_exceptions=True,
+        )
+        for (user_id, provider), result in zip(groups, results):
+            if isinstance(result, BaseException):
+                # Kept reserved; asked again on the next refresh
+                logger.warning("Settling %s orders for %s failed: %s", provider, user_id, result)
+                continue
+            for order_id in result:
+                resting = self._resting.pop(order_id, None)
+                if resting is not None:
+                    self.release(resting[1], submitted=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self._limits),
+            "owns_orders": self.owns_orders,
+            "checks": self.checks,
+            "rejections": dict(self.rejections),
+            "pending_orders": len(self._pending_quantity),
+            "resting_orders": len(self._resting),
+            "check": self.check_latency.stats(),
+            "check_to_submit": self.submit_latency.stats(),
+        }
+
+
+class TradeWriter:
+    """Write-behind queue for ``trades``.
+
+    ``put`` only appends to memory; a background task writes what has
+    queued every ``flush_interval`` in ``bulk_write`` batches. Writes are
+    upserts by ``id``, so a batch retried after an error cannot duplicate
+    the trades that did land. Nothing is dropped: failed batches go back
+    to the front of the queue, and ``stop`` writes whatever is left.
+    """
+
+    def __init__(self, collection, batch_size: int = 500, flush_interval: float = 0.05):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def put(self, trade: dict):
+        self._queue.append(trade)
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _loop(self):
+        delay = 1.0
+        while True:
+            await self._wakeup.wait()
+            # Let a burst of orders collect into one batch
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            if await self.flush():
+                delay = 1.0
+            else:
+                self._wakeup.set()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def flush(self) -> bool:
+        """Write everything queued; False if a batch failed and was requeued."""
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            try:
+                await self.collection.bulk_write(
+                    [UpdateOne({"id": trade["id"]}, {"$setOnInsert": trade}, upsert=True) for trade in batch],
+                    ordered=False,
+                )
+            except Exception:
+                self.errors += 1
+                logger.exception("Writing %d trades failed, will retry", len(batch))
+                self._queue.extendleft(reversed(batch))
+                return False
+            except BaseException:
+                # Cancelled mid-write by stop: requeued for its final flush, where upserts make rewriting safe
+                self._queue.extendleft(reversed(batch))
+                raise
+            self.written += len(batch)
+            self.batches += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queued": len(self._queue), "written": self.written, "batches": self.batches, "errors": self.errors}
@@ -0,0 +1,67 @@
+import base64
+import json
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _to_millis(value: datetime) -> datetime:
+    # Mongo stores datetimes at millisecond precision; cursors must match it so
+    # the row a cursor points at compares equal, not greater, on the next query
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    """Opaque cursor for the position just after ``doc`` in a ``(sort_field, id)`` ordering."""
+    payload = {"v": _to_millis(doc[sort_field]).isoformat(), "id": doc["id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(payload["v"]), str(payload["id"])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor("Invalid cursor") from exc
+
+
+def keyset_filter(query: dict, sort_field: str, cursor: Optional[str]) -> dict:
+    """Restrict ``query`` to rows strictly after ``cursor`` in descending ``(sort_field, id)`` order."""
+    if not cursor:
+        return query
+    value, last_id = decode_cursor(cursor)
+    after = {"$or": [
+        {sort_field: {"$lt": value}},
+        {sort_field: value, "id": {"$lt": last_id}},
+    ]}
+    return {"$and": [query, after]} if query else after
+
+
+async def fetch_page(collection, query: dict, sort_field: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of ``collection`` newest first, plus the cursor for the next page.
+
+    Rows are ordered by ``(sort_field, id)`` descending so ties on the
+    timestamp still page deterministically; each page is a single index range
+    scan regardless of how deep it is. One extra row is read to tell whether
+    another page exists.
+    """
+    docs = await collection.find(keyset_filter(query, sort_field, cursor)).sort(
+        [(sort_field, -1), ("id", -1)]
+    ).to_list(length=limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1], sort_field)
+    return docs, None
+
+
+def page_from_items(items: List[dict], sort_field: str, limit: int) -> Tuple[List[dict], Optional[str]]:
+    """First page of rows already in memory, ordered and cut exactly like ``fetch_page``."""
+    items = sorted(items, key=lambda doc: (_to_millis(doc[sort_field]), doc["id"]), reverse=True)
+    if len(items) > limit:
+        items = items[:limit]
+        return items, encode_cursor(items[-1], sort_field)
+    return items, None
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+
+class HasherBusy(Exception):
+    """Raised when more password operations are queued than ``max_pending`` allows."""
+
+
+class PasswordHasher:
+    """Runs passlib hashing and verification on a bounded thread pool.
+
+    bcrypt costs 100-300 ms per call and releases the GIL while it works, so
+    a small pool keeps the event loop free for every other request. Work
+    beyond ``max_pending`` queued calls is refused instead of piling up.
+    """
+
+    def __init__(self, context, max_workers: int = 4, max_pending: int = 256):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self.max_queue_depth = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._submit(self.context.verify, plain_password, hashed_password)
+
+    async def _submit(self, func, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HasherBusy("Too many password operations in progress")
+        self._pending += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        queued_at = time.perf_counter()
+        started_at = None
+
+        def run():
+            nonlocal started_at
+            started_at = time.perf_counter()
+            return func(*args)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, run)
+        finally:
+            self._pending -= 1
+            finished_at = time.perf_counter()
+            if started_at is not None:
+                self.completed += 1
+                self.total_wait += started_at - queued_at
+                self.total_run += finished_at - started_at
+
+    @property
+    def queue_depth(self) -> int:
+        """Calls submitted but not yet picked up by a worker thread."""
+        return max(0, self._pending - self.max_workers)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "running": min(self._pending, self.max_workers),
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(1000 * self.total_wait / self.completed, 2) if self.completed else 0.0,
+            "avg_run_ms": round(1000 * self.total_run / self.completed, 2) if self.completed else 0.0,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
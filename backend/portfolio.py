@@ -0,0 +1,535 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pymongo import ReturnDocument, UpdateOne
+
+from leases import Lease
+
+logger = logging.getLogger(__name__)
+
+# Returns an asset's latest price (or previous daily close), None if unknown
+PriceLoader = Callable[[str], Awaitable[Optional[float]]]
+
+
+class Holding:
+    """One position's state; ``price`` is the latest mark, ``day_base`` its value at the start of the day."""
+
+    __slots__ = ("asset_id", "quantity", "avg_entry_price", "price", "day_base", "doc", "dirty")
+
+    def __init__(self, doc: dict, price: float, day_base: float):
+        self.asset_id = doc["asset_id"]
+        self.quantity = float(doc["quantity"])
+        self.avg_entry_price = float(doc["avg_entry_price"])
+        self.price = price
+        self.day_base = day_base
+        self.doc = doc
+        self.dirty = False
+
+    @property
+    def market_value(self) -> float:
+        return self.quantity * self.price
+
+    @property
+    def cost_basis(self) -> float:
+        return self.quantity * self.avg_entry_price
+
+
+class Account:
+    """A user's cash, holdings and running totals over those holdings.
+
+    ``market_value``, ``cost_basis`` and ``day_base`` are sums over the
+    holdings, adjusted by the delta of each change, so reading them is
+    O(1). ``renormalize`` re-adds them from the holdings to shed
+    floating-point drift. Positions closed today keep their share of
+    ``day_base`` in ``closed_day_base`` so their day's gain still counts.
+    ``version`` is the stored balance's version this account was loaded at.
+    """
+
+    __slots__ = (
+        "user_id", "cash", "realized_pl", "version", "holdings", "market_value", "cost_basis", "day_base",
+        "closed_day_base", "dirty",
+    )
+
+    def __init__(self, user_id: str, cash: float, realized_pl: float = 0.0, version: int = 0):
+        self.user_id = user_id
+        self.cash = cash
+        self.realized_pl = realized_pl
+        self.version = version
+        self.holdings: Dict[str, Holding] = {}
+        self.market_value = 0.0
+        self.cost_basis = 0.0
+        self.day_base = 0.0
+        self.closed_day_base = 0.0
+        self.dirty = True
+
+    def add(self, holding: Holding):
+        self.holdings[holding.asset_id] = holding
+        self.market_value += holding.market_value
+        self.cost_basis += holding.cost_basis
+        self.day_base += holding.day_base
+
+    def renormalize(self):
+        self.market_value = sum(holding.market_value for holding in self.holdings.values())
+        self.cost_basis = sum(holding.cost_basis for holding in self.holdings.values())
+        self.day_base = sum(holding.day_base for holding in self.holdings.values()) + self.closed_day_base
+
+    def summary(self) -> Dict[str, Any]:
+        """Fields of a ``PortfolioSnapshot`` for this moment."""
+        portfolio_value = self.cash + self.market_value
+        # Value at the start of the day; fills since then moved cash and
+        # day_base by the same amount, so they cancel out
+        day_start = self.cash + self.day_base
+        return {
+            "user_id": self.user_id,
+            "cash_balance": round(self.cash, 2),
+            "portfolio_value": round(portfolio_value, 2),
+            "day_change_pct": round((self.market_value - self.day_base) / day_start * 100, 4) if day_start else 0.0,
+            "total_pl": round(self.market_value - self.cost_basis + self.realized_pl, 2),
+        }
+
+
+class PortfolioBook:
+    """Live valuation of every user's portfolio, kept in memory.
+
+    Holdings are loaded once from ``db.positions``, and cash and realized
+    P&L from the user's ``portfolio_accounts`` row. After that, a price
+    change touches only the users holding that asset, and a fill touches
+    only the one account. Neither rescans trades, so a summary read is O(1).
+
+    The stored rows are the source of truth: ``persist_fill`` writes each
+    fill to them atomically as it happens, and every write bumps the
+    balance row's ``version``. Each ``tick`` the book reloads the accounts
+    whose version moved under it, so workers converge on each other's
+    fills, then re-marks every held asset. Every ``snapshot_interval`` the
+    worker holding the ``portfolio_snapshot`` lease writes a
+    ``PortfolioSnapshot`` row for each account that changed, and the marks
+    of changed positions; snapshots never write quantities or cash.
+    """
+
+    def __init__(
+        self,
+        db,
+        latest_price: PriceLoader,
+        previous_close: PriceLoader,
+        default_cash: float = 10000.0,
+        tick: float = 5.0,
+        snapshot_interval: float = 900.0,
+        price_concurrency: int = 16,
+        on_reload: Optional[Callable[[str], Any]] = None,
+    ):
+        self.db = db
+        self.latest_price = latest_price
+        self.previous_close = previous_close
+        self.default_cash = default_cash
+        self.tick = tick
+        self.snapshot_interval = snapshot_interval
+        # Called with each user whose account sync reloaded
+        self.on_reload = on_reload
+        self._accounts: Dict[str, Account] = {}
+        # Users holding each asset, so a price only touches its holders
+        self._holders: Dict[str, Set[str]] = {}
+        self._prices: Dict[str, float] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self._price_slots = asyncio.Semaphore(price_concurrency)
+        self._day: date = datetime.utcnow().date()
+        self._task: Optional[asyncio.Task] = None
+        self._next_snapshot = time.monotonic() + snapshot_interval
+        # Latest balance updated_at seen; syncs re-read one tick before it
+        self._seen: Optional[datetime] = None
+        self.lease = Lease(db, "portfolio_snapshot", ttl=max(30.0, 3 * tick))
+        self.price_updates = 0
+        self.fills = 0
+        self.fill_write_failures = 0
+        self.reloads = 0
+        self.snapshots_written = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lease.held:
+            await self.snapshot()
+        await self.lease.release()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.sync()
+                await self.refresh_prices()
+                if datetime.utcnow().date() != self._day:
+                    self.roll_day()
+                if await self.lease.acquire() and time.monotonic() >= self._next_snapshot:
+                    self._next_snapshot = time.monotonic() + self.snapshot_interval
+                    await self.snapshot()
+            except Exception:
+                logger.exception("Portfolio valuation update failed")
+
+    async def load(self):
+        """Load every user that holds a position, in one pass over positions."""
+        self._seen = datetime.utcnow()
+        by_user: Dict[str, List[dict]] = {}
+        async for doc in self.db.positions.find({}, {"_id": 0}):
+            by_user.setdefault(doc["user_id"], []).append(doc)
+        await asyncio.gather(*[self.ensure_user(user_id, docs) for user_id, docs in by_user.items()])
+        logger.info("Portfolio book loaded %d accounts over %d assets", len(self._accounts), len(self._holders))
+
+    async def ensure_user(self, user_id: str, positions: Optional[List[dict]] = None) -> Account:
+        """The user's account, loading it on first use; concurrent callers share one load."""
+        account = self._accounts.get(user_id)
+        if account is not None:
+            return account
+        if user_id in self._loading:
+            return await asyncio.shield(self._loading[user_id])
+        future = asyncio.get_running_loop().create_future()
+        self._loading[user_id] = future
+        try:
+            account = await self._load_user(user_id, positions)
+            self._install(account)
+            future.set_result(account)
+            return account
+        except Exception as exc:
+            future.set_exception(exc)
+            # Nobody else may be waiting; don't leave the exception unretrieved
+            future.exception()
+            raise
+        finally:
+            self._loading.pop(user_id, None)
+
+    async def reload_user(self, user_id: str) -> Account:
+        """Drop and reload one account, after its positions were written outside the book.
+
+        Bumps the balance version too, so other workers reload it on their next sync.
+        """
+        await self.db.portfolio_accounts.update_one(
+            {"user_id": user_id}, {"$inc": {"version": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        self._uninstall(user_id)
+        return await self.ensure_user(user_id)
+
+    async def sync(self) -> int:
+        """Reload accounts whose stored balance another worker changed; returns accounts reloaded."""
+        query = {"updated_at": {"$gt": self._seen - timedelta(seconds=self.tick)}} if self._seen else {}
+        balances = await self.db.portfolio_accounts.find(query, {"_id": 0, "user_id": 1, "version": 1, "updated_at": 1}).to_list(length=None)
+        stale = []
+        for balance in balances:
+            if self._seen is None or balance["updated_at"] > self._seen:
+                self._seen = balance["updated_at"]
+            account = self._accounts.get(balance["user_id"])
+            if account is None or account.version != balance.get("version", 0):
+                stale.append(balance["user_id"])
+        for user_id in stale:
+            self._uninstall(user_id)
+        await asyncio.gather(*[self.ensure_user(user_id) for user_id in stale])
+        if self.on_reload is not None:
+            for user_id in stale:
+                self.on_reload(user_id)
+        self.reloads += len(stale)
+        return len(stale)
+
+    async def _load_user(self, user_id: str, positions: Optional[List[dict]]) -> Account:
+        if positions is None:
+            positions = await self.db.positions.find({"user_id": user_id}, {"_id": 0}).to_list(length=None)
+        balance = await self._balance(user_id)
+        account = Account(user_id, cash=balance["cash"], realized_pl=balance["realized_pl"], version=balance["version"])
+        missing = [doc["asset_id"] for doc in positions if doc["asset_id"] not in self._prices]
+        prices = await asyncio.gather(*[self._price(self.latest_price, asset_id) for asset_id in missing])
+        self._prices.update((asset_id, price) for asset_id, price in zip(missing, prices) if price is not None)
+        references = await asyncio.gather(*[self._price(self.previous_close, doc["asset_id"]) for doc in positions])
+        for doc, reference in zip(positions, references):
+            # Until a price is known, mark at the last stored price or the entry price
+            price = self._prices.get(doc["asset_id"]) or doc.get("current_price") or doc["avg_entry_price"]
+            holding = Holding(doc, price, 0.0)
+            holding.day_base = holding.quantity * (reference if reference is not None else price)
+            account.add(holding)
+        return account
+
+    async def _balance(self, user_id: str) -> dict:
+        """The user's ``portfolio_accounts`` row, created from the latest snapshot (or the default cash) if missing."""
+        balance = await self.db.portfolio_accounts.find_one({"user_id": user_id}, {"_id": 0})
+        if balance is not None:
+            return balance
+        latest = await self.db.portfolio_snapshots.find_one({"user_id": user_id}, sort=[("timestamp", -1)])
+        return await self.db.portfolio_accounts.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": {
+                "cash": latest["cash_balance"] if latest else self.default_cash,
+                "realized_pl": latest.get("realized_pl", 0.0) if latest else 0.0,
+                "version": 0,
+                "updated_at": datetime.utcnow(),
+            }},
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _price(self, loader: PriceLoader, asset_id: str) -> Optional[float]:
+        async with self._price_slots:
+            return await loader(asset_id)
+
+    def _install(self, account: Account):
+        self._accounts[account.user_id] = account
+        for asset_id in account.holdings:
+            self._holders.setdefault(asset_id, set()).add(account.user_id)
+
+    def _uninstall(self, user_id: str):
+        account = self._accounts.pop(user_id, None)
+        if account is None:
+            return
+        for asset_id in account.holdings:
+            self._unhold(asset_id, user_id)
+
+    def _unhold(self, asset_id: str, user_id: str):
+        holders = self._holders.get(asset_id)
+        if holders is not None:
+            holders.discard(user_id)
+            if not holders:
+                del self._holders[asset_id]
+
+    async def refresh_prices(self):
+        """Re-mark every held asset at its latest price."""
+        asset_ids = list(self._holders)
+        prices = await asyncio.gather(*[self._price(self.latest_price, asset_id) for asset_id in asset_ids])
+        for asset_id, price in zip(asset_ids, prices):
+            if price is not None:
+                self.update_price(asset_id, price)
+
+    def price(self, asset_id: str) -> Optional[float]:
+        """The last price applied for ``asset_id``; known for held assets only."""
+        return self._prices.get(asset_id)
+
+    def update_price(self, asset_id: str, price: float):
+        """Apply a new price to the holders of ``asset_id`` only."""
+        if self._prices.get(asset_id) == price:
+            return
+        self._prices[asset_id] = price
+        for user_id in self._holders.get(asset_id, ()):
+            account = self._accounts[user_id]
+            holding = account.holdings[asset_id]
+            account.market_value += holding.quantity * (price - holding.price)
+            holding.price = price
+            holding.dirty = account.dirty = True
+        self.price_updates += 1
+
+    def apply_fill(self, trade: dict) -> Optional[Dict[str, Any]]:
+        """Apply a filled ``Trade`` to its user's cash and position; returns the updated position.
+
+        Only the in-memory account changes; ``persist_fill`` stores the
+        fill. Users not loaded yet are skipped, since their stored position
+        already includes the fill when they load. Buying adds to the
+        position at a blended entry price. Selling realizes P&L against the
+        entry price, and selling more than is held flips the position
+        short at the fill price.
+        """
+        account = self._accounts.get(trade["user_id"])
+        if account is None:
+            return None
+        asset_id = trade["asset_id"]
+        quantity = float(trade["quantity"]) * (1 if trade["side"] == "buy" else -1)
+        price = float(trade["price"])
+
+        holding = account.holdings.get(asset_id)
+        if holding is None:
+            now = datetime.utcnow()
+            holding = Holding({
+                "id": str(uuid.uuid4()),
+                "user_id": account.user_id,
+                "asset_id": asset_id,
+                "provider": trade["provider"],
+                "quantity": 0.0,
+                "avg_entry_price": price,
+                "created_at": now,
+                "updated_at": now,
+            }, self._prices.get(asset_id, price), 0.0)
+            account.holdings[asset_id] = holding
+            self._holders.setdefault(asset_id, set()).add(account.user_id)
+
+        # Take the holding out of the running totals, change it, add it back
+        account.market_value -= holding.market_value
+        account.cost_basis -= holding.cost_basis
+        held = holding.quantity
+        if held == 0 or (held > 0) == (quantity > 0):
+            holding.avg_entry_price = (abs(held) * holding.avg_entry_price + abs(quantity) * price) / (abs(held) + abs(quantity))
+        else:
+            closed = min(abs(quantity), abs(held))
+            account.realized_pl += closed * (price - holding.avg_entry_price) * (1 if held > 0 else -1)
+            if abs(quantity) > abs(held):
+                holding.avg_entry_price = price
+        holding.quantity = held + quantity
+        account.cash -= quantity * price
+        # Bought or sold today at the fill price: no day change from the fill itself
+        account.day_base += quantity * price
+        holding.day_base += quantity * price
+        account.market_value += holding.market_value
+        account.cost_basis += holding.cost_basis
+        holding.dirty = account.dirty = True
+        self.fills += 1
+
+        if abs(holding.quantity) < 1e-12:
+            # Closed out: the realized P&L and the day's gain stay on the account
+            account.closed_day_base += holding.day_base
+            del account.holdings[asset_id]
+            self._unhold(asset_id, account.user_id)
+        return self._position(holding)
+
+    async def persist_fill(self, trade: dict, position: Optional[Dict[str, Any]] = None):
+        """Write a filled ``Trade`` to ``db.positions`` and the user's balance.
+
+        The position row changes in one pipeline update computed from its
+        stored quantity and entry price, and cash and realized P&L by
+        ``$inc``, so fills written by different workers add up instead of
+        overwriting each other. ``position`` is what ``apply_fill`` returned;
+        a new row takes its id. Failures are logged rather than raised, as
+        the broker has already filled the order.
+        """
+        user_id, asset_id = trade["user_id"], trade["asset_id"]
+        quantity = float(trade["quantity"]) * (1 if trade["side"] == "buy" else -1)
+        price = float(trade["price"])
+        now = datetime.utcnow()
+        held = {"$ifNull": ["$quantity", 0.0]}
+        entry = {"$ifNull": ["$avg_entry_price", price]}
+        adding = {"$or": [{"$eq": [held, 0.0]}, {"$eq": [{"$gt": [held, 0.0]}, quantity > 0]}]}
+        blended = {"$divide": [
+            {"$add": [{"$multiply": [{"$abs": held}, entry]}, abs(quantity) * price]},
+            {"$add": [{"$abs": held}, abs(quantity)]},
+        ]}
+        try:
+            if user_id not in self._accounts:
+                await self._balance(user_id)
+            before = await self.db.positions.find_one_and_update(
+                {"user_id": user_id, "asset_id": asset_id},
+                [{"$set": {
+                    "id": {"$ifNull": ["$id", position["id"] if position else str(uuid.uuid4())]},
+                    "provider": {"$ifNull": ["$provider", trade["provider"]]},
+                    "quantity": {"$add": [held, quantity]},
+                    "avg_entry_price": {"$cond": [
+                        adding, blended, {"$cond": [{"$gt": [abs(quantity), {"$abs": held}]}, price, entry]},
+                    ]},
+                    "created_at": {"$ifNull": ["$created_at", now]},
+                    "updated_at": now,
+                }}],
+                projection={"_id": 0, "quantity": 1, "avg_entry_price": 1},
+                upsert=True,
+            )
+            held_before = before["quantity"] if before else 0.0
+            realized = 0.0
+            if held_before != 0 and (held_before > 0) != (quantity > 0):
+                closed = min(abs(quantity), abs(held_before))
+                realized = closed * (price - before["avg_entry_price"]) * (1 if held_before > 0 else -1)
+            if abs(held_before + quantity) < 1e-12:
+                await self.db.positions.delete_one(
+                    {"user_id": user_id, "asset_id": asset_id, "quantity": {"$gt": -1e-12, "$lt": 1e-12}}
+                )
+            balance = await self.db.portfolio_accounts.find_one_and_update(
+                {"user_id": user_id},
+                {"$inc": {"cash": -quantity * price, "realized_pl": realized, "version": 1}, "$set": {"updated_at": now}},
+                projection={"_id": 0, "version": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception:
+            self.fill_write_failures += 1
+            logger.exception("Persisting fill %s failed", trade.get("id"))
+            return
+        account = self._accounts.get(user_id)
+        if account is not None and balance["version"] == account.version + 1:
+            # Nobody else wrote in between: the account already holds this fill
+            account.version = balance["version"]
+
+    def roll_day(self):
+        """Start a new day: each holding's current value becomes its day base."""
+        self._day = datetime.utcnow().date()
+        for account in self._accounts.values():
+            for holding in account.holdings.values():
+                holding.day_base = holding.market_value
+            account.closed_day_base = 0.0
+            account.renormalize()
+            account.dirty = True
+
+    def users(self) -> List[str]:
+        return list(self._accounts)
+
+    def summary(self, user_id: str) -> Optional[Dict[str, Any]]:
+        account = self._accounts.get(user_id)
+        return account.summary() if account is not None else None
+
+    def positions(self, user_id: str) -> List[Dict[str, Any]]:
+        account = self._accounts.get(user_id)
+        if account is None:
+            return []
+        return [self._position(holding) for holding in account.holdings.values()]
+
+    @staticmethod
+    def _position(holding: Holding) -> Dict[str, Any]:
+        return {
+            **holding.doc,
+            "quantity": holding.quantity,
+            "avg_entry_price": round(holding.avg_entry_price, 6),
+            "current_price": holding.price,
+            "market_value": round(holding.market_value, 2),
+            "unrealized_pl": round(holding.market_value - holding.cost_basis, 2),
+        }
+
+    async def snapshot(self, user_ids: Optional[List[str]] = None) -> int:
+        """Write a snapshot row per changed account and the marks of its changed positions; returns rows written."""
+        if user_ids is None:
+            accounts = [account for account in self._accounts.values() if account.dirty]
+        else:
+            accounts = [self._accounts[user_id] for user_id in user_ids if user_id in self._accounts]
+        if not accounts:
+            return 0
+        now = datetime.utcnow()
+        snapshots = []
+        operations = []
+        for account in accounts:
+            account.renormalize()
+            snapshots.append({
+                "id": str(uuid.uuid4()),
+                **account.summary(),
+                "realized_pl": round(account.realized_pl, 2),
+                "timestamp": now,
+            })
+            for holding in account.holdings.values():
+                if holding.dirty:
+                    # Valuation only: quantities and entry prices belong to persist_fill
+                    operations.append(UpdateOne(
+                        {"user_id": account.user_id, "asset_id": holding.asset_id},
+                        {"$set": {
+                            "current_price": holding.price,
+                            "market_value": round(holding.market_value, 2),
+                            "unrealized_pl": round(holding.market_value - holding.cost_basis, 2),
+                            "updated_at": now,
+                        }},
+                    ))
+                    holding.dirty = False
+            account.dirty = False
+        await self.db.portfolio_snapshots.insert_many(snapshots, ordered=False)
+        if operations:
+            await self.db.positions.bulk_write(operations, ordered=False)
+        self.snapshots_written += len(snapshots)
+        return len(snapshots)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "accounts": len(self._accounts),
+            "assets": len(self._holders),
+            "positions": sum(len(account.holdings) for account in self._accounts.values()),
+            "dirty_accounts": sum(1 for account in self._accounts.values() if account.dirty),
+            "price_updates": self.price_updates,
+            "fills": self.fills,
+            "fill_write_failures": self.fill_write_failures,
+            "reloads": self.reloads,
+            "leader": self.lease.held,
+            "snapshots_written": self.snapshots_written,
+        }
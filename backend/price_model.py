@@ -0,0 +1,158 @@
+import argparse
+import fcntl
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+import numpy as np
+
+from indicators import MIN_BARS, SIGNAL_TYPES, atr, compute_indicators
+from market_data import generate_bars
+
+logger = logging.getLogger(__name__)
+
+# Bars of history needed to build one feature row
+HISTORY_BARS = 60
+RETURN_LAGS = 10
+FEATURE_NAMES = (
+    *[f"return_{lag}" for lag in range(1, RETURN_LAGS + 1)],
+    "momentum_20",
+    "sma_20_distance",
+    "rsi_14",
+    "macd_hist_atr",
+    "bollinger_percent_b",
+)
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "price_predictor.joblib")
+
+
+def feature_matrix(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    """Features for every (symbol, bar): shape ``(symbols, bars, len(FEATURE_NAMES))``.
+
+    Returns are normalized by ATR so one model serves $30 stocks and $30k
+    coins alike. Bars without enough history are NaN.
+    """
+    values = compute_indicators(high, low, close)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        atr_pct = values["atr_14"] / close
+        returns = np.diff(np.log(close), axis=1, prepend=np.nan)
+        columns = []
+        for lag in range(RETURN_LAGS):
+            lagged = np.full_like(returns, np.nan)
+            lagged[:, lag:] = returns[:, :returns.shape[1] - lag]
+            columns.append(lagged / atr_pct)
+        momentum = np.full_like(close, np.nan)
+        momentum[:, 20:] = np.log(close[:, 20:] / close[:, :-20])
+        columns.append(momentum / atr_pct)
+        columns.append((close - values["sma_20"]) / values["atr_14"])
+        columns.append(values["rsi_14"] / 100)
+        columns.append(values["macd_hist"] / values["atr_14"])
+        columns.append((close - values["bb_lower"]) / (values["bb_upper"] - values["bb_lower"]))
+    return np.stack(columns, axis=-1)
+
+
+def training_set(symbols: int = 200, bars: int = 500, seed_end: datetime = datetime(2024, 1, 1)):
+    """Feature rows labelled with whether the next bar closed higher, from mock hourly bars."""
+    series = [generate_bars(f"TRAIN{i}", "1h", bars, 100.0, end=seed_end - timedelta(days=i)) for i in range(symbols)]
+    high, low, close = (np.stack([bars[field] for bars in series]) for field in ("high", "low", "close"))
+    features = feature_matrix(high, low, close)[:, :-1]
+    labels = (close[:, 1:] > close[:, :-1]).astype(int)
+    rows = features.reshape(-1, features.shape[-1])
+    labels = labels.reshape(-1)
+    usable = ~np.isnan(rows).any(axis=1)
+    return rows[usable], labels[usable]
+
+
+def train(path: str = DEFAULT_PATH):
+    from joblib import dump
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    rows, labels = training_set()
+    model = make_pipeline(StandardScaler(), LogisticRegression(max_iter=500))
+    model.fit(rows, labels)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # Written aside and renamed into place, so a reader never loads a half-written file
+    handle, partial = tempfile.mkstemp(dir=directory, suffix=".partial")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            dump(model, file)
+        os.replace(partial, path)
+    except BaseException:
+        os.unlink(partial)
+        raise
+    logger.info("Trained price predictor on %d rows, saved to %s", len(rows), path)
+    return model
+
+
+def ensure_model(path: str = DEFAULT_PATH) -> str:
+    """The model file, trained first if missing; the image trains it at build time (see the Dockerfile).
+
+    Processes that find it missing at once take a file lock, so only the
+    first trains and the rest wait for its file.
+    """
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(path):
+            train(path)
+    return path
+
+
+def load(path: str = DEFAULT_PATH):
+    """Model loader run once in each pool worker."""
+    from joblib import load as joblib_load
+    return joblib_load(ensure_model(path))
+
+
+def latest_features(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> Dict[str, np.ndarray]:
+    """The newest feature row per symbol (NaN-free), which rows are usable, and the close and ATR to score them with."""
+    rows = feature_matrix(high, low, close)[:, -1, :]
+    valid = ((~np.isnan(close)).sum(axis=1) >= MIN_BARS) & ~np.isnan(rows).any(axis=1)
+    return {
+        "rows": np.nan_to_num(rows),
+        "valid": valid,
+        "close": close[:, -1],
+        "atr": atr(high, low, close)[:, -1],
+    }
+
+
+def score(inputs: Dict[str, Any], band: float = 0.05) -> Dict[str, Any]:
+    """Signals from the model's probability that the next bar closes higher."""
+    probability = inputs["probability"]
+    close = inputs["close"]
+    atr = np.where(inputs["atr"] > 0, inputs["atr"], close * 0.02)
+    direction = np.where(probability > 0.5 + band, 1, np.where(probability < 0.5 - band, -1, 0))
+    return {
+        "probability": probability,
+        "signal_type": SIGNAL_TYPES[direction + 1],
+        "confidence": np.round(np.clip(0.5 + np.abs(probability - 0.5), 0.5, 0.99), 2),
+        "price_target": np.round(close + direction * 2.0 * atr, 2),
+        "stop_loss": np.round(close - direction * 1.5 * atr, 2),
+        "valid": inputs["valid"],
+        "events": [[] for _ in range(len(close))],
+    }
+
+
+def rationale(symbol: str, scored: Dict[str, Any], row: int) -> str:
+    return (
+        f"{symbol}: price model puts the chance of a higher close on the next bar at "
+        f"{scored['probability'][row]:.0%}."
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the local price predictor on mock bars")
+    parser.add_argument("--path", default=os.environ.get("PRICE_MODEL_PATH", DEFAULT_PATH))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    train(args.path)
+
+
+if __name__ == "__main__":
+    main()
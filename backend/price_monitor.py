@@ -0,0 +1,452 @@
+import asyncio
+import bisect
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import UpdateOne
+
+from leases import Lease
+from orders import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Every stop fires as the price moves one way: a long position's stop and a
+# short signal's target fire on a fall (direction 1), a long target and a
+# short stop on a rise (direction -1). Prices are handled as
+# x = direction * price, so every stop fires when x drops to
+# peak * factor. For a fixed level, peak is direction * level and factor is 1.
+# A trailing stop has factor 1 - direction * pct, and its peak follows x up.
+# Stops on one asset with the same direction and factor share a _Ladder
+# sorted by peak. A tick then fires only the ladder's tail above
+# x / factor. It raises every trailing peak below x by merging buckets at
+# the front, so neither step looks at stops the tick leaves alone.
+
+# Returns the latest price for an asset id, or None
+PriceLoader = Callable[[str], Awaitable[Optional[float]]]
+
+_ids = itertools.count(1)
+
+KINDS = ("stop_loss", "trailing_stop", "price_target")
+
+
+class Stop:
+    """One watched level: a position's stop or a signal's stop or target."""
+
+    __slots__ = ("id", "user_id", "asset_id", "kind", "direction", "level", "pct", "source", "expires_at", "basis", "group")
+
+    def __init__(self, user_id: str, asset_id: str, kind: str, direction: int, level: float,
+                 pct: Optional[float] = None, source: str = "position", expires_at: Optional[datetime] = None,
+                 basis: tuple = ()):
+        self.id = next(_ids)
+        self.user_id = user_id
+        self.asset_id = asset_id
+        self.kind = kind  # stop_loss, trailing_stop, price_target
+        self.direction = direction
+        self.level = level  # for a trailing stop, the price its peak starts from
+        self.pct = pct
+        self.source = source  # "position", or the model that generated the signal
+        self.expires_at = expires_at
+        # What the stop protects: a position's quantity and entry price, or the signal's id
+        self.basis = basis
+        self.group: Optional[tuple] = None
+
+    def same(self, other: "Stop") -> bool:
+        """True if ``other`` watches what this stop does; a trailing stop's start level may differ."""
+        return (
+            (self.kind, self.direction, self.pct, self.basis, self.expires_at)
+            == (other.kind, other.direction, other.pct, other.basis, other.expires_at)
+            and (self.kind == "trailing_stop" or self.level == other.level)
+        )
+
+
+class Fired:
+    """A stop the price crossed: the level it fired at and the price that crossed it."""
+
+    __slots__ = ("stop", "level", "price")
+
+    def __init__(self, stop: Stop, level: float, price: float):
+        self.stop = stop
+        self.level = level
+        self.price = price
+
+
+class _Ladder:
+    """Stops on one asset with one direction and factor, in buckets sorted by peak."""
+
+    __slots__ = ("direction", "factor", "trailing", "peaks", "buckets")
+
+    def __init__(self, direction: int, factor: float, trailing: bool):
+        self.direction = direction
+        self.factor = factor
+        self.trailing = trailing
+        self.peaks: List[float] = []
+        self.buckets: List[List[Stop]] = []
+
+    def add(self, peak: float, stop: Stop):
+        index = bisect.bisect_left(self.peaks, peak)
+        if index < len(self.peaks) and self.peaks[index] == peak:
+            self.buckets[index].append(stop)
+        else:
+            self.peaks.insert(index, peak)
+            self.buckets.insert(index, [stop])
+
+    def tick(self, price: float, fired: List[Tuple[Stop, float]]):
+        x = self.direction * price
+        index = bisect.bisect_left(self.peaks, x / self.factor)
+        if index < len(self.peaks):
+            for peak, bucket in zip(self.peaks[index:], self.buckets[index:]):
+                level = self.direction * peak * self.factor
+                fired.extend((stop, level) for stop in bucket)
+            del self.peaks[index:], self.buckets[index:]
+        if self.trailing and self.peaks and self.peaks[0] < x:
+            # Every peak below the new high becomes the new high
+            index = bisect.bisect_left(self.peaks, x)
+            merged = [stop for bucket in self.buckets[:index] for stop in bucket]
+            del self.peaks[:index], self.buckets[:index]
+            if self.peaks and self.peaks[0] == x:
+                self.buckets[0].extend(merged)
+            else:
+                self.peaks.insert(0, x)
+                self.buckets.insert(0, merged)
+
+    def compact(self, active: Dict[int, Stop]) -> int:
+        """Drop stops no longer active; returns how many remain."""
+        peaks, buckets = [], []
+        for peak, bucket in zip(self.peaks, self.buckets):
+            bucket = [stop for stop in bucket if active.get(stop.id) is stop]
+            if bucket:
+                peaks.append(peak)
+                buckets.append(bucket)
+        self.peaks, self.buckets = peaks, buckets
+        return sum(len(bucket) for bucket in buckets)
+
+
+def position_stop(position: dict, limits, stop_price: Optional[float] = None) -> Optional[Stop]:
+    """The stop protecting a position under the user's ``RiskLimits``.
+
+    Trailing stops start from the better of the entry and the current
+    price. Fixed stops sit ``limits.stop`` from the entry, unless the order
+    named its own ``stop_price``.
+    """
+    quantity = position["quantity"]
+    if not quantity:
+        return None
+    direction = 1 if quantity > 0 else -1
+    entry = position["avg_entry_price"]
+    current = position.get("current_price") or entry
+    basis = (quantity, entry)
+    if limits.trailing and stop_price is None:
+        start = max(entry, current) if direction > 0 else min(entry, current)
+        return Stop(position["user_id"], position["asset_id"], "trailing_stop", direction, start, pct=limits.stop, basis=basis)
+    level = stop_price if stop_price is not None else entry * (1 - direction * limits.stop)
+    return Stop(position["user_id"], position["asset_id"], "stop_loss", direction, level, basis=basis)
+
+
+def signal_stops(signal: dict) -> List[Stop]:
+    """A buy or sell signal's stop loss and price target."""
+    direction = {"buy": 1, "sell": -1}.get(signal["signal_type"])
+    if direction is None or not signal.get("is_active", True):
+        return []
+    common = (signal["user_id"], signal["asset_id"])
+    options = {"source": signal["created_by"], "expires_at": signal.get("expires_at"), "basis": (signal["id"],)}
+    stops = []
+    if signal.get("stop_loss"):
+        stops.append(Stop(*common, "stop_loss", direction, signal["stop_loss"], **options))
+    if signal.get("price_target"):
+        # A target fires on the move the signal expects, opposite to its stop
+        stops.append(Stop(*common, "price_target", -direction, signal["price_target"], **options))
+    return stops
+
+
+class PriceMonitor:
+    """Watches every active stop and target, and fires the ones each tick crosses.
+
+    Stops are registered in groups that replace each other: one for each
+    position's protective stop, and one for each user's latest signal per
+    asset and model. A group's old stops are dropped lazily and compacted
+    once they outnumber the active ones. Each ``tick`` prices the assets
+    that have stops. Stops that fire are removed, so each fires once.
+    They are handed to ``emit`` together, once per tick. Signal stops also
+    lapse when their signal expires.
+
+    A fired stop stays spent for its group until what it protects changes:
+    watching the same position (quantity and entry price) or signal again
+    does not re-arm it. Watching a group whose stops are unchanged keeps
+    the registered ones, so a trailing stop keeps its peak.
+
+    Every worker watches, but with a ``db`` only the one holding the
+    ``price_monitor`` lease polls prices, so each crossing fires once.
+    Spent stops are saved to ``fired_stops`` and read back by ``load`` at
+    startup and on taking over, so a restart or a new leader does not fire
+    them again. The leader also watches the signals other workers write.
+    """
+
+    def __init__(
+        self,
+        latest_price: PriceLoader,
+        emit: Callable[[List[Fired]], Awaitable[None]],
+        tick: float = 2.0,
+        price_concurrency: int = 16,
+        db=None,
+    ):
+        self.latest_price = latest_price
+        self.emit = emit
+        self.tick = tick
+        self.db = db
+        # Without a db every monitor polls, and spent stops are kept in memory only
+        self.lease = Lease(db, "price_monitor", ttl=max(30.0, 3 * tick)) if db is not None else None
+        self._ladders: Dict[str, Dict[Tuple[int, float, bool], _Ladder]] = {}
+        self._active: Dict[int, Stop] = {}
+        self._groups: Dict[tuple, List[Stop]] = {}
+        # (group, kind) -> basis of the stop that fired
+        self._spent: Dict[Tuple[tuple, str], tuple] = {}
+        # Signal group -> created_at of the signal it watches
+        self._signal_at: Dict[tuple, datetime] = {}
+        self._signals_seen: Optional[datetime] = None
+        self._user_positions: Dict[str, Set[tuple]] = {}
+        self._expiries: List[Tuple[datetime, int]] = []
+        self._fired: List[Fired] = []
+        self._price_slots = asyncio.Semaphore(price_concurrency)
+        self._task: Optional[asyncio.Task] = None
+        self.stale = 0
+        self.ticks = 0
+        self.fired = 0
+        self.expired = 0
+        self.emit_errors = 0
+        self.tick_latency = LatencyHistogram()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.lease is not None:
+            await self.lease.release()
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                if self.lease is not None:
+                    leading = self.lease.held
+                    if not await self.lease.acquire():
+                        continue
+                    # A new leader first reads what the previous one fired
+                    await (self.load_signals() if leading else self.load())
+                await self.poll()
+            except Exception:
+                logger.exception("Price monitor poll failed")
+
+    async def load(self):
+        """Read back the stops fired so far, then watch every active signal not watched yet."""
+        async for doc in self.db.fired_stops.find():
+            self.spend(tuple(doc["_id"]["group"]), doc["_id"]["kind"], tuple(doc["basis"]))
+        await self.load_signals()
+
+    async def load_signals(self):
+        """Watch the buy and sell signals any worker wrote since the last load."""
+        query = {"is_active": True, "expires_at": {"$gt": datetime.utcnow()}, "signal_type": {"$in": ["buy", "sell"]}}
+        if self._signals_seen is not None:
+            # Re-read one tick back, for inserts that landed out of order; watching a signal again is a no-op
+            query["created_at"] = {"$gt": self._signals_seen - timedelta(seconds=self.tick)}
+        # Oldest first, so each user's latest signal per model and asset is the one watched
+        async for signal in self.db.signals.find(query, {"_id": 0}).sort("created_at", 1):
+            self.watch_signals([signal])
+            if self._signals_seen is None or signal["created_at"] > self._signals_seen:
+                self._signals_seen = signal["created_at"]
+
+    async def poll(self):
+        """Price every asset with stops, fire what crossed, and emit the batch."""
+        self._expire(datetime.utcnow())
+        asset_ids = list(self._ladders)
+        prices = await asyncio.gather(*[self._price(asset_id) for asset_id in asset_ids])
+        for asset_id, price in zip(asset_ids, prices):
+            if price is not None:
+                self.on_tick(asset_id, price)
+        await self.flush()
+
+    async def _price(self, asset_id: str) -> Optional[float]:
+        async with self._price_slots:
+            return await self.latest_price(asset_id)
+
+    def on_tick(self, asset_id: str, price: float) -> int:
+        """Apply one price; returns how many stops fired. They wait for ``flush``."""
+        ladders = self._ladders.get(asset_id)
+        if not ladders:
+            return 0
+        started = time.perf_counter()
+        crossed: List[Tuple[Stop, float]] = []
+        for ladder in ladders.values():
+            ladder.tick(price, crossed)
+        count = 0
+        for stop, level in crossed:
+            # Replaced or expired stops are skipped here rather than searched for earlier
+            if self._active.get(stop.id) is stop:
+                del self._active[stop.id]
+                self._spent[(stop.group, stop.kind)] = stop.basis
+                self._fired.append(Fired(stop, level, price))
+                count += 1
+            else:
+                self.stale -= 1
+        if not any(ladder.peaks for ladder in ladders.values()):
+            del self._ladders[asset_id]
+        self.ticks += 1
+        self.fired += count
+        self.tick_latency.record(time.perf_counter() - started)
+        return count
+
+    async def flush(self):
+        if not self._fired:
+            return
+        fired, self._fired = self._fired, []
+        if self.db is not None:
+            try:
+                await self.db.fired_stops.bulk_write([
+                    UpdateOne(
+                        {"_id": {"group": list(hit.stop.group), "kind": hit.stop.kind}},
+                        {"$set": {"basis": list(hit.stop.basis), "fired_at": datetime.utcnow(), "expires_at": hit.stop.expires_at}},
+                        upsert=True,
+                    )
+                    for hit in fired
+                ], ordered=False)
+            except Exception:
+                logger.exception("Saving %d fired stops failed", len(fired))
+        try:
+            await self.emit(fired)
+        except Exception:
+            self.emit_errors += 1
+            logger.exception("Emitting %d fired stops failed", len(fired))
+
+    def _add(self, stop: Stop):
+        self._active[stop.id] = stop
+        if stop.kind == "trailing_stop":
+            key = (stop.direction, 1 - stop.direction * stop.pct, True)
+        else:
+            key = (stop.direction, 1.0, False)
+        ladders = self._ladders.setdefault(stop.asset_id, {})
+        ladder = ladders.get(key)
+        if ladder is None:
+            ladder = ladders[key] = _Ladder(*key)
+        ladder.add(stop.direction * stop.level, stop)
+        if stop.expires_at is not None:
+            heapq.heappush(self._expiries, (stop.expires_at, stop.id))
+
+    def _drop(self, stop: Stop):
+        if self._active.get(stop.id) is stop:
+            del self._active[stop.id]
+            self.stale += 1
+
+    def watch(self, group: tuple, stops: Iterable[Stop]):
+        """Replace the stops registered under ``group``, leaving out those already spent."""
+        stops = list(stops)
+        if not stops:
+            for kind in KINDS:
+                self._spent.pop((group, kind), None)
+        armed = []
+        for stop in stops:
+            if self._spent.get((group, stop.kind)) == stop.basis:
+                continue
+            self._spent.pop((group, stop.kind), None)
+            stop.group = group
+            armed.append(stop)
+        stops = armed
+        current = self._groups.get(group, ())
+        if len(current) == len(stops) and all(
+            self._active.get(old.id) is old and old.same(new) for old, new in zip(current, stops)
+        ):
+            return
+        for stop in self._groups.pop(group, ()):
+            self._drop(stop)
+        if stops:
+            self._groups[group] = stops
+            for stop in stops:
+                self._add(stop)
+        if self.stale > max(10000, len(self._active)):
+            self.compact()
+
+    def spend(self, group: tuple, kind: str, basis: tuple):
+        """Record a stop as fired, by this worker or an earlier one; a matching watched stop is dropped."""
+        self._spent[(group, kind)] = basis
+        for stop in self._groups.get(group, ()):
+            if stop.kind == kind and stop.basis == basis:
+                self._drop(stop)
+
+    def watch_position(self, position: dict, limits, stop_price: Optional[float] = None):
+        group = ("position", position["user_id"], position["asset_id"])
+        stop = position_stop(position, limits, stop_price)
+        self.watch(group, [stop] if stop is not None else [])
+        self._user_positions.setdefault(position["user_id"], set()).add(group)
+
+    def watch_positions(self, user_id: str, positions: List[dict], limits):
+        """Replace all of a user's position stops, after their positions or risk settings change."""
+        groups = self._user_positions.pop(user_id, set())
+        for position in positions:
+            self.watch_position(position, limits)
+            groups.discard(("position", user_id, position["asset_id"]))
+        for group in groups:
+            self.watch(group, [])
+
+    def watch_signals(self, signals: Iterable[dict]):
+        """Watch new signals' stops and targets in place of the previous signal per user, asset and model."""
+        for signal in signals:
+            group = ("signal", signal["user_id"], signal["asset_id"], signal["created_by"])
+            created_at = signal.get("created_at")
+            if created_at is not None:
+                if group in self._signal_at and created_at < self._signal_at[group]:
+                    # Read back after a newer signal replaced it
+                    continue
+                self._signal_at[group] = created_at
+            self.watch(group, signal_stops(signal))
+
+    def _expire(self, now: datetime):
+        while self._expiries and self._expiries[0][0] <= now:
+            _, stop_id = heapq.heappop(self._expiries)
+            stop = self._active.get(stop_id)
+            if stop is not None:
+                self._drop(stop)
+                self.expired += 1
+
+    def compact(self):
+        """Rebuild the ladders without replaced, expired and fired stops."""
+        for asset_id in list(self._ladders):
+            ladders = self._ladders[asset_id]
+            for key in list(ladders):
+                if not ladders[key].compact(self._active):
+                    del ladders[key]
+            if not ladders:
+                del self._ladders[asset_id]
+        self._groups = {
+            group: stops for group, stops in self._groups.items()
+            if any(self._active.get(stop.id) is stop for stop in stops)
+        }
+        self.stale = 0
+
+    def stats(self) -> Dict[str, Any]:
+        kinds: Dict[str, int] = {}
+        for stop in self._active.values():
+            kinds[stop.kind] = kinds.get(stop.kind, 0) + 1
+        return {
+            "leader": self.lease.held if self.lease is not None else True,
+            "active": len(self._active),
+            "spent": len(self._spent),
+            "by_kind": kinds,
+            "assets": len(self._ladders),
+            "ladders": sum(len(ladders) for ladders in self._ladders.values()),
+            "stale": self.stale,
+            "ticks": self.ticks,
+            "fired": self.fired,
+            "expired": self.expired,
+            "emit_errors": self.emit_errors,
+            "tick": self.tick_latency.stats(),
+        }
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode(message: Any) -> str:
+    """JSON the way the REST routes render it: datetimes in ISO format."""
+    if isinstance(message, BaseModel):
+        return message.model_dump_json()
+    return json.dumps(message, default=_json_default, separators=(",", ":"))
+
+
+def frame(kind: str, payload: Any) -> str:
+    """``{"type": kind, "data": payload}`` as JSON text; ``payload`` may be a model such as ``Alert``."""
+    return f'{{"type":{json.dumps(kind)},"data":{encode(payload)}}}'
+
+
+class Subscriber:
+    """Bounded queue of encoded frames for one connection.
+
+    Frames published with a ``key`` coalesce, so a newer frame replaces a
+    pending one with the same key (the latest bar for a symbol, say). Past
+    ``maxsize`` pending frames the oldest is dropped and ``overflowed`` is
+    set, so the consumer can tell its client it missed something.
+    """
+
+    __slots__ = ("maxsize", "overflowed", "delivered", "coalesced", "dropped", "_pending", "_sequence", "_wakeup")
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self._pending: "OrderedDict[Any, str]" = OrderedDict()
+        self._sequence = 0
+        self._wakeup = asyncio.Event()
+
+    def put(self, text: str, key: Optional[str] = None):
+        if key is None:
+            # Unkeyed frames never coalesce; integers cannot collide with string keys
+            self._sequence += 1
+            key = self._sequence
+        elif key in self._pending:
+            del self._pending[key]
+            self.coalesced += 1
+        self._pending[key] = text
+        if len(self._pending) > self.maxsize:
+            self._pending.popitem(last=False)
+            self.dropped += 1
+            self.overflowed = True
+        self._wakeup.set()
+
+    async def get(self) -> List[str]:
+        """Wait until something is pending, then take all of it, oldest first."""
+        while not self._pending:
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        frames = list(self._pending.values())
+        self._pending.clear()
+        self.delivered += len(frames)
+        return frames
+
+
+class Hub:
+    """In-process pub/sub keyed by topic (a symbol's bars, a user's alerts).
+
+    ``publish`` encodes a message once, and every subscriber's queue holds
+    the same string. With a ``bridge`` (``RedisBridge``) messages are also
+    sent to the other workers' hubs and delivered to their subscribers.
+    Messages a hub sent itself are recognised by ``origin`` and not
+    delivered twice.
+    """
+
+    def __init__(self, bridge=None):
+        self.bridge = bridge
+        self.origin = uuid.uuid4().hex
+        self._topics: Dict[str, Set[Subscriber]] = {}
+        self.published = 0
+        self.enqueued = 0
+        self.bridged_in = 0
+
+    async def start(self):
+        if self.bridge is not None:
+            await self.bridge.start(self._from_bridge)
+
+    async def stop(self):
+        if self.bridge is not None:
+            await self.bridge.stop()
+
+    def subscribe(self, topic: str, subscriber: Subscriber):
+        self._topics.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, topic: str, subscriber: Subscriber):
+        subscribers = self._topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._topics[topic]
+
+    def subscribers(self, topic: str) -> int:
+        return len(self._topics.get(topic, ()))
+
+    def publish(self, topic: str, kind: str, payload: Any, key: Optional[str] = None, bridge: bool = True) -> str:
+        """Deliver to this worker's subscribers and, if ``bridge``, to every other worker's; returns the frame."""
+        text = frame(kind, payload)
+        self._deliver(topic, text, key)
+        self.published += 1
+        if bridge and self.bridge is not None:
+            self.bridge.publish("\n".join((self.origin, topic, key or "", text)))
+        return text
+
+    def _deliver(self, topic: str, text: str, key: Optional[str]):
+        subscribers = self._topics.get(topic)
+        if subscribers:
+            for subscriber in subscribers:
+                subscriber.put(text, key)
+            self.enqueued += len(subscribers)
+
+    def _from_bridge(self, message: str):
+        origin, topic, key, text = message.split("\n", 3)
+        if origin != self.origin:
+            self._deliver(topic, text, key or None)
+            self.bridged_in += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "topics": len(self._topics),
+            "subscriptions": sum(len(subscribers) for subscribers in self._topics.values()),
+            "published": self.published,
+            "enqueued": self.enqueued,
+            "bridged_in": self.bridged_in,
+            **({"bridge": self.bridge.stats()} if self.bridge is not None else {}),
+        }
+
+
+class RedisBridge:
+    """Relays hub messages between workers over one Redis pub/sub channel.
+
+    Outgoing messages go through a bounded queue drained by a sender task,
+    so ``publish`` never blocks the caller. If Redis falls behind, the
+    oldest queued messages are dropped. The listener reconnects with
+    backoff if the connection is lost.
+    """
+
+    def __init__(self, url: str, channel: str = "live_updates", max_pending: int = 10000):
+        self.url = url
+        self.channel = channel
+        self.max_pending = max_pending
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._redis = None
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self.errors = 0
+
+    async def start(self, receive: Callable[[str], None]):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url, decode_responses=True)
+        self._queue = asyncio.Queue(self.max_pending)
+        self._tasks = [asyncio.create_task(self._send_loop()), asyncio.create_task(self._listen_loop(receive))]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def publish(self, message: str):
+        if self._queue is None:
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    async def _send_loop(self):
+        while True:
+            message = await self._queue.get()
+            try:
+                await self._redis.publish(self.channel, message)
+                self.sent += 1
+            except Exception:
+                self.errors += 1
+                logger.exception("Publishing to Redis failed")
+                await asyncio.sleep(1)
+
+    async def _listen_loop(self, receive: Callable[[str], None]):
+        delay = 1.0
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 1.0
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.received += 1
+                            receive(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.errors += 1
+                logger.exception("Redis subscription lost, reconnecting in %.0fs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "type": "redis",
+            "channel": self.channel,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+
+class MemoryBridge:
+    """Stand-in for ``RedisBridge`` that links hubs within one process.
+
+    Every bridge created with the same ``network`` list receives every
+    message, including its own, just as Redis echoes to the publisher. It
+    lets tests and the fan-out benchmark run several hubs as if they were
+    separate workers, without a Redis server.
+    """
+
+    def __init__(self, network: List["MemoryBridge"]):
+        self.network = network
+        self._receive: Optional[Callable[[str], None]] = None
+        self.sent = 0
+        self.received = 0
+
+    async def start(self, receive: Callable[[str], None]):
+        self._receive = receive
+        self.network.append(self)
+
+    async def stop(self):
+        if self in self.network:
+            self.network.remove(self)
+
+    def publish(self, message: str):
+        self.sent += 1
+        loop = asyncio.get_running_loop()
+        for bridge in self.network:
+            # Delivered on a later loop iteration, like a network round trip
+            loop.call_soon(bridge._on_message, message)
+
+    def _on_message(self, message: str):
+        if self._receive is not None:
+            self.received += 1
+            self._receive(message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"type": "memory", "peers": len(self.network), "sent": self.sent, "received": self.received}
@@ -0,0 +1,306 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Requests (Binance: request weight) each API key may spend per window, in seconds
+PROVIDER_LIMITS = {"alpaca": (200, 60.0), "binance": (1200, 60.0)}
+
+# Lanes in the order they are served while a key is over budget
+LANES = ("order", "account", "refresh")
+
+
+class RateLimited(Exception):
+    """A call gave up waiting for its API key's budget, or the key's queue is full."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} request budget exhausted")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class MemoryTokenStore:
+    """Token buckets in this process.
+
+    Stand-in for ``RedisTokenStore`` in tests and single-worker runs;
+    limiters sharing one store behave like workers sharing one Redis.
+    """
+
+    def __init__(self):
+        # key -> [tokens, updated, paused_until]
+        self._buckets: Dict[str, List[float]] = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def _bucket(self, key: str, limit: float, window: float, now: float) -> List[float]:
+        bucket = self._buckets.setdefault(key, [float(limit), now, 0.0])
+        bucket[0] = min(limit, bucket[0] + max(0.0, now - bucket[1]) * limit / window)
+        bucket[1] = now
+        return bucket
+
+    async def take(self, key: str, weight: float, limit: float, window: float) -> float:
+        """Spend ``weight`` tokens; 0 if spent, else seconds until they could be."""
+        now = time.time()
+        bucket = self._bucket(key, limit, window, now)
+        wait = max(bucket[2] - now, (weight - bucket[0]) * window / limit)
+        if wait > 0:
+            return wait
+        bucket[0] -= weight
+        return 0.0
+
+    async def adjust(self, key: str, limit: float, window: float, remaining: Optional[float] = None, pause: float = 0.0):
+        """Cap the tokens at the broker's ``remaining`` count, and/or stop spending for ``pause`` seconds."""
+        now = time.time()
+        bucket = self._bucket(key, limit, window, now)
+        if remaining is not None:
+            bucket[0] = min(bucket[0], remaining)
+        if pause:
+            bucket[2] = max(bucket[2], now + pause)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"type": "memory", "buckets": len(self._buckets)}
+
+
+# Both scripts refill from Redis's clock so that every worker agrees on time.
+# KEYS[1] is the bucket hash; ARGV[1..2] are limit and window.
+_REFILL = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local clock = redis.call("TIME")
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call("HMGET", KEYS[1], "tokens", "updated", "paused_until")
+local tokens = tonumber(state[1]) or limit
+local updated = tonumber(state[2]) or now
+local paused = tonumber(state[3]) or 0
+tokens = math.min(limit, tokens + math.max(0, now - updated) * limit / window)
+"""
+
+_SAVE = """
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now), "paused_until", tostring(paused))
+redis.call("EXPIRE", KEYS[1], math.ceil(window * 2))
+"""
+
+# ARGV[3] is the weight; returns the wait in seconds, "0" when spent
+_TAKE = _REFILL + """
+local weight = tonumber(ARGV[3])
+local wait = math.max(paused - now, (weight - tokens) * window / limit)
+if wait <= 0 then
+    tokens = tokens - weight
+    wait = 0
+end
+""" + _SAVE + """
+return tostring(wait)
+"""
+
+# ARGV[3] is the broker's remaining count ("" if unknown), ARGV[4] seconds to pause
+_ADJUST = _REFILL + """
+if ARGV[3] ~= "" then
+    tokens = math.min(tokens, tonumber(ARGV[3]))
+end
+local pause = tonumber(ARGV[4])
+if pause > 0 then
+    paused = math.max(paused, now + pause)
+end
+""" + _SAVE
+
+
+class RedisTokenStore:
+    """Token buckets in Redis, shared by every worker.
+
+    Each take or adjust is one Lua script run, so workers cannot both
+    spend the last tokens. If Redis is unreachable the store falls back to
+    buckets in this process, which keeps calls flowing but no longer
+    coordinates workers; ``errors`` counts those calls.
+    """
+
+    def __init__(self, url: str, prefix: str = "rate_limit"):
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._take = None
+        self._adjust = None
+        self._fallback = MemoryTokenStore()
+        self.errors = 0
+
+    async def start(self):
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url, decode_responses=True)
+        self._take = self._redis.register_script(_TAKE)
+        self._adjust = self._redis.register_script(_ADJUST)
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _failed(self):
+        self.errors += 1
+        if self.errors == 1 or self.errors % 1000 == 0:
+            logger.exception("Rate limit store unreachable, using local buckets (%d errors)", self.errors)
+
+    async def take(self, key, weight, limit, window):
+        if self._redis is not None:
+            try:
+                return float(await self._take(keys=[f"{self.prefix}:{key}"], args=[limit, window, weight]))
+            except Exception:
+                self._failed()
+        return await self._fallback.take(key, weight, limit, window)
+
+    async def adjust(self, key, limit, window, remaining=None, pause=0.0):
+        if self._redis is not None:
+            try:
+                await self._adjust(keys=[f"{self.prefix}:{key}"], args=[limit, window, "" if remaining is None else remaining, pause])
+                return
+            except Exception:
+                self._failed()
+        await self._fallback.adjust(key, limit, window, remaining, pause)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"type": "redis", "errors": self.errors}
+
+
+class RateLimiter:
+    """Request budgets per (provider, API key), shared through a token store.
+
+    Callers ``acquire`` before each request and queue while the key is
+    over budget instead of failing. Each key's queue is served by one task
+    in lane order, so an order waiting on a busy key goes ahead of
+    position refreshes queued before it. A call is only rejected when its
+    key already has ``max_queue`` waiters, or when it set a ``timeout`` and
+    the budget did not free up in time.
+    """
+
+    def __init__(self, store=None, limits: Dict[str, Tuple[int, float]] = PROVIDER_LIMITS, max_queue: int = 1000,
+                 max_poll: float = 1.0):
+        self.store = store if store is not None else MemoryTokenStore()
+        self.limits = limits
+        self.max_queue = max_queue
+        # Longest sleep between store checks, so a newly queued order is not stuck behind a long wait
+        self.max_poll = max_poll
+        # key -> heap of [lane rank, sequence, weight, future, deadline]
+        self._queues: Dict[str, list] = {}
+        self._dispatchers: Dict[str, asyncio.Task] = {}
+        # key -> when the store last said its budget frees up (monotonic)
+        self._free_at: Dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._lanes = {lane: {"granted": 0, "queued": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0} for lane in LANES}
+
+    async def start(self):
+        await self.store.start()
+
+    async def stop(self):
+        for task in self._dispatchers.values():
+            task.cancel()
+        await asyncio.gather(*self._dispatchers.values(), return_exceptions=True)
+        self._dispatchers.clear()
+        for heap in self._queues.values():
+            for entry in heap:
+                entry[3].cancel()
+        self._queues.clear()
+        await self.store.stop()
+
+    def _key(self, provider: str, api_key: str) -> str:
+        # Keys never reach the store in the clear
+        return f"{provider}:{hashlib.sha256(api_key.encode()).hexdigest()[:24]}"
+
+    async def acquire(self, provider: str, api_key: str, weight: float = 1, lane: str = "refresh",
+                      timeout: Optional[float] = None):
+        """Wait for ``weight`` of the key's budget; raises ``RateLimited`` if rejected."""
+        limit, window = self.limits[provider]
+        key = self._key(provider, api_key)
+        stats = self._lanes[lane]
+        heap = self._queues.setdefault(key, [])
+        # Paused longer than the caller will wait, or too many waiting already
+        if len(heap) >= self.max_queue or (timeout is not None and self._retry_after(key, heap, limit, window) > timeout):
+            stats["rejected"] += 1
+            raise RateLimited(provider, retry_after=self._retry_after(key, heap, limit, window))
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        deadline = started + timeout if timeout is not None else float("inf")
+        heapq.heappush(heap, [LANES.index(lane), next(self._sequence), min(weight, limit), future, deadline])
+        if key not in self._dispatchers:
+            self._dispatchers[key] = asyncio.create_task(self._dispatch(provider, key, limit, window))
+        stats["queued"] += 1
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            stats["rejected"] += 1
+            raise RateLimited(provider, retry_after=self._retry_after(key, heap, limit, window)) from None
+        except RateLimited:
+            stats["rejected"] += 1
+            raise
+        finally:
+            stats["queued"] -= 1
+        waited = time.monotonic() - started
+        stats["granted"] += 1
+        stats["total_wait"] += waited
+        stats["max_wait"] = max(stats["max_wait"], waited)
+
+    def _retry_after(self, key: str, heap: list, limit: float, window: float) -> float:
+        """Seconds until the key could serve everyone queued."""
+        paused = self._free_at.get(key, 0.0) - time.monotonic()
+        return max(paused, 0.0) + window * len(heap) / limit
+
+    async def _dispatch(self, provider: str, key: str, limit: float, window: float):
+        heap = self._queues[key]
+        try:
+            while heap:
+                entry = heap[0]
+                if entry[3].done():
+                    # The caller timed out or went away
+                    heapq.heappop(heap)
+                    continue
+                wait = await self.store.take(key, entry[2], limit, window)
+                if wait > 0:
+                    free_at = self._free_at[key] = time.monotonic() + wait
+                    # Fail now whoever would give up before the budget frees up
+                    for waiting in heap:
+                        if waiting[4] < free_at and not waiting[3].done():
+                            waiting[3].set_exception(RateLimited(provider, retry_after=self._retry_after(key, heap, limit, window)))
+                    await asyncio.sleep(min(wait, self.max_poll))
+                    continue
+                self._free_at.pop(key, None)
+                heapq.heappop(heap)
+                if not entry[3].done():
+                    entry[3].set_result(None)
+        finally:
+            self._dispatchers.pop(key, None)
+            if not heap:
+                self._queues.pop(key, None)
+
+    async def observe(self, provider: str, api_key: str, remaining: Optional[float] = None, reset_in: Optional[float] = None):
+        """Align the key's bucket with the broker's rate-limit headers."""
+        limit, window = self.limits[provider]
+        pause = reset_in if remaining is not None and remaining <= 0 and reset_in else 0.0
+        await self.store.adjust(self._key(provider, api_key), limit, window, remaining, pause)
+
+    async def pause(self, provider: str, api_key: str, seconds: float):
+        """Stop spending the key's budget, after a 429 with ``Retry-After``."""
+        limit, window = self.limits[provider]
+        await self.store.adjust(self._key(provider, api_key), limit, window, pause=seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys_waiting": len(self._queues),
+            "store": self.store.stats(),
+            "lanes": {
+                lane: {
+                    "granted": stats["granted"],
+                    "queued": stats["queued"],
+                    "rejected": stats["rejected"],
+                    "avg_wait_ms": round(1000 * stats["total_wait"] / stats["granted"], 2) if stats["granted"] else 0.0,
+                    "max_wait_ms": round(1000 * stats["max_wait"], 2),
+                }
+                for lane, stats in self._lanes.items()
+            },
+        }
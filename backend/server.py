@@ -1,25 +1,51 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, status, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Body, status, Query, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteMany, InsertOne, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Generic, TypeVar
 from pathlib import Path
 from datetime import datetime, timedelta
 import uuid
 import os
 import logging
 import json
+import sys
+import time
+import random
+import asyncio
+from functools import lru_cache
 from dotenv import load_dotenv
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-import pandas as pd
-import numpy as np
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Sibling modules must import the same way under `server:app` and `backend.server:app`
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from auth_cache import IdentityCache
+from market_data import BASE_INTERVAL, INTERVALS, bars_to_records, bars_to_columns
+from bar_store import BarStore
+from asset_registry import AssetRegistry
+from indexes import ensure_indexes, missing_index_report
+from pagination import InvalidCursor, fetch_page, page_from_items
+from password_hashing import PasswordHasher, HasherBusy
+from signal_scheduler import SignalScheduler, Strategy, resolve
+from live_updates import LiveUpdates
+from pubsub import Hub, RedisBridge
+from portfolio import PortfolioBook
+from brokers import BrokerPool, BrokerNotConfigured, BrokerRejected, BrokerUnavailable, broker_urls
+from rate_limits import MemoryTokenStore, RateLimiter, RedisTokenStore
+from orders import OrdersElsewhere, RiskBook, RiskRejected, TradeWriter
+from price_monitor import PriceMonitor
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,6 +57,49 @@ logger = logging.getLogger(__name__)
 mongo_url = os.environ['MONGO_URL']
 client = AsyncIOMotorClient(mongo_url)
 db = client[os.environ.get('DB_NAME', 'ai_investment_agent')]
+bar_store = BarStore(db, base_retention=timedelta(hours=float(os.environ.get("BAR_BASE_RETENTION_HOURS", 48))))
+asset_registry = AssetRegistry(db, refresh_interval=float(os.environ.get("ASSET_REGISTRY_REFRESH_SECONDS", 5)))
+
+# numpy and the indicator, model and backtest code load on first use (the
+# startup hooks at the latest), so importing the app stays light;
+# scripts/import_profile.py fails if any of them is imported with it
+
+@lru_cache(maxsize=None)
+def get_indicator_state():
+    from indicator_state import IndicatorState
+    
+    return IndicatorState(db)
+
+def price_model_path() -> str:
+    import price_model
+    
+    return os.environ.get("PRICE_MODEL_PATH", price_model.DEFAULT_PATH)
+
+@lru_cache(maxsize=None)
+def get_model_pool():
+    # Worker processes for model inference, started by the first prediction; each loads the models once.
+    # The price model is trained into the image; price_model.load trains it if it is missing.
+    from model_pool import ModelPool, ModelSpec
+    from news_sentiment import MODEL_NAME
+    
+    # Per API process: API_WORKERS processes start up to API_WORKERS x MODEL_WORKERS model
+    # processes between them, so each pool is capped at the CPU count
+    pool = ModelPool(
+        workers=min(int(os.environ.get("MODEL_WORKERS", 2)), os.cpu_count() or 1),
+        max_batch=int(os.environ.get("MODEL_MAX_BATCH", 256)),
+        max_wait=float(os.environ.get("MODEL_MAX_WAIT_MS", 5)) / 1000,
+    )
+    pool.register(ModelSpec("price_predictor", "price_model:load", (price_model_path(),), "predict_proba"))
+    pool.register(ModelSpec(MODEL_NAME, "news_sentiment:load_scorer", (), "score"))
+    return pool
+
+@lru_cache(maxsize=None)
+def get_sentiment_pipeline():
+    from news_sentiment import SentimentPipeline
+    
+    return SentimentPipeline(
+        db, get_model_pool(), half_life=timedelta(hours=float(os.environ.get("SENTIMENT_HALF_LIFE_HOURS", 6)))
+    )
 
 # Security settings
 SECRET_KEY = os.environ.get("SECRET_KEY", "supersecretkey")  # In production, use a proper env var
@@ -38,8 +107,26 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on worker threads so logins never block the event loop
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.environ.get("PASSWORD_HASH_WORKERS", 4)),
+    max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 256)),
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
+# Verified tokens -> users, so authenticated routes skip the users lookup
+identity_cache = IdentityCache(
+    maxsize=int(os.environ.get("IDENTITY_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("IDENTITY_CACHE_TTL_SECONDS", 60)),
+)
+
+# Write generated signals and alerts in one transaction (needs a replica set)
+SIGNAL_WRITE_TRANSACTIONS = os.environ.get("SIGNAL_WRITE_TRANSACTIONS", "false").lower() == "true"
+
+# Run enabled AI models in the background on their update_frequency
+SIGNAL_SCHEDULER_ENABLED = os.environ.get("SIGNAL_SCHEDULER_ENABLED", "true").lower() == "true"
+
 # Create the main app without a prefix
 app = FastAPI(title="AI Investment Agent")
 
@@ -109,6 +196,9 @@ class Position(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class PositionWithAsset(Position):
+    asset: Optional[Asset] = None
+
 class Trade(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
@@ -142,7 +232,7 @@ class Alert(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     asset_id: Optional[str] = None
-    alert_type: str  # price_target, signal_generated, trade_executed
+    alert_type: str  # price_target, stop_loss, trailing_stop, signal_generated, trade_executed
     message: str
     is_read: bool = False
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -189,6 +279,12 @@ class MarketData(BaseModel):
     interval: str  # 1m, 5m, 1h, 1d, etc.
     source: str  # alpaca, binance, etc.
 
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # pass back as `cursor` to get the next page
+
 class NewsSentiment(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     asset_id: str
@@ -200,15 +296,50 @@ class NewsSentiment(BaseModel):
     published_at: datetime
     analyzed_at: datetime = Field(default_factory=datetime.utcnow)
 
+class NewsItemCreate(BaseModel):
+    symbol: str
+    title: str
+    source: str
+    url: str
+    importance: float = Field(0.5, ge=0, le=1)
+    published_at: datetime = Field(default_factory=datetime.utcnow)
+
+class BacktestRequest(BaseModel):
+    symbols: List[str]
+    model: str = "trend_detector"  # AIModel name slug or model_type
+    interval: str = "1h"
+    bars: int = Field(2000, ge=100, le=50000)
+    # "stored" reads (and fills) the bar store; "generated" builds synthetic bars in the workers
+    history: str = Field("stored", pattern="^(stored|generated)$")
+    initial_capital: float = Field(10000.0, gt=0)
+    # Unset fields come from the user's RiskSettings
+    position_size_pct: Optional[float] = Field(None, gt=0, le=100)
+    stop_loss_pct: Optional[float] = Field(None, ge=0)
+    trailing_stop_pct: Optional[float] = Field(None, gt=0)
+    entry_threshold: Optional[float] = Field(None, ge=0, le=1)
+    allow_short: bool = False
+    cost_bps: float = Field(0.0, ge=0)
+    sweep: Optional[Dict[str, List[float]]] = None  # e.g. {"stop_loss_pct": [1, 2, 4]}
+    max_trades: int = Field(200, ge=0, le=5000)
+
+class OrderRequest(BaseModel):
+    symbol: str
+    side: str = Field(..., pattern="^(buy|sell)$")
+    quantity: float = Field(..., gt=0)
+    order_type: str = Field("market", pattern="^(market|limit)$")
+    limit_price: Optional[float] = Field(None, gt=0)
+    stop_loss: Optional[float] = Field(None, gt=0)  # price; defaults from RiskSettings
+    provider: Optional[str] = None  # defaults by asset type
+
 #-------------
 # Security Utils
 #-------------
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 async def get_user(username: str):
     user_dict = await db.users.find_one({"username": username})
@@ -216,11 +347,17 @@ async def get_user(username: str):
         return UserInDB(**user_dict)
     return None
 
+async def update_user(username: str, updates: Dict[str, Any]):
+    # Every write to db.users goes through here so cached identities never go stale
+    result = await db.users.update_one({"username": username}, {"$set": updates})
+    identity_cache.invalidate_user(username)
+    return result
+
 async def authenticate_user(username: str, password: str):
     user = await get_user(username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
@@ -240,15 +377,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+
+    async def load_user():
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            token_data = TokenData(username=username)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = await get_user(username=token_data.username)
+        user = await get_user(username=token_data.username)
+        if user is not None:
+            # Cached for the token's lifetime, so the password hash stays out of it
+            user = User(**user.model_dump(exclude={"hashed_password"}))
+        return token_data.username, user, payload.get("exp")
+
+    user = await identity_cache.get_or_load(token, load_user)
     if user is None:
         raise credentials_exception
     return user
@@ -295,19 +440,32 @@ async def register_user(user: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     user_in_db = UserInDB(
         **user.model_dump(exclude={"password"}),
         hashed_password=hashed_password
     )
     
-    await db.users.insert_one(user_in_db.model_dump())
+    try:
+        await db.users.insert_one(user_in_db.model_dump())
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration for the same username/email
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username or email already registered"
+        )
+    identity_cache.invalidate_user(user_in_db.username)
     return User(**user_in_db.model_dump(exclude={"hashed_password"}))
 
 @api_router.get("/auth/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
+@api_router.post("/auth/me/deactivate")
+async def deactivate_user(current_user: User = Depends(get_current_active_user)):
+    await update_user(current_user.username, {"is_active": False})
+    return {"message": "User deactivated"}
+
 #-------------
 # API Config Routes
 #-------------
@@ -335,7 +493,7 @@ async def create_api_config(
         # Update existing config
         await db.api_configs.update_one(
             {"_id": existing_config["_id"]},
-            {"$set": api_config.model_dump(exclude={"id"})}
+            {"$set": api_config.model_dump(exclude={"id"}), "$unset": {"positions_synced_at": ""}}
         )
         api_config.id = str(existing_config["_id"])
     else:
@@ -343,6 +501,8 @@ async def create_api_config(
         result = await db.api_configs.insert_one(api_config.model_dump())
         api_config.id = str(result.inserted_id)
     
+    # Pooled clients hold the old credentials
+    await broker_pool.evict(current_user.id, config.provider)
     return api_config
 
 @api_router.get("/trading/config", response_model=List[TradingAPIConfig])
@@ -366,41 +526,142 @@ async def delete_api_config(
             detail="Config not found or not authorized to delete"
         )
     
+    await broker_pool.evict(current_user.id)
     return {"message": "Config deleted successfully"}
 
 #-------------
-# Portfolio Routes
+# Broker Routes
 #-------------
 
-@api_router.get("/portfolio/summary", response_model=PortfolioSnapshot)
-async def get_portfolio_summary(current_user: User = Depends(get_current_active_user)):
-    # In a real app, this would fetch live data from Alpaca/Binance
-    # For demonstration, we'll create a mock portfolio
+async def load_api_config(user_id: str, provider: str) -> Optional[dict]:
+    return await db.api_configs.find_one({"user_id": user_id, "provider": provider})
+
+# Every worker spends the same per-key budgets; without Redis they only hold within this process
+RATE_LIMIT_REDIS_URL = os.environ.get("RATE_LIMIT_REDIS_URL")
+rate_limiter = RateLimiter(
+    RedisTokenStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryTokenStore(),
+    max_queue=int(os.environ.get("RATE_LIMIT_MAX_QUEUE", 1000)),
+)
+
+# One keep-alive client per (user, provider); FAKE_BROKER_URL points every provider at fake_broker.py
+broker_pool = BrokerPool(
+    load_api_config,
+    limiter=rate_limiter,
+    urls=broker_urls(os.environ.get("FAKE_BROKER_URL")),
+    idle_timeout=float(os.environ.get("BROKER_IDLE_SECONDS", 300)),
+    timeout=float(os.environ.get("BROKER_TIMEOUT_SECONDS", 10)),
+)
+
+# Position reads within this long of a provider's last sync (from any worker) skip the broker call
+POSITION_SYNC_SECONDS = float(os.environ.get("POSITION_SYNC_SECONDS", 30))
+
+async def sync_broker_positions(user_id: str, providers: List[str]) -> List[str]:
+    """Replace the stored positions of each provider with what the broker holds; returns the providers synced."""
+    async def fetch(provider: str):
+        adapter = await broker_pool.adapter(user_id, provider)
+        return await adapter.positions()
     
-    latest_snapshot = await db.portfolio_snapshots.find_one(
-        {"user_id": current_user.id},
-        sort=[("timestamp", -1)]  # Get the most recent
-    )
+    results = await asyncio.gather(*[fetch(provider) for provider in providers], return_exceptions=True)
+    held = {}
+    for provider, result in zip(providers, results):
+        if isinstance(result, (BrokerUnavailable, BrokerNotConfigured)):
+            # Serve the last synced positions rather than failing the whole page
+            logger.warning("Keeping stored %s positions for %s: %s", provider, user_id, result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            held[provider] = result
+    if not held:
+        return []
     
-    if not latest_snapshot:
-        # Create a mock portfolio if none exists
-        mock_portfolio = PortfolioSnapshot(
-            user_id=current_user.id,
-            cash_balance=10000.0,
-            portfolio_value=15000.0,
-            day_change_pct=1.2,
-            total_pl=500.0
-        )
-        await db.portfolio_snapshots.insert_one(mock_portfolio.model_dump())
-        return mock_portfolio
+    assets = await asset_registry.add([
+        Asset(
+            symbol=position["symbol"],
+            name=position["symbol"],
+            asset_type="stock" if provider == "alpaca" else "crypto",
+            exchange=provider.capitalize(),
+        ).model_dump()
+        for provider, positions in held.items() for position in positions
+    ])
+    stored = {
+        (doc["provider"], doc["asset_id"]): doc
+        for doc in await db.positions.find({"user_id": user_id, "provider": {"$in": list(held)}}).to_list(length=1000)
+    }
     
-    return PortfolioSnapshot(**latest_snapshot)
+    now = datetime.utcnow()
+    operations = []
+    for provider, positions in held.items():
+        for position in positions:
+            asset_id = assets[position["symbol"]]["id"]
+            existing = stored.pop((provider, asset_id), None)
+            # Spot balances have no entry price: keep ours, else start from the current price
+            entry = position["avg_entry_price"]
+            if entry is None:
+                entry = existing["avg_entry_price"] if existing else position["current_price"] or 0.0
+            if existing:
+                operations.append(UpdateOne(
+                    {"id": existing["id"]},
+                    {"$set": {"quantity": position["quantity"], "avg_entry_price": entry, "updated_at": now}},
+                ))
+            else:
+                operations.append(InsertOne(Position(
+                    user_id=user_id,
+                    asset_id=asset_id,
+                    provider=provider,
+                    quantity=position["quantity"],
+                    avg_entry_price=entry,
+                ).model_dump()))
+    if stored:
+        # Closed at the broker since the last sync
+        operations.append(DeleteMany({"id": {"$in": [doc["id"] for doc in stored.values()]}}))
+    if operations:
+        await db.positions.bulk_write(operations, ordered=False)
+    await db.api_configs.update_many(
+        {"user_id": user_id, "provider": {"$in": list(held)}},
+        {"$set": {"positions_synced_at": now}}
+    )
+    await portfolio_book.reload_user(user_id)
+    watch_user_positions(user_id)
+    return list(held)
+
+@api_router.get("/trading/account")
+async def get_broker_accounts(current_user: User = Depends(get_current_active_user)):
+    configs = await db.api_configs.find({"user_id": current_user.id}).to_list(length=10)
+    adapters = [await broker_pool.adapter(current_user.id, config["provider"]) for config in configs]
+    return await asyncio.gather(*[adapter.account() for adapter in adapters])
+
+@api_router.get("/trading/orders")
+async def get_broker_orders(
+    provider: str = Query(...),
+    current_user: User = Depends(get_current_active_user)
+):
+    adapter = await broker_pool.adapter(current_user.id, provider)
+    return await adapter.orders()
 
-@api_router.get("/portfolio/positions", response_model=List[Position])
+#-------------
+# Portfolio Routes
+#-------------
+
+@api_router.get("/portfolio/summary", response_model=PortfolioSnapshot)
+async def get_portfolio_summary(current_user: User = Depends(get_current_active_user)):
+    # Valued live from the in-memory book; snapshots are written on a schedule
+    await portfolio_book.ensure_user(current_user.id)
+    return PortfolioSnapshot(**portfolio_book.summary(current_user.id))
+
+@api_router.get("/portfolio/positions", response_model=List[PositionWithAsset])
 async def get_positions(current_user: User = Depends(get_current_active_user)):
-    positions = await db.positions.find({"user_id": current_user.id}).to_list(length=100)
+    configs = await db.api_configs.find({"user_id": current_user.id}).to_list(length=10)
+    # Connected accounts are the source of truth, re-read once their last sync goes stale
+    stale_before = datetime.utcnow() - timedelta(seconds=POSITION_SYNC_SECONDS)
+    stale = [
+        config["provider"] for config in configs
+        if not config.get("positions_synced_at") or config["positions_synced_at"] < stale_before
+    ]
+    if stale:
+        await sync_broker_positions(current_user.id, stale)
+    await portfolio_book.ensure_user(current_user.id)
     
-    if not positions:
+    if not configs and not portfolio_book.positions(current_user.id):
         # Create mock positions for demonstration
         sample_assets = [
             {"symbol": "AAPL", "name": "Apple Inc.", "asset_type": "stock", "exchange": "NASDAQ"},
@@ -408,21 +669,17 @@ async def get_positions(current_user: User = Depends(get_current_active_user)):
             {"symbol": "BTC", "name": "Bitcoin", "asset_type": "crypto", "exchange": "Binance"}
         ]
         
+        # Create the assets if they don't exist
+        assets = await asset_registry.add([Asset(**asset).model_dump() for asset in sample_assets])
+        
         mock_positions = []
         for asset in sample_assets:
-            # Create the asset if it doesn't exist
-            existing_asset = await db.assets.find_one({"symbol": asset["symbol"]})
-            if not existing_asset:
-                new_asset = Asset(**asset)
-                result = await db.assets.insert_one(new_asset.model_dump())
-                asset_id = str(result.inserted_id)
-            else:
-                asset_id = str(existing_asset["_id"])
+            asset_model = Asset(**assets[asset["symbol"]])
             
             # Create a position
-            position = Position(
+            position = PositionWithAsset(
                 user_id=current_user.id,
-                asset_id=asset_id,
+                asset_id=asset_model.id,
                 provider="alpaca" if asset["asset_type"] == "stock" else "binance",
                 quantity=10 if asset["asset_type"] == "stock" else 0.5,
                 avg_entry_price=150.0 if asset["asset_type"] == "stock" else 30000.0,
@@ -430,19 +687,20 @@ async def get_positions(current_user: User = Depends(get_current_active_user)):
                 unrealized_pl=150.0 if asset["asset_type"] == "stock" else 1000.0,
                 market_value=1650.0 if asset["asset_type"] == "stock" else 16000.0
             )
-            await db.positions.insert_one(position.model_dump())
+            await db.positions.insert_one(position.model_dump(exclude={"asset"}))
+            position.asset = asset_model
             mock_positions.append(position)
         
+        # The book loaded this user with no positions; pick up the new ones
+        await portfolio_book.reload_user(current_user.id)
+        watch_user_positions(current_user.id)
         return mock_positions
     
-    # Enrich positions with asset details
-    result = []
-    for position in positions:
-        asset = await db.assets.find_one({"_id": position["asset_id"]})
-        position["asset"] = asset
-        result.append(Position(**position))
-    
-    return result
+    # Marked at the latest prices, enriched with asset details from the registry
+    return [
+        PositionWithAsset(**position, asset=asset_registry.by_id(position["asset_id"]))
+        for position in portfolio_book.positions(current_user.id)
+    ]
 
 @api_router.get("/portfolio/history", response_model=List[PortfolioSnapshot])
 async def get_portfolio_history(current_user: User = Depends(get_current_active_user)):
@@ -458,7 +716,7 @@ async def get_portfolio_history(current_user: User = Depends(get_current_active_
         
         for i in range(30):
             day_offset = timedelta(days=i)
-            daily_change = np.random.normal(0.001, 0.01)  # Random daily change
+            daily_change = random.gauss(0.001, 0.01)  # Random daily change
             
             snapshot = PortfolioSnapshot(
                 user_id=current_user.id,
@@ -479,94 +737,48 @@ async def get_portfolio_history(current_user: User = Depends(get_current_active_
 # Signals Routes
 #-------------
 
-@api_router.get("/signals", response_model=List[Signal])
+@api_router.get("/signals", response_model=Page[Signal])
 async def get_signals(
     current_user: User = Depends(get_current_active_user),
     active_only: bool = Query(True),
-    limit: int = Query(20)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
 ):
     query = {"user_id": current_user.id}
     if active_only:
         query["is_active"] = True
     
-    signals = await db.signals.find(query).sort("created_at", -1).to_list(length=limit)
+    # Signals are written by the background scheduler; reading never computes them
+    signals, next_cursor = await fetch_page(db.signals, query, "created_at", limit, cursor)
     
-    if not signals:
-        # Generate mock signals
-        mock_signals = []
-        assets = await db.assets.find().to_list(length=10)
-        
-        if not assets:
-            # If no assets, create some
-            sample_assets = [
-                {"symbol": "AAPL", "name": "Apple Inc.", "asset_type": "stock", "exchange": "NASDAQ"},
-                {"symbol": "MSFT", "name": "Microsoft Corporation", "asset_type": "stock", "exchange": "NASDAQ"},
-                {"symbol": "GOOGL", "name": "Alphabet Inc.", "asset_type": "stock", "exchange": "NASDAQ"},
-                {"symbol": "AMZN", "name": "Amazon.com Inc.", "asset_type": "stock", "exchange": "NASDAQ"},
-                {"symbol": "BTC", "name": "Bitcoin", "asset_type": "crypto", "exchange": "Binance"},
-                {"symbol": "ETH", "name": "Ethereum", "asset_type": "crypto", "exchange": "Binance"}
-            ]
-            
-            for asset_data in sample_assets:
-                asset = Asset(**asset_data)
-                result = await db.assets.insert_one(asset.model_dump())
-                assets.append({"_id": result.inserted_id, **asset_data})
-        
-        signal_types = ["buy", "sell", "hold"]
-        timeframes = ["short_term", "medium_term", "long_term"]
-        models = ["sentiment_analyzer", "price_predictor", "trend_detector", "hybrid_model"]
-        
-        for _ in range(10):
-            asset = np.random.choice(assets)
-            signal_type = np.random.choice(signal_types)
-            
-            signal = Signal(
-                user_id=current_user.id,
-                asset_id=str(asset["_id"]),
-                signal_type=signal_type,
-                confidence=round(np.random.uniform(0.6, 0.95), 2),
-                price_target=round(np.random.uniform(100, 200), 2) if signal_type != "hold" else None,
-                stop_loss=round(np.random.uniform(80, 95), 2) if signal_type == "buy" else None,
-                timeframe=np.random.choice(timeframes),
-                rationale=f"Based on technical analysis and recent {asset['symbol']} performance.",
-                created_by=np.random.choice(models),
-                created_at=datetime.utcnow() - timedelta(hours=np.random.randint(1, 72)),
-                expires_at=datetime.utcnow() + timedelta(days=np.random.randint(1, 7)),
-                is_active=True
-            )
-            
-            await db.signals.insert_one(signal.model_dump())
-            mock_signals.append(signal)
-        
-        return mock_signals
-    
-    return [Signal(**signal) for signal in signals]
+    return Page[Signal](items=[Signal(**signal) for signal in signals], next_cursor=next_cursor)
 
 #-------------
 # Trades Routes
 #-------------
 
-@api_router.get("/trades", response_model=List[Trade])
+@api_router.get("/trades", response_model=Page[Trade])
 async def get_trades(
     current_user: User = Depends(get_current_active_user),
-    limit: int = Query(20)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
 ):
-    trades = await db.trades.find({"user_id": current_user.id}).sort("created_at", -1).to_list(length=limit)
+    trades, next_cursor = await fetch_page(db.trades, {"user_id": current_user.id}, "created_at", limit, cursor)
     
-    if not trades:
+    if not trades and not cursor:
         # Generate mock trades
         mock_trades = []
-        assets = await db.assets.find().to_list(length=10)
+        assets = asset_registry.list()[:10]
         
         for _ in range(10):
-            asset = np.random.choice(assets)
-            side = np.random.choice(["buy", "sell"])
-            price = round(np.random.uniform(100, 200), 2)
-            quantity = round(np.random.uniform(1, 10), 2)
+            asset = random.choice(assets)
+            side = random.choice(["buy", "sell"])
+            price = round(random.uniform(100, 200), 2)
+            quantity = round(random.uniform(1, 10), 2)
             
             trade = Trade(
                 user_id=current_user.id,
-                asset_id=str(asset["_id"]),
+                asset_id=asset["id"],
                 provider="alpaca" if asset["asset_type"] == "stock" else "binance",
                 order_id=str(uuid.uuid4()),
                 side=side,
@@ -574,67 +786,176 @@ async def get_trades(
                 price=price,
                 order_type="market",
                 status="filled",
-                created_at=datetime.utcnow() - timedelta(days=np.random.randint(0, 30))
+                created_at=datetime.utcnow() - timedelta(days=random.randint(0, 29))
             )
             
             await db.trades.insert_one(trade.model_dump())
-            mock_trades.append(trade)
+            mock_trades.append(trade.model_dump())
         
-        return sorted(mock_trades, key=lambda x: x.created_at, reverse=True)
+        trades, next_cursor = page_from_items(mock_trades, "created_at", limit)
+    
+    return Page[Trade](items=[Trade(**trade) for trade in trades], next_cursor=next_cursor)
+
+#-------------
+# Order Execution
+#-------------
+
+# Broker order statuses that can still fill
+OPEN_ORDER_STATUSES = {
+    "new", "accepted", "pending_new", "partially_filled", "accepted_for_bidding", "held", "pending_replace",
+    "pending_cancel", "calculated", "done_for_day",
+}
+
+async def take_over_orders():
+    """Bring a new order-path owner's book up to date and reserve the orders left resting at brokers."""
+    await portfolio_book.sync()
+    async for trade in db.trades.find({"status": {"$in": list(OPEN_ORDER_STATUSES)}}, {"_id": 0}):
+        risk_book.resume(trade)
+
+async def settle_resting_orders(user_id: str, provider: str, order_ids: List[str]) -> List[str]:
+    """The resting orders the broker has closed, after syncing their fills into the book."""
+    adapter = await broker_pool.adapter(user_id, provider)
+    orders = {order["id"]: order for order in await adapter.orders()}
+    # Binance lists open orders only; a missing one has filled or been cancelled
+    closed = [
+        order_id for order_id in order_ids
+        if order_id not in orders or orders[order_id]["status"] not in OPEN_ORDER_STATUSES
+    ]
+    if not closed or provider not in await sync_broker_positions(user_id, [provider]):
+        return []
+    for order_id in closed:
+        order = orders.get(order_id)
+        await db.trades.update_one(
+            {"provider": provider, "order_id": order_id}, {"$set": {"status": order["status"] if order else "closed"}}
+        )
+    return closed
+
+# Pre-trade checks run on cached settings and the in-memory book; trades are persisted behind the response.
+# One worker at a time owns the order path; ORDER_PATH_ENABLED=false keeps this process out of it.
+# entrypoint.sh runs the order path as its own process and nginx routes /api/orders to it.
+risk_book = RiskBook(
+    db,
+    default=lambda user_id: default_risk_settings(user_id).model_dump(),
+    refresh_interval=float(os.environ.get("RISK_SETTINGS_REFRESH_SECONDS", 5)),
+    accept_orders=os.environ.get("ORDER_PATH_ENABLED", "true").lower() == "true",
+    on_takeover=take_over_orders,
+    settle=settle_resting_orders,
+)
+trade_writer = TradeWriter(db.trades, flush_interval=float(os.environ.get("TRADE_WRITE_INTERVAL_MS", 50)) / 1000)
+
+@api_router.post("/orders", response_model=Trade)
+async def place_order(order: OrderRequest, current_user: User = Depends(get_current_active_user)):
+    # Before any awaits, so other workers never warm accounts or adapters for orders they cannot take
+    risk_book.require_owner()
+    asset = asset_registry.by_symbol(order.symbol.upper())
+    if not asset:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown symbol: {order.symbol}")
+    if order.order_type == "limit" and order.limit_price is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Limit orders need a limit_price")
+    provider = order.provider or ("alpaca" if asset["asset_type"] == "stock" else "binance")
+    
+    # Warm after the user's first order or portfolio view: pooled adapter, loaded account, held prices
+    adapter = await broker_pool.adapter(current_user.id, provider)
+    account = await portfolio_book.ensure_user(current_user.id)
+    price = order.limit_price or portfolio_book.price(asset["id"]) or await latest_price(asset["id"])
+    if price is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"No price for {asset['symbol']}")
+    
+    check = risk_book.check(account, asset["id"], order.side, order.quantity, price, order.stop_loss)
+    trade_id = str(uuid.uuid4())
+    try:
+        # The trade id doubles as the client order id, so broker retries cannot fill twice
+        placed = await adapter.submit_order(
+            asset["symbol"], order.side, order.quantity, order.order_type, order.limit_price, client_order_id=trade_id
+        )
+    except BaseException:
+        risk_book.release(check, submitted=False)
+        raise
     
-    return [Trade(**trade) for trade in trades]
+    trade = Trade(
+        id=trade_id,
+        user_id=current_user.id,
+        asset_id=asset["id"],
+        provider=provider,
+        order_id=placed["id"],
+        side=order.side,
+        quantity=order.quantity,
+        price=placed["filled_price"] or price,
+        order_type=order.order_type,
+        status=placed["status"],
+    )
+    fill = position = None
+    if placed["filled_quantity"]:
+        fill = {**trade.model_dump(), "quantity": placed["filled_quantity"]}
+        position = portfolio_book.apply_fill(fill)
+        if position is not None:
+            price_monitor.watch_position(position, risk_book.limits(current_user.id), order.stop_loss)
+    # Released once the fill is in the book, so the exposure is never counted twice or missed.
+    # What the broker has only accepted stays reserved until settle_resting_orders sees it close.
+    if placed["status"] in OPEN_ORDER_STATUSES:
+        risk_book.hold(check, placed["filled_quantity"], provider, placed["id"])
+    else:
+        risk_book.release(check)
+    trade_writer.put(trade.model_dump())
+    if fill is not None:
+        # Stored now rather than at the next snapshot, which no longer writes quantities or cash
+        await portfolio_book.persist_fill(fill, position)
+    return trade
 
 #-------------
 # Alerts Routes
 #-------------
 
-@api_router.get("/alerts", response_model=List[Alert])
+@api_router.get("/alerts", response_model=Page[Alert])
 async def get_alerts(
     current_user: User = Depends(get_current_active_user),
-    unread_only: bool = Query(False)
+    unread_only: bool = Query(False),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
 ):
     query = {"user_id": current_user.id}
     if unread_only:
         query["is_read"] = False
     
-    alerts = await db.alerts.find(query).sort("created_at", -1).to_list(length=50)
+    alerts, next_cursor = await fetch_page(db.alerts, query, "created_at", limit, cursor)
     
-    if not alerts:
+    if not alerts and not cursor:
         # Generate mock alerts
         mock_alerts = []
-        assets = await db.assets.find().to_list(length=10)
+        assets = asset_registry.list()[:10]
         
         for i in range(10):
-            asset = np.random.choice(assets)
+            asset = random.choice(assets)
             alert_types = ["price_target", "signal_generated", "trade_executed"]
-            alert_type = np.random.choice(alert_types)
+            alert_type = random.choice(alert_types)
             
             if alert_type == "price_target":
-                message = f"{asset['symbol']} has reached your price target of ${round(np.random.uniform(100, 200), 2)}"
+                message = f"{asset['symbol']} has reached your price target of ${round(random.uniform(100, 200), 2)}"
             elif alert_type == "signal_generated":
-                signal_type = np.random.choice(["buy", "sell", "hold"])
-                message = f"New {signal_type} signal generated for {asset['symbol']} with {round(np.random.uniform(0.6, 0.95), 2)*100}% confidence"
+                signal_type = random.choice(["buy", "sell", "hold"])
+                message = f"New {signal_type} signal generated for {asset['symbol']} with {round(random.uniform(0.6, 0.95), 2)*100}% confidence"
             else:
-                side = np.random.choice(["buy", "sell"])
-                qty = round(np.random.uniform(1, 10), 2)
-                price = round(np.random.uniform(100, 200), 2)
+                side = random.choice(["buy", "sell"])
+                qty = round(random.uniform(1, 10), 2)
+                price = round(random.uniform(100, 200), 2)
                 message = f"Successfully {side} {qty} {asset['symbol']} at ${price}"
             
             alert = Alert(
                 user_id=current_user.id,
-                asset_id=str(asset["_id"]),
+                asset_id=asset["id"],
                 alert_type=alert_type,
                 message=message,
                 is_read=i < 5,  # Make about half read
-                created_at=datetime.utcnow() - timedelta(hours=np.random.randint(1, 72))
+                created_at=datetime.utcnow() - timedelta(hours=random.randint(1, 71))
             )
             
             await db.alerts.insert_one(alert.model_dump())
-            mock_alerts.append(alert)
+            if not unread_only or not alert.is_read:
+                mock_alerts.append(alert.model_dump())
         
-        return sorted(mock_alerts, key=lambda x: x.created_at, reverse=True)
+        alerts, next_cursor = page_from_items(mock_alerts, "created_at", limit)
     
-    return [Alert(**alert) for alert in alerts]
+    return Page[Alert](items=[Alert(**alert) for alert in alerts], next_cursor=next_cursor)
 
 @api_router.post("/alerts/{alert_id}/read")
 async def mark_alert_read(
@@ -658,20 +979,23 @@ async def mark_alert_read(
 # Settings Routes
 #-------------
 
+def default_risk_settings(user_id: str) -> RiskSettings:
+    return RiskSettings(
+        user_id=user_id,
+        max_position_size=5.0,  # 5% of portfolio
+        max_loss_per_trade=1.0,  # 1% of portfolio
+        default_stop_loss=2.0,   # 2% below entry
+        trailing_stop_loss=False,
+        trailing_stop_pct=None
+    )
+
 @api_router.get("/settings/risk", response_model=RiskSettings)
 async def get_risk_settings(current_user: User = Depends(get_current_active_user)):
     settings = await db.risk_settings.find_one({"user_id": current_user.id})
     
     if not settings:
         # Create default settings
-        default_settings = RiskSettings(
-            user_id=current_user.id,
-            max_position_size=5.0,  # 5% of portfolio
-            max_loss_per_trade=1.0,  # 1% of portfolio
-            default_stop_loss=2.0,   # 2% below entry
-            trailing_stop_loss=False,
-            trailing_stop_pct=None
-        )
+        default_settings = default_risk_settings(current_user.id)
         await db.risk_settings.insert_one(default_settings.model_dump())
         return default_settings
     
@@ -690,124 +1014,477 @@ async def update_risk_settings(
         )
     
     existing_settings = await db.risk_settings.find_one({"user_id": current_user.id})
+    settings.updated_at = datetime.utcnow()
     
     if existing_settings:
         await db.risk_settings.update_one(
             {"_id": existing_settings["_id"]},
-            {"$set": {**settings.model_dump(exclude={"id", "created_at"}), "updated_at": datetime.utcnow()}}
+            {"$set": settings.model_dump(exclude={"id", "created_at"})}
         )
-        return RiskSettings(**settings.model_dump(), id=str(existing_settings["_id"]))
+        settings.id = str(existing_settings["_id"])
     else:
         result = await db.risk_settings.insert_one(settings.model_dump())
-        return RiskSettings(**settings.model_dump(), id=str(result.inserted_id))
+        settings.id = str(result.inserted_id)
+    
+    # Orders are checked against the cached copy; other workers pick it up by updated_at
+    risk_book.set(settings.model_dump())
+    watch_user_positions(current_user.id)
+    return settings
 
 #-------------
 # AI Models Routes
 #-------------
 
-@api_router.get("/ai/models", response_model=List[AIModel])
-async def get_ai_models():
+DEFAULT_AI_MODELS = [
+    AIModel(
+        name="Sentiment Analyzer",
+        description="Analyzes news and social media for market sentiment",
+        model_type="sentiment",
+        config={"sources": ["news", "twitter", "reddit"], "update_frequency": "hourly"}
+    ),
+    AIModel(
+        name="Price Predictor",
+        description="Predicts price movements using historical data",
+        model_type="price_prediction",
+        config={"timeframes": ["1h", "1d", "1w"], "features": ["price", "volume", "indicators"], "interval": "1h", "update_frequency": "hourly"}
+    ),
+    AIModel(
+        name="Trend Detector",
+        description="Identifies market trends using technical analysis",
+        model_type="trend_detection",
+        config={"indicators": ["moving_average", "rsi", "macd"], "threshold": 0.7, "interval": "1h", "update_frequency": "hourly"}
+    ),
+    AIModel(
+        name="Hybrid Strategy",
+        description="Combines multiple signals for more robust predictions",
+        model_type="hybrid",
+        config={"models": ["sentiment", "price_prediction", "trend_detection"], "weights": [0.3, 0.4, 0.3]}
+    )
+]
+
+async def ensure_default_models() -> List[dict]:
     models = await db.ai_models.find().to_list(length=100)
-    
     if not models:
-        # Create default AI models
-        default_models = [
-            AIModel(
-                name="Sentiment Analyzer",
-                description="Analyzes news and social media for market sentiment",
-                model_type="sentiment",
-                config={"sources": ["news", "twitter", "reddit"], "update_frequency": "hourly"}
-            ),
-            AIModel(
-                name="Price Predictor",
-                description="Predicts price movements using historical data",
-                model_type="price_prediction",
-                config={"timeframes": ["1h", "1d", "1w"], "features": ["price", "volume", "indicators"]}
-            ),
-            AIModel(
-                name="Trend Detector",
-                description="Identifies market trends using technical analysis",
-                model_type="trend_detection",
-                config={"indicators": ["moving_average", "rsi", "macd"], "threshold": 0.7}
-            ),
-            AIModel(
-                name="Hybrid Strategy",
-                description="Combines multiple signals for more robust predictions",
-                model_type="hybrid",
-                config={"models": ["sentiment", "price_prediction", "trend_detection"], "weights": [0.3, 0.4, 0.3]}
-            )
-        ]
-        
-        for model in default_models:
-            await db.ai_models.insert_one(model.model_dump())
-        
-        return default_models
+        models = [model.model_dump() for model in DEFAULT_AI_MODELS]
+        await db.ai_models.insert_many([dict(model) for model in models])
+    return models
+
+@api_router.get("/ai/models", response_model=List[AIModel])
+async def get_ai_models():
+    return [AIModel(**model) for model in await ensure_default_models()]
+
+def model_slug(model: dict) -> str:
+    # "Trend Detector" -> "trend_detector", the Signal.created_by value
+    return model["name"].lower().replace(" ", "_")
+
+def scored_signal(user_id: str, asset_id: str, scored: Dict[str, Any], row: int, interval: str, now: datetime, created_by: str, rationale: str) -> Signal:
+    import indicators
     
-    return [AIModel(**model) for model in models]
+    signal_type = str(scored["signal_type"][row])
+    return Signal(
+        user_id=user_id,
+        asset_id=asset_id,
+        signal_type=signal_type,
+        confidence=float(scored["confidence"][row]),
+        price_target=float(scored["price_target"][row]) if signal_type != "hold" else None,
+        stop_loss=float(scored["stop_loss"][row]) if signal_type != "hold" else None,
+        timeframe=indicators.timeframe_for(interval),
+        rationale=rationale,
+        created_by=created_by,
+        created_at=now,
+        expires_at=now + indicators.signal_lifetime(interval),
+        is_active=True
+    )
+
+def signal_alert(signal: Signal, symbol: str, events: List[str]) -> Alert:
+    return Alert(
+        user_id=signal.user_id,
+        asset_id=signal.asset_id,
+        alert_type="signal_generated",
+        message=f"New {signal.signal_type} signal generated for {symbol} with {int(signal.confidence*100)}% confidence"
+                + (f" ({'; '.join(events)})" if events else ""),
+        is_read=False,
+        created_at=signal.created_at
+    )
+
+async def insert_signals_with_alerts(signals: List[dict], alerts: List[dict]):
+    """Write a batch of signals and their alerts with one insert_many each."""
+    if not signals:
+        return
+    if SIGNAL_WRITE_TRANSACTIONS:
+        # Requires a replica set; keeps a signal from landing without its alert
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                await db.signals.insert_many(signals, ordered=False, session=session)
+                if alerts:
+                    await db.alerts.insert_many(alerts, ordered=False, session=session)
+    else:
+        await asyncio.gather(
+            db.signals.insert_many(signals, ordered=False),
+            *([db.alerts.insert_many(alerts, ordered=False)] if alerts else [])
+        )
+    # Replaces each user's previous stop and target from the same model and asset
+    price_monitor.watch_signals(signals)
+    # Connected dashboards get the new rows as deltas
+    live_updates.publish_events("signals", signals)
+    live_updates.publish_events("alerts", alerts)
 
 @api_router.post("/ai/generate_signals")
 async def generate_signals(
     asset_symbols: List[str] = Body(...),
+    interval: str = Query("1h", description="Bar interval the indicators run on: 1m, 5m, 15m, 1h, 4h, 1d"),
+    lookback: int = Query(100, ge=50, le=1000, description="Bars used to warm up symbols with no indicator state yet"),
     current_user: User = Depends(get_current_active_user)
 ):
-    # This would normally use actual AI models to analyze data and generate signals
-    # For demonstration, we'll create mock signals
+    # Signals come from the trend detector: indicators computed over the
+    # stored bars for every requested symbol at once
+    import indicators
+    
+    symbols = list(dict.fromkeys(asset_symbols))
+    if not symbols:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one symbol is required"
+        )
+    if len(symbols) > 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most 1000 symbols per request"
+        )
+    
+    # Create any assets that don't exist yet, in one bulk write
+    missing = asset_registry.missing(symbols)
+    new_assets = []
+    for symbol in missing:
+        asset_type = "crypto" if symbol in ["BTC", "ETH"] else "stock"
+        exchange = "Binance" if asset_type == "crypto" else "NASDAQ"
+        new_assets.append(Asset(
+            symbol=symbol,
+            name=f"{symbol} Asset",
+            asset_type=asset_type,
+            exchange=exchange
+        ).model_dump())
+    if new_assets:
+        await asset_registry.add(new_assets)
+    assets = asset_registry.by_symbols(symbols)
+    created_symbols = set(missing)
+    
+    def load_bars(symbol: str, limit: int):
+        base_price = 150.0 if assets[symbol]["asset_type"] == "stock" else 30000.0
+        return bar_store.get_bars(symbol, interval, limit, base_price)
+    
+    # Indicator state advances only by the bars closed since the last call;
+    # symbols seen for the first time are warmed up from `lookback` bars
+    latest = await get_indicator_state().evaluate(interval, symbols, load_bars, warmup=lookback)
+    scored = indicators.score(latest)
+    now = datetime.utcnow()
     
     signals_created = []
-    for symbol in asset_symbols:
-        asset = await db.assets.find_one({"symbol": symbol})
-        
-        if not asset:
-            # Create the asset if it doesn't exist
-            asset_type = "crypto" if symbol in ["BTC", "ETH"] else "stock"
-            exchange = "Binance" if asset_type == "crypto" else "NASDAQ"
-            
-            new_asset = Asset(
-                symbol=symbol,
-                name=f"{symbol} Asset",
-                asset_type=asset_type,
-                exchange=exchange
-            )
-            result = await db.assets.insert_one(new_asset.model_dump())
-            asset_id = str(result.inserted_id)
-        else:
-            asset_id = str(asset["_id"])
-        
-        # Generate a random signal
-        signal_types = ["buy", "sell", "hold"]
-        timeframes = ["short_term", "medium_term", "long_term"]
-        models = ["sentiment_analyzer", "price_predictor", "trend_detector", "hybrid_model"]
-        
-        signal_type = np.random.choice(signal_types, p=[0.5, 0.3, 0.2])  # Bias towards buys
-        
-        signal = Signal(
-            user_id=current_user.id,
-            asset_id=asset_id,
-            signal_type=signal_type,
-            confidence=round(np.random.uniform(0.6, 0.95), 2),
-            price_target=round(np.random.uniform(100, 200), 2) if signal_type != "hold" else None,
-            stop_loss=round(np.random.uniform(80, 95), 2) if signal_type == "buy" else None,
-            timeframe=np.random.choice(timeframes),
-            rationale=f"AI analysis detected favorable patterns for a {signal_type} signal on {symbol}.",
-            created_by=np.random.choice(models),
-            expires_at=datetime.utcnow() + timedelta(days=np.random.randint(1, 7)),
-            is_active=True
+    signal_docs = []
+    alert_docs = []
+    results = []
+    for i, symbol in enumerate(symbols):
+        asset_id = assets[symbol]["id"]
+        if not scored["valid"][i]:
+            results.append({
+                "symbol": symbol,
+                "asset_id": asset_id,
+                "asset_created": symbol in created_symbols,
+                "signal_id": None,
+                "error": "Not enough price history"
+            })
+            continue
+        signal = scored_signal(
+            current_user.id, asset_id, scored, i, interval, now,
+            "trend_detector", indicators.rationale(symbol, scored, i)
         )
-        
-        await db.signals.insert_one(signal.model_dump())
         signals_created.append(signal)
+        signal_docs.append(signal.model_dump())
         
         # Create an alert for the new signal
-        alert = Alert(
-            user_id=current_user.id,
-            asset_id=asset_id,
-            alert_type="signal_generated",
-            message=f"New {signal_type} signal generated for {symbol} with {int(signal.confidence*100)}% confidence",
-            is_read=False
+        alert_docs.append(signal_alert(signal, symbol, scored["events"][i]).model_dump())
+        
+        results.append({
+            "symbol": symbol,
+            "asset_id": asset_id,
+            "asset_created": symbol in created_symbols,
+            "signal_id": signal.id,
+            "signal_type": signal.signal_type,
+            "confidence": signal.confidence
+        })
+    
+    await insert_signals_with_alerts(signal_docs, alert_docs)
+    
+    return {
+        "message": f"Generated {len(signals_created)} signals",
+        "signals": signals_created,
+        "results": results
+    }
+
+async def price_predictions(interval: str, symbols: List[str]) -> Dict[str, Any]:
+    """Run the price model on each symbol's latest bars, batched through the model pool."""
+    import indicators
+    import price_model
+    
+    assets = asset_registry.by_symbols(symbols)
+    series = await asyncio.gather(*[
+        bar_store.get_bars(
+            symbol, interval, price_model.HISTORY_BARS,
+            150.0 if assets[symbol]["asset_type"] == "stock" else 30000.0
+        )
+        for symbol in symbols
+    ])
+    matrices = indicators.bars_matrix(series)
+    features = price_model.latest_features(matrices["high"], matrices["low"], matrices["close"])
+    probabilities = await get_model_pool().predict("price_predictor", features.pop("rows"))
+    return {**features, "probability": probabilities[:, 1]}
+
+@api_router.get("/ai/predictions")
+async def get_price_predictions(
+    symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,BTC"),
+    interval: str = Query("1h", description="1m, 5m, 15m, 1h, 4h, 1d"),
+    current_user: User = Depends(get_current_active_user)
+):
+    requested = list(dict.fromkeys(s.strip() for s in symbols.split(",") if s.strip()))
+    if not requested or len(requested) > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Between 1 and 100 symbols per request"
+        )
+    found = [symbol for symbol in requested if asset_registry.by_symbol(symbol)]
+    predictions = await price_predictions(interval, found) if found else {"probability": [], "valid": []}
+    
+    return {
+        "interval": interval,
+        "data": {
+            symbol: round(float(probability), 4) if valid else None
+            for symbol, probability, valid in zip(found, predictions["probability"], predictions["valid"])
+        },
+        "missing": [symbol for symbol in requested if symbol not in found]
+    }
+
+#-------------
+# Signal Scheduler
+#-------------
+
+async def watched_symbols() -> Dict[str, List[str]]:
+    """Users holding a position in each symbol; each symbol is computed once for all of them."""
+    rows = await db.positions.aggregate([
+        {"$group": {"_id": "$asset_id", "users": {"$addToSet": "$user_id"}}}
+    ]).to_list(length=None)
+    watching = {}
+    for row in rows:
+        asset = asset_registry.by_id(row["_id"])
+        if asset:
+            watching.setdefault(asset["symbol"], []).extend(row["users"])
+    return watching
+
+async def latest_indicators(interval: str, symbols: List[str]) -> Dict[str, Any]:
+    assets = asset_registry.by_symbols(symbols)
+    
+    def load_bars(symbol: str, limit: int):
+        base_price = 150.0 if assets[symbol]["asset_type"] == "stock" else 30000.0
+        return bar_store.get_bars(symbol, interval, limit, base_price)
+    
+    return await get_indicator_state().evaluate(interval, symbols, load_bars)
+
+async def prepare_trend_signals(model: dict, symbols: List[str]) -> Dict[str, Any]:
+    return await latest_indicators(model.get("config", {}).get("interval", "1h"), symbols)
+
+async def prepare_sentiment_signals(model: dict, symbols: List[str]) -> Dict[str, Any]:
+    # Sentiment is read from the pipeline's running aggregate, not recomputed
+    assets = asset_registry.by_symbols(symbols)
+    latest, sentiment = await asyncio.gather(
+        latest_indicators(model.get("config", {}).get("interval", "1h"), symbols),
+        get_sentiment_pipeline().current([assets[symbol]["id"] for symbol in symbols])
+    )
+    return {**sentiment, "close": latest["close"], "atr": latest["atr_14"]}
+
+async def prepare_price_signals(model: dict, symbols: List[str]) -> Dict[str, Any]:
+    interval = model.get("config", {}).get("interval", "1h")
+    return await price_predictions(interval, symbols)
+
+RATIONALES = {
+    "trend_detection": "indicators:rationale",
+    "price_prediction": "price_model:rationale",
+    "sentiment": "news_sentiment:rationale",
+}
+
+async def publish_signals(model: dict, symbols: List[str], scored: Dict[str, Any], watching: Dict[str, List[str]]) -> int:
+    """Replace each watcher's active signal from ``model`` with the new one.
+    
+    Alerts are only raised when a watcher's signal type changes, so an
+    unchanged re-run stays quiet.
+    """
+    interval = model.get("config", {}).get("interval", "1h")
+    created_by = model_slug(model)
+    describe = resolve(RATIONALES[model["model_type"]])
+    assets = asset_registry.by_symbols(symbols)
+    asset_ids = [asset["id"] for asset in assets.values()]
+    user_ids = sorted({user_id for symbol in symbols for user_id in watching[symbol]})
+    previous = await db.signals.find(
+        {"created_by": created_by, "is_active": True, "user_id": {"$in": user_ids}, "asset_id": {"$in": asset_ids}},
+        {"_id": 0, "user_id": 1, "asset_id": 1, "signal_type": 1}
+    ).to_list(length=None)
+    previous_types = {(doc["user_id"], doc["asset_id"]): doc["signal_type"] for doc in previous}
+    now = datetime.utcnow()
+    
+    signal_docs = []
+    alert_docs = []
+    replaced: Dict[str, List[str]] = {}
+    for i, symbol in enumerate(symbols):
+        if not scored["valid"][i] or symbol not in assets:
+            continue
+        for user_id in watching[symbol]:
+            signal = scored_signal(
+                user_id, assets[symbol]["id"], scored, i, interval, now,
+                created_by, describe(symbol, scored, i)
+            )
+            signal_docs.append(signal.model_dump())
+            replaced.setdefault(user_id, []).append(signal.asset_id)
+            if previous_types.get((user_id, signal.asset_id)) != signal.signal_type:
+                alert_docs.append(signal_alert(signal, symbol, scored["events"][i]).model_dump())
+    
+    await insert_signals_with_alerts(signal_docs, alert_docs)
+    # Retire the signals this run supersedes only once their replacements exist,
+    # and only for the (user, asset) pairs it wrote
+    if replaced:
+        await db.signals.bulk_write([
+            UpdateMany(
+                {"created_by": created_by, "is_active": True, "user_id": user_id,
+                 "asset_id": {"$in": replaced_ids}, "created_at": {"$lt": now}},
+                {"$set": {"is_active": False}}
+            )
+            for user_id, replaced_ids in replaced.items()
+        ], ordered=False)
+    return len(signal_docs)
+
+signal_scheduler = SignalScheduler(
+    db,
+    watchers=watched_symbols,
+    publish=publish_signals,
+    tick=float(os.environ.get("SIGNAL_SCHEDULER_TICK_SECONDS", 5)),
+    workers=int(os.environ.get("SIGNAL_SCHEDULER_WORKERS", 0)),
+)
+signal_scheduler.register("trend_detection", Strategy(prepare=prepare_trend_signals, compute="indicators:score"))
+signal_scheduler.register("price_prediction", Strategy(prepare=prepare_price_signals, compute="price_model:score"))
+signal_scheduler.register("sentiment", Strategy(prepare=prepare_sentiment_signals, compute="news_sentiment:score"))
+
+#-------------
+# Backtesting
+#-------------
+
+@lru_cache(maxsize=None)
+def get_backtester():
+    # Simulations run in worker processes; a sweep fans its configs out over them
+    from backtest import Backtester
+    
+    return Backtester(workers=int(os.environ.get("BACKTEST_WORKERS", 2)))
+
+BACKTEST_MAX_CONFIGS = int(os.environ.get("BACKTEST_MAX_CONFIGS", 200))
+# Largest stored-history run (symbols x bars); the bar store persists every bar it has to
+# build, so longer runs must ask for generated history, which the workers build themselves
+BACKTEST_STORED_CELLS = int(os.environ.get("BACKTEST_STORED_CELLS", 100_000))
+
+@api_router.post("/backtest")
+async def run_backtest(request: BacktestRequest, current_user: User = Depends(get_current_active_user)):
+    # Replays a model's signals over stored or generated bars under the user's risk settings
+    import backtest
+    import indicators
+    
+    symbols = list(dict.fromkeys(request.symbols))
+    if not symbols or len(symbols) > 500:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Between 1 and 500 symbols per backtest"
+        )
+    if request.interval not in INTERVALS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"interval must be one of {', '.join(INTERVALS)}"
+        )
+    model = next(
+        (model for model in await ensure_default_models() if request.model in (model_slug(model), model["model_type"])),
+        None
+    )
+    if not model or model["model_type"] not in backtest.STRATEGIES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only {', '.join(backtest.STRATEGIES)} models can be backtested"
+        )
+    assets = asset_registry.by_symbols(symbols)
+    found = [symbol for symbol in symbols if symbol in assets]
+    if not found:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="None of the symbols are known assets")
+    
+    risk = await db.risk_settings.find_one({"user_id": current_user.id}) or default_risk_settings(current_user.id).model_dump()
+    config = model.get("config", {})
+    base = backtest.config_from_risk(
+        model["model_type"], risk,
+        initial_capital=request.initial_capital,
+        position_size_pct=request.position_size_pct,
+        stop_loss_pct=request.stop_loss_pct,
+        trailing_stop_pct=request.trailing_stop_pct,
+        entry_threshold=request.entry_threshold,
+        allow_short=request.allow_short,
+        cost_bps=request.cost_bps,
+        weights=tuple(zip(config.get("models", []), config.get("weights", []))),
+        model_path=price_model_path()
+    )
+    try:
+        configs = backtest.sweep_configs(base, request.sweep) if request.sweep else [base]
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    if len(configs) > BACKTEST_MAX_CONFIGS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {BACKTEST_MAX_CONFIGS} parameter combinations per sweep"
         )
-        await db.alerts.insert_one(alert.model_dump())
     
-    return {"message": f"Generated {len(signals_created)} signals", "signals": signals_created}
+    stored = request.history == "stored"
+    if stored and len(found) * request.bars > BACKTEST_STORED_CELLS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Stored history is limited to {BACKTEST_STORED_CELLS:,} symbol-bars per backtest; use history=generated for longer runs"
+        )
+    if stored:
+        series = await asyncio.gather(*[
+            bar_store.get_bars(
+                symbol, request.interval, request.bars,
+                150.0 if assets[symbol]["asset_type"] == "stock" else 30000.0
+            )
+            for symbol in found
+        ])
+        bars = indicators.bars_matrix(series, ("open", "high", "low", "close"))
+        timestamps = max(series, key=lambda bars: len(bars["timestamp"]))["timestamp"]
+        results = await get_backtester().run(found, bars, configs)
+    else:
+        end = datetime.utcnow()
+        timestamps = backtest.generated_timestamps(request.interval, request.bars, end)
+        results = await get_backtester().run(found, None, configs, generate=(
+            request.interval, request.bars, end, {symbol: assets[symbol]["asset_type"] for symbol in found}
+        ))
+    summaries = [
+        backtest.summarize(result, config, found, timestamps, request.interval, max_trades=request.max_trades)
+        for result, config in zip(results, configs)
+    ]
+    
+    response = {
+        "model": model["name"],
+        "interval": request.interval,
+        "bars": len(timestamps),
+        "history": request.history,
+        "symbols": found,
+        "missing": [symbol for symbol in symbols if symbol not in assets],
+    }
+    if not request.sweep:
+        return {**response, **summaries[0]}
+    ranked = sorted(summaries, key=lambda summary: -summary["metrics"]["total_return_pct"])
+    return {
+        **response,
+        "sweep": [{"config": summary["config"], "metrics": summary["metrics"]} for summary in ranked],
+        "best": ranked[0],
+    }
 
 #-------------
 # Market Data Routes
@@ -815,11 +1492,7 @@ async def generate_signals(
 
 @api_router.get("/market/assets", response_model=List[Asset])
 async def get_assets(asset_type: Optional[str] = None):
-    query = {}
-    if asset_type:
-        query["asset_type"] = asset_type
-    
-    assets = await db.assets.find(query).to_list(length=100)
+    assets = asset_registry.list(asset_type)[:100]
     
     if not assets:
         # Create sample assets
@@ -836,138 +1509,348 @@ async def get_assets(asset_type: Optional[str] = None):
             {"symbol": "DOGE", "name": "Dogecoin", "asset_type": "crypto", "exchange": "Binance"}
         ]
         
-        for asset_data in sample_assets:
-            if asset_type and asset_data["asset_type"] != asset_type:
-                continue
-                
-            asset = Asset(**asset_data)
-            await db.assets.insert_one(asset.model_dump())
-            assets.append(asset.model_dump())
+        created = await asset_registry.add([
+            Asset(**asset_data).model_dump()
+            for asset_data in sample_assets
+            if not asset_type or asset_data["asset_type"] == asset_type
+        ])
+        assets = list(created.values())
     
     return [Asset(**asset) for asset in assets]
 
+@api_router.get("/market/data")
+async def get_market_data_batch(
+    symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,BTC"),
+    interval: str = Query("1d", description="1m, 5m, 15m, 1h, 4h, 1d"),
+    limit: int = Query(30, ge=1, le=1000)
+):
+    requested = list(dict.fromkeys(s.strip() for s in symbols.split(",") if s.strip()))
+    if not requested:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one symbol is required"
+        )
+    if len(requested) > 100:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most 100 symbols per request"
+        )
+    
+    assets = asset_registry.by_symbols(requested)
+    asset_types = {symbol: asset["asset_type"] for symbol, asset in assets.items()}
+    found = [symbol for symbol in requested if symbol in asset_types]
+    
+    series = await asyncio.gather(*[
+        bar_store.get_bars(
+            symbol, interval, limit,
+            150.0 if asset_types[symbol] == "stock" else 30000.0
+        )
+        for symbol in found
+    ])
+    
+    return {
+        "interval": interval,
+        "data": {symbol: bars_to_columns(bars) for symbol, bars in zip(found, series)},
+        "missing": [symbol for symbol in requested if symbol not in asset_types]
+    }
+
 @api_router.get("/market/data/{symbol}")
 async def get_market_data(
     symbol: str,
     interval: str = Query("1d", description="1m, 5m, 15m, 1h, 4h, 1d"),
     limit: int = Query(30, ge=1, le=1000)
 ):
-    # In a real app, this would fetch data from Alpaca/Binance APIs
-    # For demonstration, we'll generate mock market data
+    # Bars ingested from Alpaca/Binance are served from the bar store;
+    # missing ones are backfilled with mock data on read
     
-    asset = await db.assets.find_one({"symbol": symbol})
+    asset = asset_registry.by_symbol(symbol)
     if not asset:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Asset with symbol {symbol} not found"
         )
     
-    # Generate mock price data
-    end_date = datetime.utcnow()
-    
-    if interval == "1m":
-        start_date = end_date - timedelta(minutes=limit)
-        delta = timedelta(minutes=1)
-    elif interval == "5m":
-        start_date = end_date - timedelta(minutes=5*limit)
-        delta = timedelta(minutes=5)
-    elif interval == "15m":
-        start_date = end_date - timedelta(minutes=15*limit)
-        delta = timedelta(minutes=15)
-    elif interval == "1h":
-        start_date = end_date - timedelta(hours=limit)
-        delta = timedelta(hours=1)
-    elif interval == "4h":
-        start_date = end_date - timedelta(hours=4*limit)
-        delta = timedelta(hours=4)
-    else:  # 1d
-        start_date = end_date - timedelta(days=limit)
-        delta = timedelta(days=1)
-    
     # Determine base price based on asset type
     base_price = 150.0 if asset["asset_type"] == "stock" else 30000.0
     
-    # Generate price data with random walk
-    data = []
-    current_date = start_date
-    current_price = base_price
-    
-    while current_date <= end_date:
-        price_change = np.random.normal(0, 0.01) * current_price
-        current_price = max(0.01, current_price + price_change)
-        
-        high = current_price * (1 + abs(np.random.normal(0, 0.005)))
-        low = current_price * (1 - abs(np.random.normal(0, 0.005)))
-        open_price = current_price * (1 + np.random.normal(0, 0.005))
-        volume = np.random.randint(1000, 1000000)
-        
-        data.append({
-            "timestamp": current_date.isoformat(),
-            "open": round(open_price, 2),
-            "high": round(high, 2),
-            "low": round(low, 2),
-            "close": round(current_price, 2),
-            "volume": volume
-        })
-        
-        current_date += delta
+    bars = await bar_store.get_bars(symbol, interval, limit, base_price)
+    data = bars_to_records(bars)
     
     return {"symbol": symbol, "interval": interval, "data": data}
 
+@api_router.post("/market/data/{symbol}/ingest")
+async def ingest_market_data(
+    symbol: str,
+    provider: Optional[str] = Query(None),  # defaults by asset type
+    limit: int = Query(1000, ge=1, le=1000),
+    current_user: User = Depends(get_current_active_user)
+):
+    # Pulls the latest base bars from the user's connected broker into the shared bar store
+    asset = asset_registry.by_symbol(symbol.upper())
+    if not asset:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Asset with symbol {symbol} not found")
+    provider = provider or ("alpaca" if asset["asset_type"] == "stock" else "binance")
+    
+    adapter = await broker_pool.adapter(current_user.id, provider)
+    records = await adapter.bars(asset["symbol"], BASE_INTERVAL, limit)
+    written = await bar_store.ingest(asset["symbol"], records, source=provider)
+    return {"symbol": asset["symbol"], "interval": BASE_INTERVAL, "provider": provider, "bars": written}
+
+#-------------
+# Live Updates
+#-------------
+
+async def latest_bar(symbol: str, interval: str) -> Optional[dict]:
+    asset = asset_registry.by_symbol(symbol)
+    if not asset:
+        return None
+    base_price = 150.0 if asset["asset_type"] == "stock" else 30000.0
+    records = bars_to_records(await bar_store.get_bars(symbol, interval, 1, base_price))
+    return records[-1] if records else None
+
+# Fan-out hub for pushed updates; with a Redis URL, signals and alerts reach
+# clients connected to any uvicorn worker
+PUBSUB_REDIS_URL = os.environ.get("PUBSUB_REDIS_URL")
+hub = Hub(bridge=RedisBridge(PUBSUB_REDIS_URL) if PUBSUB_REDIS_URL else None)
+live_updates = LiveUpdates(
+    hub,
+    load_bar=latest_bar,
+    known_symbols=lambda symbols: list(asset_registry.by_symbols(symbols)),
+    tick=float(os.environ.get("LIVE_UPDATES_TICK_SECONDS", 2)),
+    send_timeout=float(os.environ.get("LIVE_UPDATES_SEND_TIMEOUT_SECONDS", 10)),
+    queue_size=int(os.environ.get("LIVE_UPDATES_QUEUE_SIZE", 256)),
+)
+
+# Close codes for connections the server ends
+WS_TOKEN_EXPIRED = 4001
+WS_TOO_SLOW = 4008
+
+@api_router.websocket("/ws")
+async def live_updates_socket(websocket: WebSocket, token: Optional[str] = Query(None)):
+    # Browsers cannot set headers on a WebSocket, so the JWT may come as ?token=
+    token = token or websocket.headers.get("authorization", "").removeprefix("Bearer ")
+    try:
+        user = await get_current_active_user(await get_current_user(token))
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    expires_at = jwt.get_unverified_claims(token).get("exp")
+    
+    await websocket.accept()
+    session = live_updates.session(user.id, websocket.send_text)
+    reason = await live_updates.serve(
+        session, websocket.receive_text,
+        expires_in=expires_at - time.time() if expires_at else None
+    )
+    
+    if reason != "closed":
+        # The client reconnects with a fresh token, or once it has caught up
+        try:
+            await websocket.close(code=WS_TOKEN_EXPIRED if reason == "expired" else WS_TOO_SLOW)
+        except RuntimeError:
+            pass
+
+#-------------
+# Portfolio Valuation
+#-------------
+
+async def latest_price(asset_id: str) -> Optional[float]:
+    asset = asset_registry.by_id(asset_id)
+    if not asset:
+        return None
+    bar = await latest_bar(asset["symbol"], "1m")
+    return bar["close"] if bar else None
+
+async def previous_close(asset_id: str) -> Optional[float]:
+    asset = asset_registry.by_id(asset_id)
+    if not asset:
+        return None
+    base_price = 150.0 if asset["asset_type"] == "stock" else 30000.0
+    records = bars_to_records(await bar_store.get_bars(asset["symbol"], "1d", 2, base_price))
+    return records[-2]["close"] if len(records) > 1 else None
+
+# Live per-user valuation, updated by fills and prices instead of re-reading trades
+portfolio_book = PortfolioBook(
+    db,
+    latest_price=latest_price,
+    previous_close=previous_close,
+    tick=float(os.environ.get("PORTFOLIO_PRICE_TICK_SECONDS", 5)),
+    snapshot_interval=float(os.environ.get("PORTFOLIO_SNAPSHOT_MINUTES", 15)) * 60,
+    # Fills and syncs in other workers move stops here too; the price monitor's leader may be this worker
+    on_reload=lambda user_id: watch_user_positions(user_id),
+)
+
+#-------------
+# Stop Monitor
+#-------------
+
+async def publish_stop_alerts(fired: list):
+    """Turn one tick's fired stops and targets into alerts, written and pushed as one batch."""
+    alerts = []
+    for hit in fired:
+        stop = hit.stop
+        asset = asset_registry.by_id(stop.asset_id)
+        symbol = asset["symbol"] if asset else stop.asset_id
+        what = {"stop_loss": "Stop loss", "trailing_stop": "Trailing stop", "price_target": "Price target"}[stop.kind]
+        source = "" if stop.source == "position" else f" from {stop.source}"
+        alerts.append(Alert(
+            user_id=stop.user_id,
+            asset_id=stop.asset_id,
+            alert_type=stop.kind,
+            message=f"{what}{source} hit for {symbol} at {hit.level:.2f} (last {hit.price:.2f})",
+        ).model_dump())
+    await db.alerts.insert_many(alerts, ordered=False)
+    live_updates.publish_events("alerts", alerts)
+
+# Position stops follow each user's risk settings; signal stops and targets live until the signal expires
+price_monitor = PriceMonitor(
+    latest_price,
+    emit=publish_stop_alerts,
+    tick=float(os.environ.get("PRICE_MONITOR_TICK_SECONDS", 2)),
+    db=db,
+)
+
+def watch_user_positions(user_id: str):
+    price_monitor.watch_positions(user_id, portfolio_book.positions(user_id), risk_book.limits(user_id))
+
 #-------------
 # News and Sentiment Routes
 #-------------
 
-@api_router.get("/news", response_model=List[NewsSentiment])
+@api_router.get("/news", response_model=Page[NewsSentiment])
 async def get_news(
     symbol: Optional[str] = None,
-    limit: int = Query(20, ge=1, le=100)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None)
 ):
     query = {}
     if symbol:
-        asset = await db.assets.find_one({"symbol": symbol})
+        asset = asset_registry.by_symbol(symbol)
         if asset:
-            query["asset_id"] = str(asset["_id"])
+            query["asset_id"] = {"$in": asset_registry.ids_for(symbol)}
     
-    news = await db.news.find(query).sort("published_at", -1).to_list(length=limit)
+    news, next_cursor = await fetch_page(db.news, query, "published_at", limit, cursor)
     
-    if not news:
+    if not news and not cursor:
         # Generate mock news
         mock_news = []
-        assets = await db.assets.find().to_list(length=10)
+        assets = asset_registry.list()[:10]
         
         news_sources = ["Bloomberg", "CNBC", "Reuters", "Wall Street Journal", "Financial Times"]
         
+        title_templates = [
+            "{symbol} Surges on Strong Earnings Report",
+            "Analysts Positive on {symbol} Future Growth",
+            "{symbol} Faces Market Challenges Amid Economic Uncertainty",
+            "{symbol} Drops After Missing Quarterly Expectations",
+        ]
+        
         for _ in range(limit):
-            asset = np.random.choice(assets) if not symbol else await db.assets.find_one({"symbol": symbol})
-            sentiment = np.random.normal(0, 0.5)  # range roughly -1 to 1
-            
-            # Create more interesting titles based on sentiment
-            if sentiment > 0.3:
-                title = f"{asset['symbol']} Surges on Strong Earnings Report"
-            elif sentiment > 0:
-                title = f"Analysts Positive on {asset['symbol']} Future Growth"
-            elif sentiment > -0.3:
-                title = f"{asset['symbol']} Faces Market Challenges Amid Economic Uncertainty"
-            else:
-                title = f"{asset['symbol']} Drops After Missing Quarterly Expectations"
-            
-            news_item = NewsSentiment(
-                asset_id=str(asset["_id"]),
-                title=title,
-                source=np.random.choice(news_sources),
-                url=f"https://example.com/news/{uuid.uuid4()}",
-                sentiment_score=round(sentiment, 2),
-                importance=round(np.random.uniform(0.3, 0.9), 2),
-                published_at=datetime.utcnow() - timedelta(hours=np.random.randint(1, 72))
-            )
-            
-            await db.news.insert_one(news_item.model_dump())
-            mock_news.append(news_item)
+            asset = random.choice(assets) if not symbol else asset_registry.by_symbol(symbol)
+            mock_news.append({
+                "id": str(uuid.uuid4()),
+                "asset_id": asset["id"],
+                "title": random.choice(title_templates).format(symbol=asset["symbol"]),
+                "source": random.choice(news_sources),
+                "url": f"https://example.com/news/{uuid.uuid4()}",
+                "importance": round(random.uniform(0.3, 0.9), 2),
+                "published_at": datetime.utcnow() - timedelta(hours=random.randint(1, 71))
+            })
         
-        return sorted(mock_news, key=lambda x: x.published_at, reverse=True)
+        # Scored like real news: repeated headlines hit the memo, not the model
+        mock_news = await get_sentiment_pipeline().ingest(mock_news)
+        
+        news, next_cursor = page_from_items(mock_news, "published_at", limit)
+    
+    return Page[NewsSentiment](items=[NewsSentiment(**item) for item in news], next_cursor=next_cursor)
+
+@api_router.post("/news/ingest")
+async def ingest_news(
+    items: List[NewsItemCreate] = Body(...),
+    current_user: User = Depends(get_current_active_user)
+):
+    if len(items) > 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At most 1000 news items per request"
+        )
+    
+    assets = asset_registry.by_symbols(list({item.symbol for item in items}))
+    docs = [
+        {**item.model_dump(exclude={"symbol"}), "asset_id": assets[item.symbol]["id"]}
+        for item in items if item.symbol in assets
+    ]
+    scored = await get_sentiment_pipeline().ingest(docs)
+    
+    return {
+        "ingested": len(scored),
+        "missing": sorted({item.symbol for item in items if item.symbol not in assets})
+    }
+
+@api_router.get("/news/sentiment")
+async def get_news_sentiment(
+    symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,BTC"),
+    hours: int = Query(48, ge=1, le=24 * 30)
+):
+    requested = list(dict.fromkeys(s.strip() for s in symbols.split(",") if s.strip()))
+    assets = asset_registry.by_symbols(requested)
+    found = [symbol for symbol in requested if symbol in assets]
+    asset_ids = [assets[symbol]["id"] for symbol in found]
     
-    return [NewsSentiment(**item) for item in news]
+    pipeline = get_sentiment_pipeline()
+    current = await pipeline.current(asset_ids)
+    series = await pipeline.series(asset_ids, datetime.utcnow() - timedelta(hours=hours))
+    symbol_for = {assets[symbol]["id"]: symbol for symbol in found}
+    
+    data = {
+        symbol: {
+            "sentiment": round(float(current["sentiment"][i]), 4),
+            "weight": round(float(current["weight"][i]), 4),
+            "items": int(current["items"][i]),
+            "series": []
+        }
+        for i, symbol in enumerate(found)
+    }
+    for point in series:
+        data[symbol_for[point["asset_id"]]]["series"].append(
+            {"timestamp": point["timestamp"], "sentiment": point["sentiment"], "items": point["items"]}
+        )
+    
+    return {"data": data, "missing": [symbol for symbol in requested if symbol not in assets]}
+
+#-------------
+# System Routes
+#-------------
+
+def built_stats(accessor) -> Dict[str, Any]:
+    """A lazily built service's stats; one not built yet is reported as such rather than built (and its pools started)."""
+    if not accessor.cache_info().currsize:
+        return {"built": False}
+    return accessor().stats()
+
+@api_router.get("/system/stats")
+async def get_system_stats(current_user: User = Depends(get_current_active_user)):
+    return {
+        "identity_cache": identity_cache.stats(),
+        "asset_registry": asset_registry.stats(),
+        "password_hasher": password_hasher.stats(),
+        "indicator_state": built_stats(get_indicator_state),
+        "signal_scheduler": signal_scheduler.stats(),
+        "model_pool": built_stats(get_model_pool),
+        "news_sentiment": built_stats(get_sentiment_pipeline),
+        "live_updates": live_updates.stats(),
+        "portfolio_book": portfolio_book.stats(),
+        "backtester": built_stats(get_backtester),
+        "broker_pool": broker_pool.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "risk_book": risk_book.stats(),
+        "trade_writer": trade_writer.stats(),
+        "price_monitor": price_monitor.stats(),
+    }
+
+@api_router.get("/system/indexes")
+async def get_index_report(current_user: User = Depends(get_current_active_user)):
+    return {"missing": await missing_index_report(db)}
 
 @api_router.get("/")
 async def root():
@@ -976,6 +1859,46 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(HasherBusy)
+async def hasher_busy_handler(request, exc: HasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Authentication is busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(OrdersElsewhere)
+async def orders_elsewhere_handler(request, exc: OrdersElsewhere):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+@app.exception_handler(BrokerUnavailable)
+async def broker_unavailable_handler(request, exc: BrokerUnavailable):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": f"{exc.provider} is unavailable: {exc.detail}"},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
+
+@app.exception_handler(BrokerRejected)
+async def broker_rejected_handler(request, exc: BrokerRejected):
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": f"{exc.provider} rejected the request: {exc.detail}"})
+
+@app.exception_handler(BrokerNotConfigured)
+async def broker_not_configured_handler(request, exc: BrokerNotConfigured):
+    return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"detail": exc.args[0]})
+
+@app.exception_handler(RiskRejected)
+async def risk_rejected_handler(request, exc: RiskRejected):
+    return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"detail": exc.detail, "rule": exc.rule})
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request, exc: InvalidCursor):
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": str(exc)})
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -985,6 +1908,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def create_indexes():
+    await ensure_indexes(db)
+    for shape in await missing_index_report(db):
+        logger.warning("No index supports %s query on %s: %s", shape["route"], shape["collection"], shape)
+
+@app.on_event("startup")
+async def load_asset_registry():
+    await asset_registry.load()
+    asset_registry.start()
+
+@app.on_event("startup")
+async def start_signal_scheduler():
+    await ensure_default_models()
+    if SIGNAL_SCHEDULER_ENABLED:
+        signal_scheduler.start()
+
+@app.on_event("startup")
+async def start_live_updates():
+    await hub.start()
+    live_updates.start()
+
+@app.on_event("startup")
+async def load_portfolio_book():
+    await portfolio_book.load()
+    portfolio_book.start()
+
+@app.on_event("startup")
+async def start_broker_pool():
+    await rate_limiter.start()
+    broker_pool.start()
+
+@app.on_event("startup")
+async def start_order_pipeline():
+    await risk_book.load()
+    risk_book.start()
+    trade_writer.start()
+
+@app.on_event("startup")
+async def start_price_monitor():
+    for user_id in portfolio_book.users():
+        watch_user_positions(user_id)
+    await price_monitor.load()
+    price_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await price_monitor.stop()
+    await portfolio_book.stop()
+    await trade_writer.stop()
+    await risk_book.stop()
+    await broker_pool.stop()
+    await rate_limiter.stop()
+    await live_updates.stop()
+    await hub.stop()
+    await signal_scheduler.stop()
+    # Only the services that were built; building one here would import its code
+    if get_model_pool.cache_info().currsize:
+        get_model_pool().shutdown()
+    if get_backtester.cache_info().currsize:
+        get_backtester().shutdown()
+    await asset_registry.stop()
+    password_hasher.shutdown()
     client.close()
@@ -0,0 +1,242 @@
+import asyncio
+import importlib
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from leases import Lease
+
+logger = logging.getLogger(__name__)
+
+# AIModel.config["update_frequency"] values, in seconds; plain numbers are
+# taken as seconds too
+FREQUENCIES = {
+    "minutely": 60,
+    "5min": 300,
+    "15min": 900,
+    "hourly": 3600,
+    "4h": 14400,
+    "daily": 86400,
+}
+DEFAULT_FREQUENCY = "hourly"
+
+
+def frequency_seconds(model: dict) -> float:
+    value = model.get("config", {}).get("update_frequency", DEFAULT_FREQUENCY)
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float(FREQUENCIES.get(value, FREQUENCIES[DEFAULT_FREQUENCY]))
+
+
+def resolve(target: str) -> Callable:
+    """The function a ``"module:function"`` target names, importing its module on first use."""
+    module_name, function_name = target.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def _compute(target: str, inputs: Any) -> Any:
+    return resolve(target)(inputs)
+
+
+class Strategy(NamedTuple):
+    """How one ``AIModel.model_type`` turns symbols into signals.
+
+    ``prepare(model, symbols)`` runs on the event loop and gathers inputs
+    (bars, indicator state). ``compute`` is the CPU part, named as
+    ``"module:function"`` and called with the inputs. Its module is only
+    imported where it runs, in a worker process or on the first inline run.
+    """
+    prepare: Callable[[dict, List[str]], Awaitable[Any]]
+    compute: str
+
+
+# Returns {symbol: [user_id, ...]} for every symbol someone watches
+WatchSource = Callable[[], Awaitable[Dict[str, List[str]]]]
+# Writes a run's results for the watching users; returns signals written
+Publisher = Callable[[dict, List[str], Any, Dict[str, List[str]]], Awaitable[int]]
+
+
+class SignalScheduler:
+    """Runs every enabled ``AIModel`` on its own ``update_frequency``.
+
+    Each run computes a symbol once no matter how many users watch it, then
+    hands the result to ``publish`` to fan out per user. A model whose run is
+    still going when it comes due again is not started twice: the missed
+    slot is counted as an overrun and the next run is scheduled one full
+    period after the slow one finishes. ``max_concurrent`` bounds how many
+    models run at the same time. With ``workers`` > 0 the compute step runs
+    in a process pool instead of on the event loop.
+
+    Every worker starts a scheduler, but only the one holding the
+    ``signal_scheduler`` lease schedules runs, so each signal is written
+    once however many workers serve the API.
+    """
+
+    def __init__(
+        self,
+        db,
+        watchers: WatchSource,
+        publish: Publisher,
+        tick: float = 5.0,
+        workers: int = 0,
+        max_concurrent: int = 2,
+    ):
+        self.db = db
+        self.watchers = watchers
+        self.publish = publish
+        self.tick = tick
+        self.workers = workers
+        self.lease = Lease(db, "signal_scheduler", ttl=max(30.0, 3 * tick))
+        self._strategies: Dict[str, Strategy] = {}
+        # Monotonic (started, finished) of each model's last completed run, and
+        # the slot the current run was started for
+        self._last_run: Dict[str, Tuple[float, float]] = {}
+        self._slot: Dict[str, float] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._models: Dict[str, dict] = {}
+        self._runs: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, model_type: str, strategy: Strategy):
+        self._strategies[model_type] = strategy
+
+    def start(self):
+        if self._task is None:
+            if self.workers > 0:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running.values()):
+            task.cancel()
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+        await self.lease.release()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _loop(self):
+        while True:
+            try:
+                if await self.lease.acquire():
+                    await self.schedule_due()
+            except Exception:
+                logger.exception("Signal scheduler tick failed")
+            await asyncio.sleep(self.tick)
+
+    async def schedule_due(self, now: Optional[float] = None):
+        """Start a run for every enabled model that is due and not already running."""
+        now = time.monotonic() if now is None else now
+        models = await self.db.ai_models.find({"enabled": True}, {"_id": 0}).to_list(length=100)
+        self._models = {model["id"]: model for model in models}
+        for model in models:
+            if model["model_type"] not in self._strategies:
+                continue
+            model_id = model["id"]
+            period = frequency_seconds(model)
+            if model_id in self._running:
+                if now >= self._slot[model_id] + period:
+                    # Skip this slot rather than queue a second run behind the first
+                    self._slot[model_id] += period
+                    self._record(model, overruns=1)
+                continue
+            if now < self.next_run(model_id, period):
+                continue
+            self._slot[model_id] = now
+            self._running[model_id] = asyncio.create_task(self.run(model))
+
+    def next_run(self, model_id: str, period: float) -> float:
+        """One period after the last run started, or after it finished if it overran."""
+        if model_id not in self._last_run:
+            return 0.0
+        started, finished = self._last_run[model_id]
+        return (finished if finished - started > period else started) + period
+
+    async def run(self, model: dict) -> int:
+        """Run one model over every watched symbol and publish the results."""
+        model_id = model["id"]
+        period = frequency_seconds(model)
+        started = time.monotonic()
+        written = 0
+        try:
+            async with self._semaphore:
+                watching = await self.watchers()
+                symbols = sorted(watching)
+                if symbols:
+                    strategy = self._strategies[model["model_type"]]
+                    inputs = await strategy.prepare(model, symbols)
+                    if self._pool is not None:
+                        results = await asyncio.get_running_loop().run_in_executor(self._pool, _compute, strategy.compute, inputs)
+                    else:
+                        results = _compute(strategy.compute, inputs)
+                    # Renews the lease; a worker that lost it while computing leaves publishing to the new leader
+                    if not await self.lease.acquire():
+                        logger.warning("Dropping %s results: scheduler lease lost during the run", model["name"])
+                        self._record(model, dropped=1)
+                        return 0
+                    written = await self.publish(model, symbols, results, watching)
+            self._record(model, runs=1, symbols=len(symbols), signals=written)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Signal run for %s failed", model["name"])
+            self._record(model, failures=1, last_error=str(exc))
+        finally:
+            finished = time.monotonic()
+            elapsed = finished - started
+            if elapsed > period:
+                logger.warning("%s took %.1fs, longer than its %gs period", model["name"], elapsed, period)
+            self._last_run[model_id] = (started, finished)
+            self._record(model, last_duration_ms=round(elapsed * 1000, 2))
+            self._running.pop(model_id, None)
+        return written
+
+    def _record(self, model: dict, **values):
+        run = self._runs.setdefault(model["id"], {
+            "name": model["name"],
+            "model_type": model["model_type"],
+            "runs": 0,
+            "failures": 0,
+            "overruns": 0,
+            "dropped": 0,
+            "symbols": 0,
+            "signals": 0,
+            "last_duration_ms": 0.0,
+            "last_error": None,
+        })
+        for key, value in values.items():
+            if key in ("runs", "failures", "overruns", "dropped", "signals"):
+                run[key] += value
+            else:
+                run[key] = value
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        models = {}
+        for model_id, run in self._runs.items():
+            model = self._models.get(model_id, {})
+            models[model_id] = {
+                **run,
+                "running": model_id in self._running,
+                "next_run_in": round(max(0.0, self.next_run(model_id, frequency_seconds(model)) - now), 1),
+            }
+        return {
+            "mode": "process" if self._pool is not None else "inline",
+            "leader": self.lease.held,
+            "workers": self.workers,
+            "strategies": sorted(self._strategies),
+            "unscheduled": sorted(
+                model["name"] for model in self._models.values() if model["model_type"] not in self._strategies
+            ),
+            "models": models,
+        }
@@ -5,14 +5,20 @@ set -e
 cd /backend || { echo "Backend directory not found"; exit 1; }
 
 echo "Starting FastAPI backend"
-# Start Uvicorn with proper host binding
-uvicorn server:app --host 0.0.0.0 --port 8001 &
+# Start Uvicorn with proper host binding; API_WORKERS processes share every route but orders.
+# Each process starts its own model pool of MODEL_WORKERS processes when a model is first used.
+ORDER_PATH_ENABLED=false uvicorn server:app --host 0.0.0.0 --port 8001 --workers "${API_WORKERS:-1}" &
 BACKEND_PID=$!
 
+# Orders are checked against one process's book and reservations, so nginx sends them all here
+echo "Starting order process"
+ORDER_PATH_ENABLED=true uvicorn server:app --host 127.0.0.1 --port 8002 &
+ORDERS_PID=$!
+
 echo "Waiting for backend to start..."
 sleep 30
 
-if ! kill -0 $BACKEND_PID 2>/dev/null; then
+if ! kill -0 $BACKEND_PID 2>/dev/null || ! kill -0 $ORDERS_PID 2>/dev/null; then
     echo "Backend failed to start at initialization, exiting"
     exit 1
 fi
@@ -22,20 +28,20 @@ nginx -g 'daemon off;' &
 NGINX_PID=$!
 
 # Handle termination signals
-trap 'kill $BACKEND_PID $NGINX_PID; exit 0' SIGTERM SIGINT
+trap 'kill $BACKEND_PID $ORDERS_PID $NGINX_PID; exit 0' SIGTERM SIGINT
 
 # Check if processes are still running
-while kill -0 $BACKEND_PID 2>/dev/null && kill -0 $NGINX_PID 2>/dev/null; do
+while kill -0 $BACKEND_PID 2>/dev/null && kill -0 $ORDERS_PID 2>/dev/null && kill -0 $NGINX_PID 2>/dev/null; do
     sleep 1
 done
 
 # If we get here, one of the processes died
-if kill -0 $BACKEND_PID 2>/dev/null; then
-    echo "Nginx died, shutting down backend..."
-    kill $BACKEND_PID
+if kill -0 $NGINX_PID 2>/dev/null; then
+    echo "Backend died, shutting down..."
+    kill $BACKEND_PID $ORDERS_PID $NGINX_PID 2>/dev/null || true
 else
-    echo "Backend died, shutting down nginx..."
-    kill $NGINX_PID
+    echo "Nginx died, shutting down backend..."
+    kill $BACKEND_PID $ORDERS_PID 2>/dev/null || true
 fi
 
 exit 1
@@ -6,6 +6,61 @@ import "./App.css";
 // API configuration
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const WS_URL = `${(BACKEND_URL || window.location.origin).replace(/^http/, 'ws')}/api/ws`;
+
+// Symbols shown in the dashboard's market overview
+const DASHBOARD_SYMBOLS = ['AAPL', 'MSFT', 'BTC'];
+
+// Opens the live-updates socket and keeps it open, reconnecting with backoff.
+// `onFrames` gets each batch of {type, data} frames; returns a close function.
+const connectLiveUpdates = (token, subscription, onFrames) => {
+  let socket = null;
+  let pingTimer = null;
+  let retryDelay = 1000;
+  let closed = false;
+  
+  const open = () => {
+    if (closed) return;
+    socket = new WebSocket(`${WS_URL}?token=${encodeURIComponent(token)}`);
+    socket.onopen = () => {
+      retryDelay = 1000;
+      socket.send(JSON.stringify({ action: 'subscribe', ...subscription }));
+      pingTimer = setInterval(() => socket.send(JSON.stringify({ action: 'ping' })), 30000);
+    };
+    socket.onmessage = (event) => onFrames(JSON.parse(event.data));
+    socket.onclose = (event) => {
+      clearInterval(pingTimer);
+      // 1008: rejected token, 4001: token expired; both need a new login
+      if (closed || event.code === 1008 || event.code === 4001) return;
+      setTimeout(open, retryDelay);
+      retryDelay = Math.min(retryDelay * 2, 30000);
+    };
+  };
+  
+  open();
+  return () => {
+    closed = true;
+    if (socket) socket.close();
+  };
+};
+
+// Applies pushed bars to columnar market data: the open bar is replaced, a new one appended
+const mergeBars = (marketData, bars) => {
+  const merged = { ...marketData };
+  bars.forEach(bar => {
+    const data = merged[bar.symbol];
+    if (!data) return;
+    const last = data.timestamp.length - 1;
+    const isNewBar = last < 0 || data.timestamp[last] !== bar.timestamp;
+    merged[bar.symbol] = Object.fromEntries(
+      ['timestamp', 'open', 'high', 'low', 'close', 'volume'].map(field => [
+        field,
+        isNewBar ? [...data[field].slice(1), bar[field]] : [...data[field].slice(0, last), bar[field]]
+      ])
+    );
+  });
+  return merged;
+};
 
 // Icons
 function HomeIcon() {
@@ -218,28 +273,21 @@ const Dashboard = () => {
           headers,
           params: { active_only: true, limit: 5 }
         });
-        setSignals(signalsResponse.data);
+        setSignals(signalsResponse.data.items);
         
         // Fetch latest alerts
         const alertsResponse = await axios.get(`${API}/alerts`, { 
           headers,
           params: { unread_only: true, limit: 5 }
         });
-        setAlerts(alertsResponse.data);
-        
-        // Fetch market data for a few popular assets
-        const assets = ['AAPL', 'MSFT', 'BTC'];
-        const marketDataPromises = assets.map(symbol => 
-          axios.get(`${API}/market/data/${symbol}`, { headers })
-        );
-        
-        const marketDataResults = await Promise.all(marketDataPromises);
-        const marketDataBySymbol = {};
+        setAlerts(alertsResponse.data.items);
         
-        marketDataResults.forEach(response => {
-          const { symbol, data } = response.data;
-          marketDataBySymbol[symbol] = data;
+        // Fetch market data for a few popular assets in one batch request
+        const marketDataResponse = await axios.get(`${API}/market/data`, {
+          headers,
+          params: { symbols: DASHBOARD_SYMBOLS.join(','), interval: '1d' }
         });
+        const marketDataBySymbol = marketDataResponse.data.data;
         
         setMarketData(marketDataBySymbol);
         setIsLoading(false);
@@ -251,6 +299,39 @@ const Dashboard = () => {
     };
     
     fetchDashboardData();
+    
+    // After the first load, changes are pushed by the server instead of re-fetched
+    const token = localStorage.getItem('token');
+    if (!token) return undefined;
+    return connectLiveUpdates(
+      token,
+      { symbols: DASHBOARD_SYMBOLS, interval: '1d', channels: ['signals', 'alerts'] },
+      (frames) => {
+        if (frames.some(frame => frame.type === 'resync')) {
+          // Updates were dropped while we were behind; reload everything
+          fetchDashboardData();
+          return;
+        }
+        const ofType = (type) => frames.filter(frame => frame.type === type).map(frame => frame.data);
+        const bars = ofType('bar');
+        const newSignals = ofType('signal');
+        const newAlerts = ofType('alert');
+        if (bars.length) {
+          setMarketData(previous => mergeBars(previous, bars));
+        }
+        if (newSignals.length) {
+          // A new signal replaces the active one from the same model for that asset
+          const replaced = new Set(newSignals.map(signal => `${signal.created_by}:${signal.asset_id}`));
+          setSignals(previous => [
+            ...newSignals.reverse(),
+            ...previous.filter(signal => !replaced.has(`${signal.created_by}:${signal.asset_id}`))
+          ].slice(0, 5));
+        }
+        if (newAlerts.length) {
+          setAlerts(previous => [...newAlerts.reverse(), ...previous].slice(0, 5));
+        }
+      }
+    );
   }, []);
   
   // Format currency
@@ -416,10 +497,18 @@ const Dashboard = () => {
         
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
           {Object.entries(marketData).map(([symbol, data]) => {
-            const latestData = data[data.length - 1];
-            const previousData = data[data.length - 2];
-            const priceChange = latestData.close - previousData.close;
-            const percentChange = (priceChange / previousData.close) * 100;
+            // Bars arrive as parallel arrays: timestamp, open, high, low, close, volume
+            const last = data.close.length - 1;
+            const latestData = {
+              open: data.open[last],
+              high: data.high[last],
+              low: data.low[last],
+              close: data.close[last],
+              volume: data.volume[last]
+            };
+            const previousClose = last > 0 ? data.close[last - 1] : data.open[last];
+            const priceChange = latestData.close - previousClose;
+            const percentChange = (priceChange / previousClose) * 100;
             
             return (
               <div key={symbol} className="bg-white rounded-lg shadow p-6">
@@ -599,7 +688,7 @@ const Signals = () => {
         
         // Fetch signals
         const signalsResponse = await axios.get(`${API}/signals`, { headers });
-        setSignals(signalsResponse.data);
+        setSignals(signalsResponse.data.items);
         
         // Fetch available assets
         const assetsResponse = await axios.get(`${API}/market/assets`, { headers });
@@ -635,7 +724,7 @@ const Signals = () => {
       
       // Refresh signals
       const signalsResponse = await axios.get(`${API}/signals`, { headers });
-      setSignals(signalsResponse.data);
+      setSignals(signalsResponse.data.items);
       
       setIsGenerating(false);
       setSelectedAssets([]);
@@ -781,7 +870,7 @@ const Trades = () => {
         const headers = { 'Authorization': `Bearer ${token}` };
         
         const response = await axios.get(`${API}/trades`, { headers });
-        setTrades(response.data);
+        setTrades(response.data.items);
         
         setIsLoading(false);
       } catch (error) {
@@ -891,7 +980,7 @@ const Alerts = () => {
         const headers = { 'Authorization': `Bearer ${token}` };
         
         const response = await axios.get(`${API}/alerts`, { headers });
-        setAlerts(response.data);
+        setAlerts(response.data.items);
         
         setIsLoading(false);
       } catch (error) {
@@ -1619,10 +1708,10 @@ function App() {
         
         const response = await axios.get(`${API}/alerts`, {
           headers: { 'Authorization': `Bearer ${token}` },
-          params: { unread_only: true }
+          params: { unread_only: true, limit: 1 }
         });
         
-        setHasUnreadAlerts(response.data.length > 0);
+        setHasUnreadAlerts(response.data.items.length > 0);
       } catch (error) {
         console.error("Error checking unread alerts:", error);
       }
@@ -0,0 +1,167 @@
+"""Measure fan-out throughput and per-connection memory of the live-updates hub.
+
+Creates --subscribers client sessions (10k by default). Each follows
+--symbols-per-client bar topics out of --symbols and its own alert channel,
+and has the same sender task a WebSocket connection runs, with a sink in
+place of the socket. The benchmark then publishes --updates MarketData bars
+and alerts and reports publish rate, frames delivered per second and
+memory per connection. Publishes are encoded once and shared. With
+--baseline the frames are encoded once per subscriber instead, for
+comparison. With --workers > 1 the sessions are spread over that many hubs
+linked by a MemoryBridge, or by Redis if --redis-url is given, the way
+uvicorn workers are.
+
+    python scripts/bench_fanout.py --subscribers 10000 --updates 2000
+    python scripts/bench_fanout.py --workers 4 --redis-url redis://localhost:6379/0
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from live_updates import ClientSession, bar_topic, user_topic  # noqa: E402
+from pubsub import Hub, MemoryBridge, RedisBridge, frame  # noqa: E402
+from server import Alert, MarketData  # noqa: E402
+
+
+class Sink:
+    """Stands in for the socket: counts what would have been written."""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def send(self, text):
+        self.messages += 1
+        self.bytes += len(text)
+
+
+def make_bar(symbol, price):
+    return MarketData(
+        symbol=symbol, open=price, high=price * 1.001, low=price * 0.999, close=price,
+        volume=1000, timestamp=datetime.utcnow(), interval="1m", source="bench",
+    )
+
+
+async def build(args, sink):
+    network = []
+    hubs = []
+    for _ in range(args.workers):
+        if args.workers == 1:
+            bridge = None
+        elif args.redis_url:
+            bridge = RedisBridge(args.redis_url, channel="bench_fanout")
+        else:
+            bridge = MemoryBridge(network)
+        hub = Hub(bridge)
+        await hub.start()
+        hubs.append(hub)
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    rng = random.Random(7)
+    sessions = []
+    tasks = []
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for i in range(args.subscribers):
+        hub = hubs[i % len(hubs)]
+        session = ClientSession(f"user{i}", sink.send, args.queue_size)
+        for symbol in rng.sample(symbols, args.symbols_per_client):
+            hub.subscribe(bar_topic((symbol, "1m")), session)
+        hub.subscribe(user_topic("alerts", session.user_id), session)
+        sessions.append(session)
+        tasks.append(asyncio.create_task(session.flush_forever(send_timeout=30.0)))
+    await asyncio.sleep(0)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    used = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return hubs, symbols, sessions, tasks, used
+
+
+def publish_baseline(hub, topic, kind, payload, key):
+    # What fan-out costs when every subscriber gets its own serialization
+    for subscriber in hub._topics.get(topic, ()):
+        subscriber.put(frame(kind, payload), key)
+
+
+async def run(args):
+    sink = Sink()
+    hubs, symbols, sessions, tasks, used = await build(args, sink)
+    print(
+        f"{args.subscribers} sessions on {len(hubs)} hub(s), {args.symbols_per_client} of {args.symbols} symbols each: "
+        f"{used / 1024 / 1024:.1f} MiB, {used / args.subscribers / 1024:.2f} KiB per connection"
+    )
+
+    rng = random.Random(11)
+    bars = [make_bar(symbol, 100.0 + i) for i, symbol in enumerate(symbols)]
+    alerts = [
+        Alert(user_id=f"user{rng.randrange(args.subscribers)}", alert_type="price_target", message="bench alert")
+        for _ in range(args.updates // 10)
+    ]
+
+    started = time.perf_counter()
+    for i in range(args.updates):
+        bar = bars[i % len(bars)]
+        topic = bar_topic((bar.symbol, "1m"))
+        # Bars go out from the hub that polled them; alerts from any worker
+        if args.baseline:
+            publish_baseline(hubs[0], topic, "bar", bar, key=topic)
+        else:
+            for hub in hubs:
+                hub.publish(topic, "bar", bar, key=topic, bridge=False)
+        if i % 10 == 0 and alerts:
+            alert = alerts[(i // 10) % len(alerts)]
+            hubs[0].publish(user_topic("alerts", alert.user_id), "alert", alert)
+        if i % args.yield_every == 0:
+            await asyncio.sleep(0)
+    published = time.perf_counter() - started
+
+    # Let every sender drain its queue
+    while any(session._pending for session in sessions):
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    frames = sum(session.delivered for session in sessions)
+    print(f"published {args.updates} bars + {len(alerts)} alerts in {published:.2f}s ({args.updates / published:,.0f} publishes/s)")
+    print(
+        f"delivered {frames:,} frames in {sink.messages:,} socket writes over {elapsed:.2f}s: "
+        f"{frames / elapsed:,.0f} frames/s, {sink.messages / elapsed:,.0f} messages/s, {sink.bytes / elapsed / 1e6:.1f} MB/s"
+    )
+    print(
+        f"coalesced {sum(session.coalesced for session in sessions):,}, "
+        f"dropped {sum(session.dropped for session in sessions):,}, "
+        f"bridged in {sum(hub.bridged_in for hub in hubs):,}"
+    )
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for hub in hubs:
+        await hub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--symbols-per-client", type=int, default=3)
+    parser.add_argument("--updates", type=int, default=2000, help="bar publishes; one alert per ten bars")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--yield-every", type=int, default=50, help="publishes between event-loop yields")
+    parser.add_argument("--workers", type=int, default=1, help="hubs linked by a bridge, as uvicorn workers")
+    parser.add_argument("--redis-url", default=None, help="bridge workers through Redis instead of in memory")
+    parser.add_argument("--baseline", action="store_true", help="encode each frame per subscriber instead of once")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Measure how a login storm affects the latency of other endpoints.
+
+Runs a probe loop against a cheap endpoint on its own, then again while
+many clients hammer /api/auth/token, and prints p50/p95/p99 for both
+phases. With bcrypt on the event loop the storm inflates probe p99 to
+roughly (concurrent logins x bcrypt cost); with it offloaded the probe
+should barely move.
+
+    python scripts/bench_login_storm.py --url http://localhost:8001 --logins 32
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def probe(url, path, duration):
+    session = requests.Session()
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        session.get(url + path).raise_for_status()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def storm(url, username, password, stop):
+    session = requests.Session()
+    count = 0
+    while not stop.is_set():
+        session.post(url + "/api/auth/token", data={"username": username, "password": password})
+        count += 1
+    return count
+
+
+def report(label, samples):
+    print(
+        f"{label:>10}: n={len(samples):5d}  p50={percentile(samples, 50):7.1f}ms  "
+        f"p95={percentile(samples, 95):7.1f}ms  p99={percentile(samples, 99):7.1f}ms  "
+        f"max={max(samples):7.1f}ms  mean={statistics.mean(samples):7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8001")
+    parser.add_argument("--probe-path", default="/api/")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    args = parser.parse_args()
+
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    password = uuid.uuid4().hex
+    requests.post(
+        args.url + "/api/auth/register",
+        json={"username": username, "email": f"{username}@example.com", "password": password},
+    ).raise_for_status()
+
+    report("baseline", probe(args.url, args.probe_path, args.duration))
+
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=args.logins) as pool:
+        logins = [pool.submit(storm, args.url, username, password, stop) for _ in range(args.logins)]
+        samples = probe(args.url, args.probe_path, args.duration)
+        stop.set()
+        total = sum(future.result() for future in logins)
+    report("storm", samples)
+    print(f"{total} logins in {args.duration:.0f}s ({total / args.duration:.1f}/s) from {args.logins} clients")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Measure tick throughput of the stop and target monitor.
+
+Registers --stops stops over --symbols symbols, for --users users. There
+is a mix of fixed stop losses, trailing stops at a few percentages, and
+signal stop/target pairs. Long and short positions are both included. The
+benchmark then applies --ticks random-walk prices and reports ticks per
+second, tick latency and stops fired. Every --replace-every ticks a user's
+signals are replaced, as new signals arrive. With --baseline each tick
+instead scans every stop on the symbol, for comparison.
+
+    python scripts/bench_price_monitor.py --stops 100000 --ticks 200000
+    python scripts/bench_price_monitor.py --stops 100000 --ticks 20000 --baseline
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from orders import RiskLimits  # noqa: E402
+from price_monitor import PriceMonitor  # noqa: E402
+
+TRAILING = (0.02, 0.05, 0.1)
+
+
+def make_signal(rng, user, symbol, price):
+    signal_type = rng.choice(("buy", "sell"))
+    direction = 1 if signal_type == "buy" else -1
+    return {
+        "id": f"{rng.getrandbits(64):016x}",
+        "user_id": user, "asset_id": symbol, "signal_type": signal_type, "created_by": "bench",
+        "stop_loss": price * (1 - direction * rng.uniform(0.02, 0.1)),
+        "price_target": price * (1 + direction * rng.uniform(0.02, 0.1)),
+    }
+
+
+def build(args, monitor, prices, rng):
+    symbols = list(prices)
+    positions = args.stops // 2
+    for i in range(positions):
+        symbol = rng.choice(symbols)
+        price = prices[symbol]
+        trailing = rng.random() < 0.5
+        limits = RiskLimits(0.05, 0.02, rng.choice(TRAILING) if trailing else rng.uniform(0.02, 0.1), trailing)
+        position = {
+            "user_id": f"user{i % args.users}", "asset_id": symbol,
+            "quantity": rng.choice((10.0, -10.0)), "avg_entry_price": price, "current_price": price,
+        }
+        monitor.watch_position(position, limits)
+    for i in range((args.stops - positions) // 2):
+        symbol = rng.choice(symbols)
+        monitor.watch_signals([make_signal(rng, f"user{i % args.users}", symbol, prices[symbol])])
+
+
+def scan(stops, price, peaks):
+    # What a tick costs when every stop on the symbol is checked
+    fired = 0
+    for stop in stops:
+        if stop.id not in peaks:
+            continue
+        x = stop.direction * price
+        factor = 1 - stop.direction * stop.pct if stop.kind == "trailing_stop" else 1.0
+        if x <= peaks[stop.id] * factor:
+            del peaks[stop.id]
+            fired += 1
+        elif stop.kind == "trailing_stop" and x > peaks[stop.id]:
+            peaks[stop.id] = x
+    return fired
+
+
+async def run(args):
+    fired = []
+
+    async def emit(batch):
+        fired.append(len(batch))
+
+    async def no_price(asset_id):
+        return None
+
+    rng = random.Random(7)
+    prices = {f"SYM{i}": rng.uniform(20, 500) for i in range(args.symbols)}
+    monitor = PriceMonitor(no_price, emit)
+    started = time.perf_counter()
+    build(args, monitor, prices, rng)
+    print(f"watched {len(monitor._active):,} stops on {len(monitor._ladders)} symbols in {time.perf_counter() - started:.2f}s")
+
+    symbols = list(prices)
+    if args.baseline:
+        by_symbol = {}
+        for stop in monitor._active.values():
+            by_symbol.setdefault(stop.asset_id, []).append(stop)
+        peaks = {stop.id: stop.direction * stop.level for stop in monitor._active.values()}
+        started = time.perf_counter()
+        total = 0
+        for _ in range(args.ticks):
+            symbol = rng.choice(symbols)
+            prices[symbol] *= 1 + rng.gauss(0, args.volatility)
+            total += scan(by_symbol[symbol], prices[symbol], peaks)
+        elapsed = time.perf_counter() - started
+        print(f"baseline: {args.ticks:,} ticks in {elapsed:.2f}s ({args.ticks / elapsed:,.0f} ticks/s), fired {total:,}")
+        return
+
+    started = time.perf_counter()
+    for i in range(args.ticks):
+        symbol = rng.choice(symbols)
+        prices[symbol] *= 1 + rng.gauss(0, args.volatility)
+        monitor.on_tick(symbol, prices[symbol])
+        if i % args.replace_every == 0:
+            symbol = rng.choice(symbols)
+            monitor.watch_signals([make_signal(rng, f"user{rng.randrange(args.users)}", symbol, prices[symbol])])
+        if i % args.flush_every == 0:
+            await monitor.flush()
+    await monitor.flush()
+    elapsed = time.perf_counter() - started
+
+    stats = monitor.stats()
+    tick = stats["tick"]
+    print(f"{args.ticks:,} ticks in {elapsed:.2f}s ({args.ticks / elapsed:,.0f} ticks/s)")
+    print(f"tick latency avg {tick['avg_us']} us, p50 {tick['latency_us']['p50']} us, p99 {tick['latency_us']['p99']} us")
+    print(
+        f"fired {stats['fired']:,} in {len(fired):,} batches, {stats['active']:,} still active, "
+        f"{stats['stale']:,} stale, {stats['ladders']} ladders"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stops", type=int, default=100000)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--ticks", type=int, default=200000)
+    parser.add_argument("--volatility", type=float, default=0.001, help="standard deviation of each tick's return")
+    parser.add_argument("--replace-every", type=int, default=10, help="ticks between replaced signals")
+    parser.add_argument("--flush-every", type=int, default=500, help="ticks between alert batches")
+    parser.add_argument("--baseline", action="store_true", help="scan every stop on each tick instead")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
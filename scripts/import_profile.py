@@ -0,0 +1,179 @@
+"""Profile how long importing the backend takes, and which modules it pulls in.
+
+Runs `python -X importtime -c "import server"` in a fresh interpreter,
+parses the timing lines, and prints the slowest top-level packages (self
+time summed over their modules) and the slowest individual modules. It
+exits non-zero if the total exceeds
+--budget-ms or a forbidden heavy package (ML, plotting, data feeds) gets
+imported by the HTTP layer. Those belong in lazy imports or pool workers.
+Importing server must also leave numpy and the compute modules in LAZY
+out of sys.modules; server.py loads them on first use.
+
+With --ready it also runs the app's startup hooks in a fresh interpreter,
+against the database in MONGO_URL as under uvicorn, and reports the time
+until the worker is ready to serve. It fails if startup loaded a module in
+NOT_AT_STARTUP or a forbidden package, or left worker processes running:
+model and backtest pools start with their first request.
+
+    python scripts/import_profile.py --budget-ms 1500
+    python scripts/import_profile.py --module server --top 30 --json
+    MONGO_URL=mongodb://localhost:27017 python scripts/import_profile.py --ready --ready-budget-ms 3000
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+
+# Packages the API process must never import at startup
+FORBIDDEN = (
+    "pandas", "scipy", "sklearn", "joblib", "tensorflow", "torch", "transformers",
+    "matplotlib", "plotly", "yfinance", "textblob", "nltk",
+)
+
+# Loaded by server.py on first use, never by `import server`
+LAZY = ("numpy", "indicators", "price_model", "news_sentiment", "backtest", "model_pool", "indicator_state")
+
+# Loaded by the first request that needs them, never by startup
+NOT_AT_STARTUP = ("price_model", "news_sentiment", "backtest", "model_pool")
+
+# Imports the app and runs its startup hooks, then prints a JSON report
+READY = """
+import asyncio, json, multiprocessing, sys, time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+
+async def main():
+    await server.app.router.startup()
+    ready = time.perf_counter()
+    report = {
+        "import_ms": round((imported - started) * 1000, 1),
+        "startup_ms": round((ready - imported) * 1000, 1),
+        "ready_ms": round((ready - started) * 1000, 1),
+        "processes": len(multiprocessing.active_children()),
+        "modules": sorted({name.split(".")[0] for name in sys.modules}),
+    }
+    await server.app.router.shutdown()
+    print(json.dumps(report))
+
+asyncio.run(main())
+"""
+
+LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def profile(module):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"import {module} failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append({
+                "module": name,
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": (len(indent) - 1) // 2,
+            })
+    return rows
+
+
+def time_to_ready():
+    result = subprocess.run([sys.executable, "-c", READY], cwd=BACKEND_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit("server startup failed")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    modules = set(report.pop("modules"))
+    report["forbidden"] = sorted(modules & set(FORBIDDEN))
+    report["eager"] = sorted(modules & set(NOT_AT_STARTUP))
+    return report
+
+
+def summarize(rows, module):
+    target = next((row for row in rows if row["module"] == module and row["depth"] == 0), None)
+    packages = defaultdict(float)
+    for row in rows:
+        packages[row["module"].split(".")[0]] += row["self_ms"]
+    imported = {row["module"].split(".")[0] for row in rows}
+    return {
+        "module": module,
+        "total_ms": round(sum(row["self_ms"] for row in rows), 1),
+        "module_cumulative_ms": round(target["cumulative_ms"], 1) if target else None,
+        "modules_imported": len(rows),
+        "packages": sorted(((name, round(ms, 1)) for name, ms in packages.items()), key=lambda item: -item[1]),
+        "slowest_modules": sorted(rows, key=lambda row: -row["self_ms"]),
+        "forbidden": sorted(imported & set(FORBIDDEN)),
+        "eager": sorted(imported & set(LAZY)) if module == "server" else [],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="server")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if total import time exceeds this")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--ready", action="store_true", help="also time the server's startup hooks (needs MONGO_URL)")
+    parser.add_argument("--ready-budget-ms", type=float, default=None, help="fail if import plus startup exceeds this")
+    args = parser.parse_args()
+
+    report = summarize(profile(args.module), args.module)
+    report["packages"] = report["packages"][:args.top]
+    report["slowest_modules"] = report["slowest_modules"][:args.top]
+    if args.ready:
+        report["ready"] = time_to_ready()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {args.module}: {report['total_ms']:.1f}ms across {report['modules_imported']} modules")
+        print("\nby package (self time summed):")
+        for name, ms in report["packages"]:
+            print(f"  {ms:8.1f}ms  {name}")
+        print("\nslowest modules (self time):")
+        for row in report["slowest_modules"]:
+            print(f"  {row['self_ms']:8.1f}ms  {row['module']}")
+        if args.ready:
+            ready = report["ready"]
+            print(
+                f"\nready to serve in {ready['ready_ms']:.1f}ms "
+                f"(import {ready['import_ms']:.1f}ms, startup {ready['startup_ms']:.1f}ms), "
+                f"{ready['processes']} worker processes"
+            )
+
+    failures = []
+    if report["forbidden"]:
+        failures.append(f"heavy packages imported at startup: {', '.join(report['forbidden'])}")
+    if report["eager"]:
+        failures.append(f"modules server.py must import lazily were imported with it: {', '.join(report['eager'])}")
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        failures.append(f"import took {report['total_ms']:.1f}ms, budget is {args.budget_ms:.0f}ms")
+    if args.ready:
+        ready = report["ready"]
+        if ready["forbidden"]:
+            failures.append(f"heavy packages imported by startup: {', '.join(ready['forbidden'])}")
+        if ready["eager"]:
+            failures.append(f"modules loaded by startup instead of first use: {', '.join(ready['eager'])}")
+        if ready["processes"]:
+            failures.append(f"startup left {ready['processes']} worker processes running")
+        if args.ready_budget_ms is not None and ready["ready_ms"] > args.ready_budget_ms:
+            failures.append(f"ready after {ready['ready_ms']:.1f}ms, budget is {args.ready_budget_ms:.0f}ms")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
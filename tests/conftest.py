@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+# Backend modules import each other by their flat names, as under uvicorn
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
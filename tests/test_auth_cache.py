@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+
+from auth_cache import IdentityCache
+
+pytestmark = pytest.mark.anyio
+
+
+def test_entries_expire_after_the_ttl():
+    cache = IdentityCache(ttl=0.05)
+    cache.put("token", "alice", "user")
+    assert cache.get("token") == "user"
+    time.sleep(0.06)
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_token_expiry_caps_the_ttl():
+    cache = IdentityCache(ttl=60.0)
+    cache.put("token", "alice", "user", token_exp=time.time() - 1)
+    assert cache.get("token") is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = IdentityCache(maxsize=2)
+    cache.put("first", "alice", "a")
+    cache.put("second", "bob", "b")
+    cache.get("first")
+    cache.put("third", "carol", "c")
+    assert cache.get("second") is None
+    assert cache.get("first") == "a" and cache.get("third") == "c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidating_a_user_drops_all_their_tokens():
+    cache = IdentityCache()
+    cache.put("laptop", "alice", "a")
+    cache.put("phone", "alice", "a")
+    cache.put("other", "bob", "b")
+    cache.invalidate_user("alice")
+    assert cache.get("laptop") is None and cache.get("phone") is None
+    assert cache.get("other") == "b"
+    assert cache.stats()["invalidations"] == 2
+
+
+async def test_concurrent_misses_share_one_load():
+    cache = IdentityCache()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "alice", "user", None
+
+    users = await asyncio.gather(*[cache.get_or_load("token", loader) for _ in range(20)])
+    assert users == ["user"] * 20
+    assert calls == 1
+    assert await cache.get_or_load("token", loader) == "user"
+    assert calls == 1
+
+
+async def test_unknown_users_are_not_cached():
+    cache = IdentityCache()
+
+    async def loader():
+        return None, None, None
+
+    assert await cache.get_or_load("token", loader) is None
+    assert cache.stats()["size"] == 0
+
+
+async def test_cancelled_caller_does_not_fail_the_others():
+    cache = IdentityCache()
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return "alice", "user", None
+
+    first = asyncio.create_task(cache.get_or_load("token", loader))
+    second = asyncio.create_task(cache.get_or_load("token", loader))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == "user"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert cache.get("token") == "user"
+
+
+async def test_load_failure_reaches_every_waiter():
+    cache = IdentityCache()
+
+    async def loader():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("database down")
+
+    results = await asyncio.gather(*[cache.get_or_load("token", loader) for _ in range(3)], return_exceptions=True)
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert cache._inflight == {}
+
+
+async def test_load_started_before_an_invalidation_is_not_cached():
+    cache = IdentityCache()
+    reading, release = asyncio.Event(), asyncio.Event()
+
+    async def loader():
+        reading.set()
+        await release.wait()
+        return "alice", "stale user", None
+
+    load = asyncio.create_task(cache.get_or_load("token", loader))
+    await reading.wait()
+    # The user was updated while their record was being read
+    cache.invalidate_user("alice")
+    release.set()
+    assert await load == "stale user"
+    assert cache.get("token") is None
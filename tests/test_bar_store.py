@@ -0,0 +1,128 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from bar_store import BarStore
+from indexes import ensure_indexes
+from market_data import generate_bars, resample_bars
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime(2024, 3, 14, 12, 30)
+
+
+def make_store(**options):
+    return BarStore(AsyncMongoMockClient()["test"], **options)
+
+
+async def stored(store, symbol="AAPL", interval="1m"):
+    return await store.collection.count_documents({"symbol": symbol, "interval": interval})
+
+
+async def test_backfilled_bars_are_read_back_unchanged():
+    store = make_store()
+    first = await store.get_or_backfill("AAPL", "1m", 120, 150.0, end=NOW)
+    assert len(first["timestamp"]) == 120
+    assert first["timestamp"][-1] == np.datetime64("2024-03-14T12:30:00")
+    assert await stored(store) == 120
+    again = await store.get_or_backfill("AAPL", "1m", 120, 150.0, end=NOW)
+    for field in ("timestamp", "open", "close", "volume"):
+        assert np.array_equal(first[field], again[field])
+
+
+async def test_gaps_are_filled_between_stored_bars():
+    store = make_store()
+    await store.get_or_backfill("AAPL", "1m", 60, 150.0, end=NOW)
+    await store.collection.delete_many({"timestamp": {"$gte": datetime(2024, 3, 14, 12, 0), "$lt": datetime(2024, 3, 14, 12, 10)}})
+    bars, written = await store.backfill("AAPL", "1m", NOW - timedelta(minutes=59), NOW, 150.0)
+    assert written == 10
+    assert len(bars["timestamp"]) == 60
+    assert np.all(np.diff(bars["timestamp"]) == np.timedelta64(60, "s"))
+    # The gap ends on the next stored bar's open
+    after = bars["timestamp"] == np.datetime64("2024-03-14T12:10:00")
+    before = bars["timestamp"] == np.datetime64("2024-03-14T12:09:00")
+    assert bars["close"][before][0] == pytest.approx(bars["open"][after][0], abs=0.01)
+
+
+async def test_range_reads_are_bounded_and_ordered():
+    store = make_store()
+    await store.get_or_backfill("AAPL", "1m", 30, 150.0, end=NOW)
+    await store.get_or_backfill("MSFT", "1m", 30, 300.0, end=NOW)
+    bars = await store.get_range("AAPL", "1m", datetime(2024, 3, 14, 12, 10), datetime(2024, 3, 14, 12, 19))
+    assert len(bars["timestamp"]) == 10
+    assert np.all(np.diff(bars["timestamp"]).astype(int) > 0)
+    assert bars["volume"].dtype == np.int64
+
+
+async def test_ingested_bars_replace_mock_ones():
+    store = make_store()
+    await store.get_or_backfill("AAPL", "1m", 10, 150.0, end=NOW)
+    records = [
+        {"timestamp": "2024-03-14T12:29:00Z", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "volume": 7},
+        {"timestamp": "2024-03-14T12:31:00Z", "open": 1.5, "high": 2.5, "low": 1.0, "close": 2.0, "volume": 9},
+    ]
+    assert await store.ingest("AAPL", records, source="alpaca") == 2
+    assert await store.ingest("AAPL", records, source="alpaca") == 2
+    assert await stored(store) == 11
+    row = await store.collection.find_one({"symbol": "AAPL", "timestamp": datetime(2024, 3, 14, 12, 29)})
+    assert (row["close"], row["volume"], row["source"]) == (1.5, 7, "alpaca")
+
+
+async def test_reinserted_bars_are_not_duplicated():
+    store = make_store()
+    # The unique (symbol, interval, timestamp) index turns a second insert into ignored duplicates
+    await ensure_indexes(store.collection.database, ["market_data"])
+    bars = generate_bars("AAPL", "1m", 5, 150.0, end=NOW)
+    assert await store.insert_bars("AAPL", "1m", bars) == 5
+    assert await store.insert_bars("AAPL", "1m", bars) == 0
+    assert await stored(store) == 5
+
+
+async def test_coarse_bars_match_the_base_they_resample():
+    store = make_store()
+    hourly = await store.get_bars("AAPL", "1h", 3, 150.0, end=NOW)
+    base = await store.get_range("AAPL", "1m", datetime(2024, 3, 14, 10), NOW)
+    expected = resample_bars(base, "1h")
+    assert len(hourly["timestamp"]) == 3
+    for field in ("timestamp", "open", "high", "low", "close", "volume"):
+        assert np.array_equal(hourly[field], expected[field])
+    # Completed buckets are cached; the open one is rebuilt from base every read
+    assert await stored(store, interval="1h") == 2
+
+
+async def test_intervals_agree_with_each_other():
+    store = make_store()
+    # 10:00 to the open 12:30 bar: the same three hours, the last still open
+    quarter = await store.get_bars("AAPL", "15m", 11, 150.0, end=NOW)
+    hourly = await store.get_bars("AAPL", "1h", 3, 150.0, end=NOW)
+    regrouped = resample_bars(quarter, "1h")
+    for field in ("timestamp", "open", "high", "low", "close", "volume"):
+        assert np.array_equal(regrouped[field], hourly[field])
+
+
+async def test_base_writes_rebuild_the_cached_buckets():
+    store = make_store()
+    await store.get_bars("AAPL", "1h", 3, 150.0, end=NOW)
+    await store.ingest("AAPL", [
+        {"timestamp": "2024-03-14T11:30:00Z", "open": 150.0, "high": 999.0, "low": 1.0, "close": 150.0, "volume": 1},
+    ], source="alpaca")
+    # Only the bucket holding the new bar was dropped
+    assert await stored(store, interval="1h") == 1
+    hourly = await store.get_bars("AAPL", "1h", 3, 150.0, end=NOW)
+    assert (hourly["high"][1], hourly["low"][1]) == (999.0, 1.0)
+
+
+async def test_old_buckets_are_resampled_where_base_is_stored():
+    store = make_store(base_retention=timedelta(hours=2))
+    ingested = generate_bars("AAPL", "1m", 60, 150.0, end=datetime(2024, 3, 14, 6, 59))
+    await store.upsert_bars("AAPL", "1m", ingested, source="alpaca")
+    hourly = await store.get_bars("AAPL", "1h", 12, 150.0, end=NOW)
+    assert len(hourly["timestamp"]) == 12
+    at = hourly["timestamp"] == np.datetime64("2024-03-14T06:00:00")
+    expected = resample_bars(ingested, "1h")
+    for field in ("open", "high", "low", "close", "volume"):
+        assert hourly[field][at][0] == expected[field][0]
+    # The other old buckets were generated at 1h; base was only built for 11:00 and the open hour
+    assert await stored(store) == 60 + 60 + 31
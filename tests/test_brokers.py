@@ -0,0 +1,211 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from brokers import (
+    AlpacaAdapter,
+    BinanceAdapter,
+    BrokerRejected,
+    BrokerUnavailable,
+    CircuitBreaker,
+    broker_urls,
+)
+from fake_broker import STARTING_CASH, create_app
+from rate_limits import RateLimiter
+
+pytestmark = pytest.mark.anyio
+
+CONFIG = {"api_key": "key", "api_secret": "secret"}
+
+
+def make_adapter(cls=AlpacaAdapter, app=None, breaker=None, limiter=None, **options):
+    app = app or create_app(seed=1)
+    return cls(
+        CONFIG,
+        broker_urls("http://fake")[cls.provider]["paper"],
+        limiter or RateLimiter(),
+        breaker or CircuitBreaker(),
+        transport=httpx.ASGITransport(app=app),
+        **options,
+    )
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    assert breaker.before_call() is None
+
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.before_call() > 59
+    assert breaker.stats()["trips"] == 1
+    assert breaker.stats()["short_circuited"] == 1
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    assert breaker.before_call() is None
+    assert breaker.probing
+    # Everyone else keeps failing fast until the probe reports back
+    assert breaker.before_call() is not None
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert not breaker.probing
+
+
+def test_breaker_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.before_call() is None
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.stats()["trips"] == 2
+
+
+def test_breaker_released_probe_can_be_retaken():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    open_breaker(breaker)
+    time.sleep(0.02)
+    assert breaker.before_call() is None
+    breaker.release()
+    assert breaker.state == "half_open"
+    assert breaker.before_call() is None
+
+
+async def test_rate_limited_call_does_not_hold_the_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    limiter = RateLimiter(limits={"alpaca": (1, 60.0)})
+    adapter = make_adapter(breaker=breaker, limiter=limiter, max_wait=0.05)
+    await limiter.acquire("alpaca", CONFIG["api_key"])
+    open_breaker(breaker)
+    await asyncio.sleep(0.02)
+
+    with pytest.raises(BrokerUnavailable) as raised:
+        await adapter.account()
+    assert raised.value.status_code == 429
+    assert breaker.state == "half_open" and not breaker.probing
+
+    # With budget again the next call probes and closes the circuit
+    adapter.limiter = RateLimiter()
+    assert (await adapter.account())["cash"] == STARTING_CASH
+    assert breaker.state == "closed"
+    await adapter.aclose()
+
+
+async def test_cancelled_probe_is_released():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    adapter = make_adapter(app=create_app(latency=5), breaker=breaker)
+    open_breaker(breaker)
+    await asyncio.sleep(0.02)
+
+    call = asyncio.create_task(adapter.account())
+    await asyncio.sleep(0.05)
+    assert breaker.probing
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert breaker.state == "half_open" and not breaker.probing
+    await adapter.aclose()
+
+
+async def test_server_errors_are_retried_then_trip_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    adapter = make_adapter(app=create_app(failure_rate=1.0), breaker=breaker, max_attempts=3)
+    with pytest.raises(BrokerUnavailable) as raised:
+        await adapter.account()
+    assert raised.value.status_code == 503
+    assert adapter.stats()["retries"] == 2
+    assert breaker.state == "open"
+    with pytest.raises(BrokerUnavailable, match="circuit open"):
+        await adapter.account()
+    await adapter.aclose()
+
+
+async def test_alpaca_normalized_shapes():
+    adapter = make_adapter()
+    account = await adapter.account()
+    assert account == {
+        "provider": "alpaca", "cash": STARTING_CASH, "equity": STARTING_CASH,
+        "buying_power": STARTING_CASH, "currency": "USD",
+    }
+
+    order = await adapter.submit_order("AAPL", "buy", 2, client_order_id="order-1")
+    assert order["provider"] == "alpaca"
+    assert order["client_order_id"] == "order-1"
+    assert (order["symbol"], order["side"], order["quantity"], order["order_type"]) == ("AAPL", "buy", 2.0, "market")
+    assert order["status"] == "filled" and order["filled_quantity"] == 2.0 and order["filled_price"] > 0
+
+    [position] = await adapter.positions()
+    assert position["symbol"] == "AAPL" and position["quantity"] == 2.0
+    assert position["avg_entry_price"] == pytest.approx(order["filled_price"], rel=1e-4)
+    assert set(position) == {"provider", "symbol", "quantity", "avg_entry_price", "current_price", "market_value", "unrealized_pl"}
+
+    await adapter.submit_order("AAPL", "sell", 5)
+    [short] = await adapter.positions()
+    assert short["quantity"] == -3.0
+
+    assert [order["client_order_id"] for order in await adapter.orders()][0] == "order-1"
+    bars = await adapter.bars("AAPL", "1h", 5)
+    assert len(bars) == 5 and set(bars[0]) == {"timestamp", "open", "high", "low", "close", "volume"}
+    await adapter.aclose()
+
+
+async def test_binance_normalized_shapes():
+    adapter = make_adapter(BinanceAdapter)
+    assert (await adapter.account())["currency"] == "USDT"
+
+    order = await adapter.submit_order("BTC", "buy", 0.5, client_order_id="order-1")
+    assert (order["symbol"], order["side"], order["quantity"], order["status"]) == ("BTC", "buy", 0.5, "filled")
+    assert order["filled_price"] > 0
+
+    [position] = await adapter.positions()
+    assert position["symbol"] == "BTC" and position["quantity"] == 0.5
+    # Spot balances have no entry price
+    assert position["avg_entry_price"] is None
+    assert position["market_value"] == pytest.approx(0.5 * position["current_price"])
+
+    account = await adapter.account()
+    assert account["cash"] == pytest.approx(STARTING_CASH - 0.5 * order["filled_price"])
+    assert await adapter.orders() == []
+    assert len(await adapter.bars("BTC", "1d", 3)) == 3
+    await adapter.aclose()
+
+
+async def test_rejected_order_is_not_retried():
+    adapter = make_adapter(BinanceAdapter)
+    with pytest.raises(BrokerRejected) as raised:
+        await adapter.submit_order("BTC", "sell", 1)
+    assert raised.value.status_code == 400
+    assert adapter.stats()["retries"] == 0
+    await adapter.aclose()
+
+
+@pytest.mark.parametrize("cls, symbol", [(AlpacaAdapter, "AAPL"), (BinanceAdapter, "BTC")])
+async def test_duplicate_client_order_id_returns_the_placed_order(cls, symbol):
+    app = create_app(seed=1)
+    adapter = make_adapter(cls, app=app)
+    first = await adapter.submit_order(symbol, "buy", 0.1, client_order_id="retried")
+    # As when a timed-out submission is retried after the broker placed it
+    again = await adapter.submit_order(symbol, "buy", 0.1, client_order_id="retried")
+    assert again["id"] == first["id"]
+    assert again["filled_quantity"] == 0.1
+    [account] = app.state.accounts.values()
+    assert account.positions[symbol][0] == pytest.approx(0.1)
+    await adapter.aclose()
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import indicator_state
+from indicator_state import IndicatorState, empty_state, latest, step
+from indicators import bars_matrix, compute_indicators, latest_values
+from market_data import generate_bars
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2024, 3, 14, 12, 30)
+BASES = {"AAPL": 150.0, "MSFT": 300.0}
+HISTORY = {symbol: generate_bars(symbol, "1d", 300, base, end=START + timedelta(days=3)) for symbol, base in BASES.items()}
+
+
+class Clock(datetime):
+    now = START
+
+    @classmethod
+    def utcnow(cls):
+        return cls.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    monkeypatch.setattr(indicator_state, "datetime", Clock)
+    Clock.now = START
+    return Clock
+
+
+def assert_matches(values, expected):
+    for name, column in latest_values(expected).items():
+        assert np.allclose(values[name], column, rtol=1e-9, equal_nan=True), name
+
+
+def full_recompute(series):
+    matrices = bars_matrix(series)
+    return compute_indicators(matrices["high"], matrices["low"], matrices["close"])
+
+
+async def load_bars(symbol, limit):
+    bars = HISTORY[symbol]
+    # Bars up to and including the one open at the clock's time
+    count = int((bars["timestamp"] <= np.datetime64(Clock.now, "s")).sum())
+    return {field: values[max(0, count - limit):count] for field, values in bars.items()}
+
+
+def test_stepping_matches_a_full_recompute():
+    # A shorter history is NaN-padded on the left and must not move its row
+    series = [HISTORY["AAPL"], {field: values[-120:] for field, values in HISTORY["MSFT"].items()}]
+    matrices = bars_matrix(series)
+    state = empty_state(2)
+    for column in range(matrices["close"].shape[1]):
+        state = step(state, matrices["high"][:, column], matrices["low"][:, column], matrices["close"][:, column])
+        if column in (30, 200, 299):
+            assert_matches(latest(state), {name: values[:, :column + 1] for name, values in full_recompute(series).items()})
+    assert list(state["bars"]) == [300, 120]
+
+
+def test_step_leaves_the_old_state_alone():
+    state = empty_state(1)
+    advanced = step(state, np.array([2.0]), np.array([1.0]), np.array([1.5]))
+    assert advanced["prev_close"][0] == 1.5 and advanced["bars"][0] == 1
+    assert np.isnan(state["prev_close"][0]) and state["bars"][0] == 0
+
+
+async def test_evaluation_catches_up_on_closed_bars_only(clock):
+    tracker = IndicatorState(AsyncMongoMockClient()["test"])
+    symbols = list(BASES)
+    values = await tracker.evaluate("1d", symbols, load_bars, warmup=100)
+    assert_matches(values, full_recompute([await load_bars(symbol, 100) for symbol in symbols]))
+    # The open bar is applied provisionally and never committed
+    assert tracker.stats()["bars_applied"] == 2 * 99
+
+    clock.now = START + timedelta(days=3)
+    values = await tracker.evaluate("1d", symbols, load_bars, warmup=100)
+    assert_matches(values, full_recompute([await load_bars(symbol, 103) for symbol in symbols]))
+    assert tracker.stats()["bars_applied"] == 2 * 102
+    assert tracker.warmups == 2
+
+
+async def test_restart_resumes_from_stored_state(clock):
+    db = AsyncMongoMockClient()["test"]
+    await IndicatorState(db).evaluate("1d", ["AAPL"], load_bars, warmup=100)
+
+    clock.now = START + timedelta(days=1)
+    resumed = IndicatorState(db)
+    values = await resumed.evaluate("1d", ["AAPL"], load_bars, warmup=100)
+    assert (resumed.restored, resumed.warmups, resumed.bars_applied) == (1, 0, 1)
+    assert_matches(values, full_recompute([await load_bars("AAPL", 101)]))
+
+
+async def test_state_too_far_behind_is_warmed_up_again(clock):
+    tracker = IndicatorState(AsyncMongoMockClient()["test"], max_catch_up=1)
+    await tracker.evaluate("1d", ["AAPL"], load_bars, warmup=100)
+    clock.now = START + timedelta(days=3)
+    values = await tracker.evaluate("1d", ["AAPL"], load_bars, warmup=100)
+    assert tracker.warmups == 2
+    assert_matches(values, full_recompute([await load_bars("AAPL", 100)]))
@@ -0,0 +1,141 @@
+import asyncio
+import json
+
+import pytest
+
+from live_updates import ClientSession, LiveUpdates
+from pubsub import Hub
+
+pytestmark = pytest.mark.anyio
+
+
+class Bars:
+    """Newest bar per (symbol, interval), counting the reads."""
+
+    def __init__(self):
+        self.bars = {}
+        self.reads = []
+
+    async def load(self, symbol, interval):
+        self.reads.append((symbol, interval))
+        return self.bars.get((symbol, interval))
+
+
+def make_updates(**options):
+    bars = Bars()
+    updates = LiveUpdates(Hub(), bars.load, lambda symbols: [symbol for symbol in symbols if symbol != "NOPE"], **options)
+    return updates, bars
+
+
+def make_session(user_id="alice"):
+    sent = []
+
+    async def send(text):
+        sent.append(json.loads(text))
+
+    return ClientSession(user_id, send), sent
+
+
+async def drain(session):
+    return [json.loads(text) for text in await session.get()]
+
+
+async def test_slow_client_gets_the_latest_bar_only():
+    updates, bars = make_updates()
+    session, _ = make_session()
+    updates.handle(session, {"action": "subscribe", "symbols": ["AAPL", "NOPE"], "interval": "1m"})
+    subscribed = await drain(session)
+    assert subscribed[0]["data"]["missing"] == ["NOPE"]
+    for close in (1.0, 2.0, 3.0):
+        bars.bars[("AAPL", "1m")] = {"close": close}
+        await updates.poll()
+    frames = await drain(session)
+    assert [(each["type"], each["data"]["close"]) for each in frames] == [("bar", 3.0)]
+    assert session.coalesced == 2
+
+
+async def test_coarse_bars_are_read_only_when_the_base_bar_moved():
+    updates, bars = make_updates()
+    session, _ = make_session()
+    updates.handle(session, {"action": "subscribe", "symbols": ["AAPL"], "interval": "1h"})
+    bars.bars[("AAPL", "1m")] = {"close": 1.0}
+    bars.bars[("AAPL", "1h")] = {"close": 1.0}
+    await updates.poll()
+    await updates.poll()
+    assert bars.reads == [("AAPL", "1m"), ("AAPL", "1h"), ("AAPL", "1m")]
+    assert updates.bars_published == 1
+
+
+async def test_new_subscriber_gets_the_current_bar_at_once():
+    updates, bars = make_updates()
+    first, _ = make_session("alice")
+    updates.handle(first, {"action": "subscribe", "symbols": ["AAPL"], "interval": "1m"})
+    bars.bars[("AAPL", "1m")] = {"close": 1.0}
+    await updates.poll()
+
+    second, _ = make_session("bob")
+    updates.handle(second, {"action": "subscribe", "symbols": ["AAPL"], "interval": "1m"})
+    assert [each["type"] for each in await drain(second)] == ["subscribed", "bar"]
+    # One poll serves both sessions
+    await updates.poll()
+    assert bars.reads.count(("AAPL", "1m")) == 2
+
+
+async def test_unwatched_topics_are_not_polled():
+    updates, bars = make_updates()
+    session, _ = make_session()
+    updates.handle(session, {"action": "subscribe", "symbols": ["AAPL"], "interval": "1m"})
+    updates.handle(session, {"action": "unsubscribe", "symbols": ["AAPL"], "interval": "1m"})
+    await updates.poll()
+    assert bars.reads == []
+    assert updates.stats()["bar_topics"] == 0
+
+
+async def test_events_reach_only_their_owner():
+    updates, _ = make_updates()
+    alice, _ = make_session("alice")
+    bob, _ = make_session("bob")
+    for session in (alice, bob):
+        updates.handle(session, {"action": "subscribe", "channels": ["alerts"]})
+        await session.get()
+    updates.publish_events("alerts", [{"_id": "mongo", "id": "a", "user_id": "alice"}])
+    assert await drain(alice) == [{"type": "alert", "data": {"id": "a", "user_id": "alice"}}]
+    assert not bob._pending
+
+
+async def test_invalid_messages_are_answered_with_an_error():
+    updates, _ = make_updates(max_symbols=1)
+    session, _ = make_session()
+    with pytest.raises(ValueError):
+        updates.handle(session, {"action": "subscribe", "symbols": ["AAPL", "MSFT"], "interval": "1m"})
+    with pytest.raises(ValueError):
+        updates.handle(session, {"action": "subscribe", "interval": "7m"})
+
+
+async def test_overflow_is_announced_with_a_resync():
+    session, sent = make_session()
+    session.maxsize = 2
+    for index in range(3):
+        session.reply("pong", index)
+    sender = asyncio.create_task(session.flush_forever(1.0))
+    await asyncio.sleep(0)
+    sender.cancel()
+    await asyncio.gather(sender, return_exceptions=True)
+    assert [each["type"] for each in sent[0]] == ["resync", "pong", "pong"]
+
+
+async def test_client_that_stops_reading_is_disconnected():
+    updates, _ = make_updates(send_timeout=0.01)
+    stalled = asyncio.Event()
+
+    async def send(text):
+        await stalled.wait()
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    session = updates.session("alice", send)
+    session.reply("pong", None)
+    assert await updates.serve(session, receive) == "slow"
+    assert updates.stats()["connected"] == 0
+    assert updates.disconnects == {"slow": 1}
@@ -0,0 +1,110 @@
+import asyncio
+import os
+
+import numpy as np
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from model_pool import ModelPool, ModelSpec
+
+pytestmark = pytest.mark.anyio
+
+
+class Crasher:
+    """Sums each row, and kills its worker on a row starting with a negative value."""
+
+    def predict(self, rows):
+        if (rows[:, 0] < 0).any():
+            os._exit(1)
+        return rows.sum(axis=1)
+
+
+def crashing_model():
+    return Crasher()
+
+
+@pytest.fixture(scope="module")
+def classifier(tmp_path_factory):
+    from joblib import dump
+    from sklearn.linear_model import LogisticRegression
+
+    rng = np.random.default_rng(0)
+    rows = rng.normal(size=(200, 4))
+    model = LogisticRegression().fit(rows, rows[:, 0] + rows[:, 1] > 0)
+    path = str(tmp_path_factory.mktemp("models") / "classifier.joblib")
+    dump(model, path)
+    return model, path
+
+
+async def started_pool(path, **options) -> ModelPool:
+    pool = ModelPool(workers=2, **options)
+    pool.register(ModelSpec("classifier", "price_model:load", (path,), "predict_proba"))
+    pool.register(ModelSpec("crasher", "tests.test_model_pool:crashing_model"))
+    await pool.start()
+    return pool
+
+
+async def test_concurrent_rows_are_batched(classifier):
+    model, path = classifier
+    pool = await started_pool(path, max_batch=64, max_wait=0.05)
+    try:
+        rows = np.random.default_rng(1).normal(size=(100, 4))
+        results = await asyncio.gather(*[pool.predict("classifier", rows[i:i + 1]) for i in range(len(rows))])
+        np.testing.assert_allclose(np.concatenate(results), model.predict_proba(rows))
+
+        stats = pool.stats()["models"]["classifier"]
+        assert stats["requests"] == 100
+        assert stats["batches"] < 10
+        assert stats["avg_batch_size"] > 10
+    finally:
+        pool.shutdown()
+
+
+async def test_full_batch_does_not_wait(classifier):
+    _, path = classifier
+    pool = await started_pool(path, max_batch=8, max_wait=10.0)
+    try:
+        rows = np.zeros((8, 4))
+        result = await asyncio.wait_for(pool.predict("classifier", rows), timeout=5)
+        assert result.shape == (8, 2)
+    finally:
+        pool.shutdown()
+
+
+async def test_unknown_model(classifier):
+    _, path = classifier
+    pool = await started_pool(path)
+    try:
+        with pytest.raises(KeyError):
+            await pool.predict("missing", np.zeros((1, 4)))
+    finally:
+        pool.shutdown()
+
+
+async def test_calls_fail_after_shutdown(classifier):
+    _, path = classifier
+    pool = await started_pool(path)
+    assert pool.stats()["running"]
+    pool.shutdown()
+    pool.shutdown()
+    assert not pool.stats()["running"]
+    with pytest.raises(RuntimeError):
+        await pool.predict("classifier", np.zeros((1, 4)))
+    assert pool.stats()["models"]["classifier"]["failures"] == 1
+
+
+async def test_worker_crash_fails_its_batch_and_restarts(classifier):
+    _, path = classifier
+    pool = await started_pool(path, max_wait=0.01)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await pool.predict("crasher", np.array([[-1.0, 2.0]]))
+        assert pool.stats()["restarts"] == 1
+
+        # Fresh workers serve the next calls, with every model loaded again
+        result = await pool.predict("crasher", np.array([[1.0, 2.0], [3.0, 4.0]]))
+        np.testing.assert_allclose(result, [3.0, 7.0])
+        assert (await pool.predict("classifier", np.zeros((1, 4)))).shape == (1, 2)
+        assert pool.stats()["restarts"] == 1
+    finally:
+        pool.shutdown()
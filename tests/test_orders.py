@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from orders import OrdersElsewhere, RiskBook, RiskRejected, TradeWriter
+from portfolio import Account, Holding
+
+pytestmark = pytest.mark.anyio
+
+SETTINGS = {
+    "max_position_size": 10.0,  # % of the portfolio
+    "max_loss_per_trade": 1.0,
+    "default_stop_loss": 2.0,
+    "trailing_stop_loss": False,
+    "trailing_stop_pct": None,
+}
+
+
+async def make_book(settle=None, **settings):
+    book = RiskBook(
+        AsyncMongoMockClient()["test"],
+        default=lambda user_id: {"user_id": user_id, **SETTINGS, **settings},
+        settle=settle,
+    )
+    assert await book.claim()
+    return book
+
+
+def make_account(cash=10000.0, **holdings):
+    account = Account("user", cash)
+    for asset_id, quantity in holdings.items():
+        account.add(Holding({"asset_id": asset_id, "quantity": quantity, "avg_entry_price": 100.0}, 100.0, 0.0))
+    return account
+
+
+def rejected_rule(book, account, *args, **kwargs):
+    with pytest.raises(RiskRejected) as raised:
+        book.check(account, *args, **kwargs)
+    return raised.value.rule
+
+
+async def test_position_over_the_size_limit_is_rejected():
+    book = await make_book()
+    account = make_account()
+    # 11 x 100 is 11% of a 10,000 portfolio
+    assert rejected_rule(book, account, "AAPL", "buy", 11, 100.0) == "max_position_size"
+    assert book.check(account, "AAPL", "buy", 10, 100.0).quantity == 10
+    assert book.rejections == {"max_position_size": 1}
+
+
+async def test_loss_at_the_stop_over_the_limit_is_rejected():
+    book = await make_book(max_position_size=100.0)
+    account = make_account()
+    # 10 x (100 - 80) = 200 at the stop, 2% of the portfolio
+    assert rejected_rule(book, account, "AAPL", "buy", 10, 100.0, stop_price=80.0) == "max_loss_per_trade"
+    # At the 2% default stop, the loss is 20
+    assert book.check(account, "AAPL", "buy", 10, 100.0).stop_price == pytest.approx(98.0)
+
+
+async def test_buy_without_the_cash_is_rejected():
+    book = await make_book(max_position_size=1000.0, max_loss_per_trade=100.0)
+    account = make_account(cash=500.0, MSFT=95.0)
+    assert rejected_rule(book, account, "AAPL", "buy", 6, 100.0) == "cash"
+
+
+async def test_reducing_a_position_skips_the_size_and_loss_limits():
+    book = await make_book(max_position_size=1.0)
+    account = make_account(cash=0.0, AAPL=50.0)
+    check = book.check(account, "AAPL", "sell", 20, 100.0)
+    assert check.quantity == -20 and check.cash == 0.0
+
+
+async def test_reservations_count_until_released():
+    book = await make_book()
+    account = make_account()
+    first = book.check(account, "AAPL", "buy", 6, 100.0)
+    # The first order's 6 are not in the book yet, but still count
+    assert rejected_rule(book, account, "AAPL", "buy", 6, 100.0) == "max_position_size"
+    book.release(first)
+    assert book.stats()["pending_orders"] == 0
+    book.check(account, "AAPL", "buy", 6, 100.0)
+
+
+async def test_reserved_cash_is_spent_across_assets():
+    book = await make_book(max_position_size=100.0, max_loss_per_trade=100.0)
+    account = make_account(cash=1500.0)
+    book.check(account, "AAPL", "buy", 10, 100.0)
+    assert rejected_rule(book, account, "MSFT", "buy", 10, 100.0) == "cash"
+    book.check(account, "MSFT", "buy", 5, 100.0)
+
+
+async def test_resting_order_keeps_its_unfilled_part_until_settled():
+    closed = set()
+
+    async def settle(user_id, provider, order_ids):
+        return [order_id for order_id in order_ids if order_id in closed]
+
+    book = await make_book(settle=settle)
+    account = make_account()
+    check = book.check(account, "AAPL", "buy", 8, 100.0)
+    book.hold(check, filled=2, provider="alpaca", order_id="order-1")
+    # 6 of the 8 still rest at the broker
+    assert rejected_rule(book, account, "AAPL", "buy", 5, 100.0) == "max_position_size"
+    book.check(account, "AAPL", "buy", 4, 100.0)
+
+    await book.settle_resting()
+    assert book.stats()["resting_orders"] == 1
+    closed.add("order-1")
+    await book.settle_resting()
+    assert book.stats()["resting_orders"] == 0
+    assert book._pending_quantity == {("user", "AAPL"): pytest.approx(4.0)}
+
+
+async def test_takeover_resumes_resting_trades():
+    book = await make_book()
+    trade = {"order_id": "order-1", "user_id": "user", "asset_id": "AAPL", "provider": "alpaca",
+             "side": "buy", "quantity": 6, "price": 100.0}
+    book.resume(trade)
+    book.resume(trade)
+    assert book.stats()["resting_orders"] == 1
+    assert rejected_rule(book, make_account(), "AAPL", "buy", 5, 100.0) == "max_position_size"
+
+
+async def test_other_workers_do_not_check_orders():
+    book = RiskBook(AsyncMongoMockClient()["test"], default=lambda user_id: SETTINGS, accept_orders=False)
+    assert not await book.claim()
+    with pytest.raises(OrdersElsewhere):
+        book.check(make_account(), "AAPL", "buy", 1, 100.0)
+
+
+class FlakyTrades:
+    """A ``trades`` collection whose first ``failures`` bulk writes raise."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.rows = {}
+        self.started = asyncio.Event()
+        self.blocked = None
+
+    async def bulk_write(self, operations, ordered=True):
+        self.started.set()
+        if self.blocked is not None:
+            await self.blocked.wait()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        for operation in operations:
+            trade = operation._doc["$setOnInsert"]
+            self.rows.setdefault(trade["id"], trade)
+
+
+async def test_failed_batch_is_requeued_and_written_once():
+    trades = FlakyTrades(failures=1)
+    writer = TradeWriter(trades, batch_size=2)
+    for trade_id in "abc":
+        writer.put({"id": trade_id})
+    assert not await writer.flush()
+    assert writer.stats() == {"queued": 3, "written": 0, "batches": 0, "errors": 1}
+    assert await writer.flush()
+    assert sorted(trades.rows) == ["a", "b", "c"]
+    assert writer.stats()["written"] == 3
+
+
+async def test_stop_during_a_write_keeps_the_batch():
+    trades = FlakyTrades()
+    trades.blocked = asyncio.Event()
+    writer = TradeWriter(trades, flush_interval=0)
+    writer.start()
+    for trade_id in "abc":
+        writer.put({"id": trade_id})
+    await trades.started.wait()
+    trades.blocked.set()
+    # Cancelled while bulk_write is awaited; the final flush writes the batch again
+    await writer.stop()
+    assert sorted(trades.rows) == ["a", "b", "c"]
+    assert writer.stats()["queued"] == 0
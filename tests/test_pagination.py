@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from pagination import InvalidCursor, decode_cursor, encode_cursor, fetch_page, keyset_filter, page_from_items
+
+pytestmark = pytest.mark.anyio
+
+START = datetime(2024, 3, 14, 12, 0)
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor({"created_at": START, "id": "abc"}, "created_at")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (START, "abc")
+
+
+def test_cursor_truncates_to_milliseconds():
+    # Mongo keeps milliseconds, so the cursor must name the value as stored
+    cursor = encode_cursor({"created_at": START.replace(microsecond=123456), "id": "abc"}, "created_at")
+    assert decode_cursor(cursor) == (START.replace(microsecond=123000), "abc")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", "eyJ2IjoieCIsImlkIjoxfQ"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_filter_continues_after_the_cursor_row():
+    cursor = encode_cursor({"created_at": START, "id": "m"}, "created_at")
+    assert keyset_filter({}, "created_at", None) == {}
+    assert keyset_filter({"user_id": "u"}, "created_at", cursor) == {"$and": [
+        {"user_id": "u"},
+        {"$or": [{"created_at": {"$lt": START}}, {"created_at": START, "id": {"$lt": "m"}}]},
+    ]}
+
+
+async def test_pages_cover_every_row_once_across_timestamp_ties():
+    collection = AsyncMongoMockClient()["test"]["alerts"]
+    # Pairs of rows share a timestamp, as bulk inserts do
+    rows = [
+        {"id": f"{index:03d}", "user_id": "u", "created_at": START + timedelta(seconds=index // 2)}
+        for index in range(25)
+    ]
+    await collection.insert_many([dict(row) for row in rows])
+    seen, cursor = [], None
+    while True:
+        page, cursor = await fetch_page(collection, {"user_id": "u"}, "created_at", 10, cursor)
+        seen.extend(doc["id"] for doc in page)
+        if cursor is None:
+            break
+    assert seen == [row["id"] for row in sorted(rows, key=lambda row: (row["created_at"], row["id"]), reverse=True)]
+
+
+async def test_in_memory_first_page_matches_the_stored_one():
+    collection = AsyncMongoMockClient()["test"]["signals"]
+    rows = [
+        {"id": f"{index:03d}", "created_at": START + timedelta(microseconds=index * 400)}
+        for index in range(12)
+    ]
+    await collection.insert_many([dict(row) for row in rows])
+    stored, stored_cursor = await fetch_page(collection, {}, "created_at", 5)
+    items, cursor = page_from_items(rows, "created_at", 5)
+    assert [doc["id"] for doc in items] == [doc["id"] for doc in stored]
+    assert cursor == stored_cursor
+    # The cursor of either continues the stored rows without a gap or repeat
+    rest, _ = await fetch_page(collection, {}, "created_at", 20, cursor)
+    assert len(rest) == 7 and not {doc["id"] for doc in rest} & {doc["id"] for doc in items}
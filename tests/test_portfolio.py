@@ -0,0 +1,119 @@
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from portfolio import PortfolioBook
+
+pytestmark = pytest.mark.anyio
+
+
+def fill(side, quantity, price, trade_id="t", user_id="user", asset_id="AAPL"):
+    return {
+        "id": trade_id,
+        "user_id": user_id,
+        "asset_id": asset_id,
+        "provider": "alpaca",
+        "side": side,
+        "quantity": quantity,
+        "price": price,
+    }
+
+
+def make_book(db=None, price=100.0):
+    async def latest(asset_id):
+        return price
+
+    return PortfolioBook(db if db is not None else AsyncMongoMockClient()["test"], latest, latest)
+
+
+async def test_buys_blend_the_entry_price():
+    book = make_book()
+    await book.ensure_user("user")
+    book.apply_fill(fill("buy", 10, 100.0))
+    position = book.apply_fill(fill("buy", 10, 110.0))
+    assert position["quantity"] == 20
+    assert position["avg_entry_price"] == pytest.approx(105.0)
+    assert book.summary("user")["cash_balance"] == pytest.approx(10000 - 1000 - 1100)
+
+
+async def test_partial_sell_realizes_against_the_entry():
+    book = make_book()
+    account = await book.ensure_user("user")
+    book.apply_fill(fill("buy", 10, 100.0))
+    position = book.apply_fill(fill("sell", 4, 110.0))
+    assert position["quantity"] == 6
+    assert position["avg_entry_price"] == pytest.approx(100.0)
+    assert account.realized_pl == pytest.approx(40.0)
+    assert account.cash == pytest.approx(10000 - 1000 + 440)
+
+
+async def test_overselling_flips_short_at_the_fill_price():
+    book = make_book()
+    account = await book.ensure_user("user")
+    book.apply_fill(fill("buy", 10, 100.0))
+    position = book.apply_fill(fill("sell", 15, 120.0))
+    assert position["quantity"] == -5
+    assert position["avg_entry_price"] == pytest.approx(120.0)
+    # Only the 10 held were closed
+    assert account.realized_pl == pytest.approx(200.0)
+    # Covering the short realizes the other way
+    book.apply_fill(fill("buy", 5, 110.0))
+    assert account.realized_pl == pytest.approx(250.0)
+    assert book.positions("user") == []
+
+
+async def test_fills_for_unloaded_users_are_skipped():
+    book = make_book()
+    assert book.apply_fill(fill("buy", 1, 100.0)) is None
+    assert book.fills == 0
+
+
+async def test_persisted_fills_match_the_book():
+    db = AsyncMongoMockClient()["test"]
+    book = make_book(db)
+    account = await book.ensure_user("user")
+    for trade in (fill("buy", 10, 100.0, "1"), fill("sell", 4, 110.0, "2"), fill("sell", 8, 120.0, "3")):
+        await book.persist_fill(trade, book.apply_fill(trade))
+
+    stored = await db.positions.find_one({"user_id": "user", "asset_id": "AAPL"})
+    assert stored["quantity"] == pytest.approx(-2.0)
+    assert stored["avg_entry_price"] == pytest.approx(120.0)
+    balance = await db.portfolio_accounts.find_one({"user_id": "user"})
+    assert balance["cash"] == pytest.approx(account.cash)
+    assert balance["realized_pl"] == pytest.approx(account.realized_pl) == pytest.approx(160.0)
+    # Only this book wrote, so it kept up with every version and needs no reload
+    assert account.version == balance["version"] == 3
+    assert await book.sync() == 0
+    assert book.fill_write_failures == 0
+
+    # A fresh book loads the same state from the stored rows
+    reloaded = await make_book(db).ensure_user("user")
+    assert reloaded.cash == pytest.approx(account.cash)
+    assert reloaded.realized_pl == pytest.approx(account.realized_pl)
+    assert reloaded.holdings["AAPL"].quantity == pytest.approx(-2.0)
+
+
+async def test_closing_a_position_deletes_its_row():
+    db = AsyncMongoMockClient()["test"]
+    book = make_book(db)
+    await book.ensure_user("user")
+    for trade in (fill("buy", 3, 100.0, "1"), fill("sell", 3, 90.0, "2")):
+        await book.persist_fill(trade, book.apply_fill(trade))
+    assert await db.positions.count_documents({"user_id": "user"}) == 0
+    assert (await db.portfolio_accounts.find_one({"user_id": "user"}))["realized_pl"] == pytest.approx(-30.0)
+
+
+async def test_another_workers_fill_reloads_the_account():
+    db = AsyncMongoMockClient()["test"]
+    first, second = make_book(db), make_book(db)
+    await first.ensure_user("user")
+    await first.sync()
+    account = await second.ensure_user("user")
+    await second.persist_fill(fill("buy", 5, 100.0), second.apply_fill(fill("buy", 5, 100.0)))
+    assert account.version == 1
+
+    reloaded = []
+    first.on_reload = reloaded.append
+    assert await first.sync() == 1
+    assert reloaded == ["user"]
+    assert first.positions("user")[0]["quantity"] == pytest.approx(5.0)
+    assert first.summary("user")["cash_balance"] == pytest.approx(9500.0)
@@ -0,0 +1,171 @@
+from datetime import datetime, timedelta
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from orders import RiskLimits
+from price_monitor import PriceMonitor, Stop, _Ladder
+
+pytestmark = pytest.mark.anyio
+
+LIMITS = RiskLimits(max_position=0.1, max_loss=0.01, stop=0.05)
+TRAILING = LIMITS._replace(trailing=True)
+
+
+def stop(level, direction=1, kind="stop_loss", pct=None):
+    return Stop("user", "AAPL", kind, direction, level, pct=pct)
+
+
+def position(quantity=10.0, entry=100.0, user_id="user"):
+    return {"user_id": user_id, "asset_id": "AAPL", "quantity": quantity, "avg_entry_price": entry}
+
+
+def make_monitor(db=None):
+    emitted = []
+
+    async def emit(fired):
+        emitted.extend(fired)
+
+    async def no_price(asset_id):
+        return None
+
+    return PriceMonitor(no_price, emit, db=db), emitted
+
+
+def test_ladder_fires_the_stops_the_price_crossed():
+    ladder = _Ladder(1, 1.0, False)
+    stops = {level: stop(level) for level in (85.0, 90.0, 95.0)}
+    for level, each in stops.items():
+        ladder.add(level, each)
+    fired = []
+    ladder.tick(92.0, fired)
+    assert fired == [(stops[95.0], 95.0)]
+    ladder.tick(84.0, fired)
+    assert [level for _, level in fired] == [95.0, 85.0, 90.0]
+    assert ladder.peaks == []
+
+
+def test_ladder_fires_short_stops_on_a_rise():
+    ladder = _Ladder(-1, 1.0, False)
+    short = stop(105.0, direction=-1)
+    ladder.add(-105.0, short)
+    fired = []
+    ladder.tick(104.0, fired)
+    assert fired == []
+    ladder.tick(105.5, fired)
+    assert fired == [(short, 105.0)]
+
+
+def test_trailing_peaks_follow_a_rise_and_merge():
+    ladder = _Ladder(1, 0.9, True)
+    first, second = stop(100.0, kind="trailing_stop", pct=0.1), stop(105.0, kind="trailing_stop", pct=0.1)
+    ladder.add(100.0, first)
+    ladder.add(105.0, second)
+    fired = []
+    ladder.tick(110.0, fired)
+    assert fired == []
+    # Both peaks were below the new high, so they share one bucket at it
+    assert ladder.peaks == [110.0] and ladder.buckets == [[first, second]]
+    ladder.tick(99.5, fired)
+    assert fired == []
+    ladder.tick(98.0, fired)
+    assert [(each, round(level, 6)) for each, level in fired] == [(first, 99.0), (second, 99.0)]
+
+
+def test_trailing_peaks_follow_a_fall_for_shorts():
+    # A short's trailing stop sits 10% above the lowest price since entry
+    ladder = _Ladder(-1, 1.1, True)
+    short = stop(100.0, direction=-1, kind="trailing_stop", pct=0.1)
+    ladder.add(-100.0, short)
+    fired = []
+    ladder.tick(90.0, fired)
+    assert ladder.peaks == [-90.0]
+    ladder.tick(98.0, fired)
+    assert fired == []
+    ladder.tick(99.5, fired)
+    assert [(each, round(level, 6)) for each, level in fired] == [(short, 99.0)]
+
+
+def test_trailing_merge_joins_an_existing_peak():
+    ladder = _Ladder(1, 0.9, True)
+    low, high = stop(100.0, kind="trailing_stop", pct=0.1), stop(110.0, kind="trailing_stop", pct=0.1)
+    ladder.add(100.0, low)
+    ladder.add(110.0, high)
+    ladder.tick(110.0, [])
+    assert ladder.peaks == [110.0] and ladder.buckets == [[high, low]]
+
+
+def test_ladder_compact_keeps_active_stops_only():
+    ladder = _Ladder(1, 1.0, False)
+    kept, dropped = stop(90.0), stop(90.0)
+    ladder.add(90.0, kept)
+    ladder.add(90.0, dropped)
+    ladder.add(80.0, stop(80.0))
+    assert ladder.compact({kept.id: kept}) == 1
+    assert ladder.peaks == [90.0] and ladder.buckets == [[kept]]
+
+
+async def test_fired_stop_is_not_rearmed_until_the_position_changes():
+    monitor, emitted = make_monitor()
+    monitor.watch_position(position(), LIMITS)
+    assert monitor.on_tick("AAPL", 94.0) == 1
+    await monitor.flush()
+    assert [hit.level for hit in emitted] == [pytest.approx(95.0)]
+
+    # A broker sync or reload watches the same position again
+    monitor.watch_positions("user", [position()], LIMITS)
+    assert monitor.on_tick("AAPL", 90.0) == 0
+    # Adding to the position arms a new stop
+    monitor.watch_positions("user", [position(quantity=20.0)], LIMITS)
+    assert monitor.on_tick("AAPL", 90.0) == 1
+
+
+async def test_rewatching_keeps_a_trailing_peak():
+    monitor, _ = make_monitor()
+    monitor.watch_position(position(), TRAILING)
+    monitor.on_tick("AAPL", 120.0)
+    monitor.watch_position({**position(), "current_price": 120.0}, TRAILING)
+    # 5% under the 120 peak, not under a fresh start
+    assert monitor.on_tick("AAPL", 113.0) == 1
+
+
+async def test_expired_signal_stops_do_not_fire():
+    monitor, emitted = make_monitor()
+    now = datetime.utcnow()
+    monitor.watch_signals([{
+        "id": "signal", "user_id": "user", "asset_id": "AAPL", "created_by": "model", "signal_type": "buy",
+        "stop_loss": 95.0, "price_target": 110.0, "expires_at": now + timedelta(minutes=5), "created_at": now,
+    }])
+    assert monitor.stats()["by_kind"] == {"stop_loss": 1, "price_target": 1}
+    monitor._expire(now + timedelta(minutes=10))
+    assert monitor.expired == 2
+    assert monitor.on_tick("AAPL", 120.0) == 0
+    assert emitted == []
+
+
+async def test_compact_drops_replaced_stops():
+    monitor, _ = make_monitor()
+    for entry in (100.0, 101.0, 102.0):
+        monitor.watch_position(position(entry=entry), LIMITS)
+    assert monitor.stats()["stale"] == 2
+    monitor.compact()
+    stats = monitor.stats()
+    assert stats["stale"] == 0 and stats["active"] == 1
+    ladder = next(iter(monitor._ladders["AAPL"].values()))
+    assert ladder.peaks == [pytest.approx(96.9)]
+
+
+async def test_fired_stops_stay_spent_across_monitors():
+    db = AsyncMongoMockClient()["test"]
+    first, emitted = make_monitor(db)
+    first.watch_position(position(), LIMITS)
+    first.on_tick("AAPL", 94.0)
+    await first.flush()
+    assert len(emitted) == 1
+
+    # A restarted worker, or a new leader, reads back what fired
+    second, _ = make_monitor(db)
+    await second.load()
+    second.watch_position(position(), LIMITS)
+    assert second.on_tick("AAPL", 90.0) == 0
+    assert second.stats()["spent"] == 1
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from pubsub import Hub, MemoryBridge, Subscriber, frame
+
+pytestmark = pytest.mark.anyio
+
+
+def test_frames_render_datetimes_as_iso():
+    text = frame("bar", {"timestamp": datetime(2024, 3, 14, 12, 30), "close": 1.5})
+    assert json.loads(text) == {"type": "bar", "data": {"timestamp": "2024-03-14T12:30:00", "close": 1.5}}
+
+
+async def test_keyed_frames_coalesce_and_unkeyed_ones_queue():
+    subscriber = Subscriber()
+    subscriber.put("bar 1", key="bars:AAPL")
+    subscriber.put("alert", key=None)
+    subscriber.put("bar 2", key="bars:AAPL")
+    subscriber.put("alert", key=None)
+    # The newer bar takes the end of the queue, behind the first alert
+    assert await subscriber.get() == ["alert", "bar 2", "alert"]
+    assert (subscriber.coalesced, subscriber.delivered) == (1, 3)
+
+
+async def test_overflow_drops_the_oldest_frames():
+    subscriber = Subscriber(maxsize=2)
+    for index in range(4):
+        subscriber.put(f"frame {index}")
+    assert subscriber.overflowed and subscriber.dropped == 2
+    assert await subscriber.get() == ["frame 2", "frame 3"]
+
+
+async def test_get_waits_for_a_frame():
+    subscriber = Subscriber()
+    waiting = asyncio.create_task(subscriber.get())
+    await asyncio.sleep(0)
+    assert not waiting.done()
+    subscriber.put("frame")
+    assert await waiting == ["frame"]
+
+
+def test_each_message_is_encoded_once_for_every_subscriber():
+    hub = Hub()
+    first, second, elsewhere = Subscriber(), Subscriber(), Subscriber()
+    hub.subscribe("alerts:alice", first)
+    hub.subscribe("alerts:alice", second)
+    hub.subscribe("alerts:bob", elsewhere)
+    hub.publish("alerts:alice", "alert", {"id": "a"})
+    assert first._pending[1] is second._pending[1]
+    assert not elsewhere._pending
+    hub.unsubscribe("alerts:alice", first)
+    hub.unsubscribe("alerts:alice", second)
+    assert hub.stats()["topics"] == 1
+
+
+async def test_bridged_messages_reach_other_workers_once():
+    network = []
+    local, remote = Hub(MemoryBridge(network)), Hub(MemoryBridge(network))
+    await local.start()
+    await remote.start()
+    here, there = Subscriber(), Subscriber()
+    local.subscribe("alerts:alice", here)
+    remote.subscribe("alerts:alice", there)
+
+    local.publish("alerts:alice", "alert", {"id": "a"})
+    local.publish("bars:AAPL:1m", "bar", {"close": 1.0}, key="bars:AAPL:1m", bridge=False)
+    await asyncio.sleep(0)
+    # The echo of its own message is not delivered to the publisher's subscribers again
+    assert len(here._pending) == 1 and len(there._pending) == 1
+    assert (local.bridged_in, remote.bridged_in) == (0, 1)
+    await local.stop()
+    await remote.stop()
+    assert network == []
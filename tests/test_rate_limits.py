@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+from rate_limits import MemoryTokenStore, RateLimited, RateLimiter, RedisTokenStore
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_within_budget_is_granted_at_once():
+    limiter = RateLimiter(limits={"alpaca": (10, 60.0)})
+    started = time.monotonic()
+    await asyncio.gather(*[limiter.acquire("alpaca", "key") for _ in range(10)])
+    assert time.monotonic() - started < 0.5
+    assert limiter.stats()["lanes"]["refresh"]["granted"] == 10
+
+
+async def test_waiters_are_served_in_lane_order():
+    # One token, refilled every 50ms
+    limiter = RateLimiter(limits={"alpaca": (1, 0.05)}, max_poll=0.01)
+    await limiter.acquire("alpaca", "key")
+    served = []
+
+    async def call(lane):
+        await limiter.acquire("alpaca", "key", lane=lane)
+        served.append(lane)
+
+    # Queued oldest first, but orders jump ahead of account reads and refreshes
+    calls = [asyncio.create_task(call(lane)) for lane in ("refresh", "refresh", "account", "order")]
+    await asyncio.gather(*calls)
+    assert served == ["order", "account", "refresh", "refresh"]
+    assert limiter.stats()["lanes"]["order"]["max_wait_ms"] > 0
+
+
+async def test_keys_have_separate_budgets():
+    limiter = RateLimiter(limits={"alpaca": (1, 60.0)})
+    await limiter.acquire("alpaca", "first")
+    await asyncio.wait_for(limiter.acquire("alpaca", "second"), timeout=0.5)
+    with pytest.raises(RateLimited):
+        await limiter.acquire("alpaca", "first", timeout=0.1)
+
+
+async def test_caller_gives_up_after_its_timeout():
+    limiter = RateLimiter(limits={"alpaca": (1, 60.0)}, max_poll=0.01)
+    await limiter.acquire("alpaca", "key")
+    started = time.monotonic()
+    with pytest.raises(RateLimited) as raised:
+        await limiter.acquire("alpaca", "key", lane="order", timeout=0.2)
+    # Rejected as soon as the budget is known to free up too late, not after the timeout
+    assert time.monotonic() - started < 0.2
+    assert raised.value.retry_after > 50
+    stats = limiter.stats()["lanes"]["order"]
+    assert stats["rejected"] == 1 and stats["queued"] == 0
+
+
+async def test_full_queue_rejects_at_once():
+    limiter = RateLimiter(limits={"alpaca": (1, 60.0)}, max_queue=2)
+    await limiter.acquire("alpaca", "key")
+    waiting = [asyncio.create_task(limiter.acquire("alpaca", "key")) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    with pytest.raises(RateLimited):
+        await limiter.acquire("alpaca", "key")
+    await limiter.stop()
+    for task in waiting:
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+async def test_pause_holds_back_every_lane():
+    limiter = RateLimiter(limits={"alpaca": (100, 60.0)})
+    await limiter.pause("alpaca", "key", 60)
+    with pytest.raises(RateLimited):
+        await limiter.acquire("alpaca", "key", lane="order", timeout=0.1)
+
+
+async def test_broker_headers_cap_the_budget():
+    limiter = RateLimiter(limits={"alpaca": (100, 60.0)})
+    await limiter.observe("alpaca", "key", remaining=0, reset_in=30)
+    with pytest.raises(RateLimited):
+        await limiter.acquire("alpaca", "key", timeout=0.1)
+
+
+async def test_limiters_sharing_a_store_share_the_budget():
+    # As two workers sharing one Redis
+    store = MemoryTokenStore()
+    first, second = RateLimiter(store, limits={"alpaca": (2, 60.0)}), RateLimiter(store, limits={"alpaca": (2, 60.0)})
+    await first.acquire("alpaca", "key")
+    await second.acquire("alpaca", "key")
+    with pytest.raises(RateLimited):
+        await first.acquire("alpaca", "key", timeout=0.1)
+
+
+async def test_unreachable_redis_falls_back_to_local_buckets():
+    store = RedisTokenStore("redis://127.0.0.1:1/0")
+    limiter = RateLimiter(store, limits={"alpaca": (1, 60.0)})
+    await limiter.start()
+    try:
+        await limiter.acquire("alpaca", "key")
+        with pytest.raises(RateLimited):
+            await limiter.acquire("alpaca", "key", timeout=0.1)
+        assert store.stats()["errors"] >= 2
+    finally:
+        await limiter.stop()
@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from signal_scheduler import SignalScheduler, Strategy, frequency_seconds
+
+pytestmark = pytest.mark.anyio
+
+MODEL = {"id": "model", "name": "Momentum", "model_type": "momentum", "enabled": True, "config": {"update_frequency": 60}}
+WATCHING = {"AAPL": ["alice", "bob"], "MSFT": ["alice"]}
+
+
+def make_scheduler(db=None, prepare=None):
+    published = []
+
+    async def watchers():
+        return WATCHING
+
+    async def publish(model, symbols, results, watching):
+        published.append((symbols, results, watching))
+        return sum(len(watching[symbol]) for symbol in symbols)
+
+    async def inputs(model, symbols):
+        return list(reversed(symbols))
+
+    scheduler = SignalScheduler(db or AsyncMongoMockClient()["test"], watchers, publish)
+    scheduler.register("momentum", Strategy(prepare or inputs, "builtins:sorted"))
+    return scheduler, published
+
+
+def test_frequencies_accept_names_and_seconds():
+    assert frequency_seconds({"config": {"update_frequency": "15min"}}) == 900
+    assert frequency_seconds({"config": {"update_frequency": 90}}) == 90
+    assert frequency_seconds({"config": {"update_frequency": "fortnightly"}}) == 3600
+
+
+async def test_each_symbol_is_computed_once_for_all_watchers():
+    scheduler, published = make_scheduler()
+    assert await scheduler.lease.acquire()
+    assert await scheduler.run(MODEL) == 3
+    assert published == [(["AAPL", "MSFT"], ["AAPL", "MSFT"], WATCHING)]
+    run = scheduler.stats()["models"]["model"]
+    assert (run["runs"], run["symbols"], run["signals"]) == (1, 2, 3)
+
+
+async def test_slow_run_skips_its_missed_slots():
+    release = asyncio.Event()
+
+    async def slow(model, symbols):
+        await release.wait()
+        return symbols
+
+    db = AsyncMongoMockClient()["test"]
+    await db.ai_models.insert_one(dict(MODEL))
+    scheduler, published = make_scheduler(db, prepare=slow)
+    await scheduler.schedule_due(now=0.0)
+    await scheduler.schedule_due(now=30.0)
+    await scheduler.schedule_due(now=61.0)
+    await scheduler.schedule_due(now=125.0)
+    # One run in flight, two slots skipped rather than queued behind it
+    assert len(scheduler._running) == 1
+    assert scheduler.stats()["models"]["model"]["overruns"] == 2
+
+    release.set()
+    await asyncio.gather(*scheduler._running.values())
+    assert len(published) == 1 and scheduler._running == {}
+
+
+def test_overrun_delays_the_next_run_by_a_full_period():
+    scheduler, _ = make_scheduler()
+    scheduler._last_run["model"] = (0.0, 10.0)
+    assert scheduler.next_run("model", 60.0) == 60.0
+    scheduler._last_run["model"] = (0.0, 90.0)
+    assert scheduler.next_run("model", 60.0) == 150.0
+
+
+async def test_only_the_lease_holder_schedules():
+    db = AsyncMongoMockClient()["test"]
+    leader, _ = make_scheduler(db)
+    follower, _ = make_scheduler(db)
+    assert await leader.lease.acquire()
+    assert not await follower.lease.acquire()
+    await leader.stop()
+    assert await follower.lease.acquire()
+
+
+async def test_results_are_dropped_when_the_lease_is_lost_mid_run():
+    db = AsyncMongoMockClient()["test"]
+
+    async def taken_over(model, symbols):
+        # Another worker takes the lease while this one computes
+        await db.locks.update_one({"_id": "signal_scheduler"}, {"$set": {"owner": "other"}})
+        return symbols
+
+    scheduler, published = make_scheduler(db, prepare=taken_over)
+    assert await scheduler.lease.acquire()
+    assert await scheduler.run(MODEL) == 0
+    assert published == []
+    assert scheduler.stats()["models"]["model"]["dropped"] == 1
+    assert not scheduler.lease.held
+
+
+async def test_failed_run_is_recorded_and_rescheduled():
+    async def broken(model, symbols):
+        raise ConnectionError("bars unavailable")
+
+    scheduler, _ = make_scheduler(prepare=broken)
+    assert await scheduler.run(MODEL) == 0
+    run = scheduler.stats()["models"]["model"]
+    assert (run["failures"], run["last_error"]) == (1, "bars unavailable")
+    assert "model" in scheduler._last_run